@@ -0,0 +1,61 @@
+# Copyright 2018 (c) Herbert Shin  https://github.com/initbar/sipd
+#
+# This source code is licensed under the MIT license.
+
+"""
+benchmarks.bench_codec
+------------------
+
+Report seconds of G.711 audio decoded per CPU second by each decoder backend,
+over 20ms (160 octet) packets decoded in batches of `--batch` packets:
+
+    $ python -m benchmarks.bench_codec [--seconds n] [--batch n]
+"""
+
+from argparse import ArgumentParser
+
+import os
+import time
+
+from sipd.rtp import codec
+
+
+def decode_per_sample(payload, payload_type):
+    """ decode one octet at a time (baseline).
+    """
+    samples = codec.TABLES[payload_type].samples
+    return b"".join((samples[octet] & 0xffff).to_bytes(2, "little") for octet in payload)
+
+
+def measure(decode, packets, batch, payload_type) -> float:
+    """ return seconds of audio decoded per CPU second.
+    """
+    start = time.process_time()
+    for i in range(0, len(packets), batch):
+        decode(b"".join(packets[i:i + batch]), payload_type)
+    elapsed = time.process_time() - start
+    return (len(packets) * 160 / codec.SAMPLE_RATE) / elapsed
+
+
+def main():
+    arguments = ArgumentParser()
+    arguments.add_argument("--seconds", metavar="n", type=int, default=600)
+    arguments.add_argument("--batch", metavar="n", type=int, default=50)
+    options = arguments.parse_args()
+
+    packets = [os.urandom(160) for _ in range(options.seconds * 50)]  # 20ms packets.
+    table = codec.DecodeTable(codec.decode_ulaw_sample)
+    table.array = None
+    backends = [
+        ("per-sample", decode_per_sample),
+        ("translate", lambda payload, _: table.decode(payload)),
+    ]
+    if codec.numpy is not None:
+        backends.append(("numpy", codec.decode))
+    for (name, decode) in backends:
+        rate = measure(decode, packets, options.batch, codec.PCMU)
+        print("%-10s %12.0f audio seconds/CPU second" % (name, rate))
+
+
+if __name__ == "__main__":
+    main()
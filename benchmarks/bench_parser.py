@@ -0,0 +1,73 @@
+# Copyright 2018 (c) Herbert Shin  https://github.com/initbar/sipd
+#
+# This source code is licensed under the MIT license.
+
+"""
+benchmarks.bench_parser
+------------------
+
+Report SIP messages/sec of each parser backend against the sample payloads
+in `sipd/lib/sip/*.py`:
+
+    $ python -m benchmarks.bench_parser [--rounds n]
+"""
+
+from argparse import ArgumentParser
+from importlib import import_module
+from pkgutil import iter_modules
+
+import time
+
+import sipd.lib.sip
+from sipd.lib.sip.ok import SIP_OK
+from sipd.sip import parser
+
+try:
+    from sipd._cython import parser as cparser
+except ImportError:
+    cparser = None
+
+
+def load_samples() -> list:
+    """ collect every non-empty `*_SAMPLE` payload in `sipd.lib.sip`.
+    """
+    samples = []
+    for module_info in iter_modules(sipd.lib.sip.__path__):
+        module = import_module("sipd.lib.sip." + module_info.name)
+        for name in sorted(dir(module)):
+            sample = getattr(module, name)
+            if name.endswith("_SAMPLE") and sample.strip():
+                samples.append(sample.replace("\n", "\r\n"))
+    return samples
+
+
+def measure(function, samples, rounds) -> float:
+    """ return messages/sec of `function` called over every sample.
+    """
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for sample in samples:
+            function(sample)
+    return (rounds * len(samples)) / (time.perf_counter() - start)
+
+
+def main():
+    arguments = ArgumentParser()
+    arguments.add_argument("--rounds", metavar="n", type=int, default=20000)
+    rounds = arguments.parse_args().rounds
+
+    samples = load_samples()
+    # bypass lru_cache so that every call parses the message.
+    backends = [("python", parser.py_parse_sip_message.__wrapped__, parser.py_convert_to_sip_message)]
+    if cparser is not None:
+        backends.append(("cython", cparser.parse_sip_message.__wrapped__, cparser.convert_to_sip_message))
+
+    datagrams = list(filter(None, map(parser.py_parse_sip_message, samples)))
+    for (name, parse, convert) in backends:
+        parse_rate = measure(parse, samples, rounds)
+        convert_rate = measure(lambda d: convert(SIP_OK, d), datagrams, rounds)
+        print("%-8s parse: %12.0f msg/s  convert: %12.0f msg/s" % (name, parse_rate, convert_rate))
+
+
+if __name__ == "__main__":
+    main()
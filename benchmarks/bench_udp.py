@@ -0,0 +1,67 @@
+# Copyright 2018 (c) Herbert Shin  https://github.com/initbar/sipd
+#
+# This source code is licensed under the MIT license.
+
+"""
+benchmarks.bench_udp
+------------------
+
+Report syscalls per message of batched (recvmmsg/sendmmsg) and per-packet
+UDP receive/send over loopback:
+
+    $ python -m benchmarks.bench_udp [--messages n] [--batch n]
+"""
+
+from argparse import ArgumentParser
+
+import socket
+import time
+
+from sipd.lib.sip.options import SIP_OPTIONS_SAMPLE
+from sipd.net import mmsg
+
+
+def run(batched, messages, batch):
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 24)
+    server.bind(("127.0.0.1", 0))
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.bind(("127.0.0.1", 0))
+    payload = SIP_OPTIONS_SAMPLE.replace("\n", "\r\n").encode()
+
+    sender = mmsg.BatchSender(client, batch=batch)
+    receiver = mmsg.BatchReceiver(server, batch=batch, size=2048)
+    # both are built batched where supported: per-packet mode only turns it off.
+    sender.is_batched = receiver.is_batched = batched and mmsg.is_supported()
+
+    start = time.perf_counter()
+    received = 0
+    for i in range(0, messages, batch):
+        for _ in range(min(batch, messages - i)):
+            sender.sendto(payload, server.getsockname())
+        sender.flush()
+        while received < min(messages, i + batch):
+            received += len(receiver.recv(block=False))
+    elapsed = time.perf_counter() - start
+
+    server.close()
+    client.close()
+    return (sender.syscalls / messages, receiver.syscalls / messages, messages / elapsed)
+
+
+def main():
+    arguments = ArgumentParser()
+    arguments.add_argument("--messages", metavar="n", type=int, default=100000)
+    arguments.add_argument("--batch", metavar="n", type=int, default=64)
+    options = arguments.parse_args()
+
+    modes = [("per-packet", False)]
+    if mmsg.is_supported():
+        modes.append(("batched", True))
+    for (name, batched) in modes:
+        send, recv, rate = run(batched, options.messages, options.batch)
+        print("%-10s send: %.3f syscalls/msg  recv: %.3f syscalls/msg  %10.0f msg/s" % (name, send, recv, rate))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,14 +2,26 @@
 #
 # This source code is licensed under the MIT license.
 
+from setuptools import Extension
 from setuptools import find_packages
 from setuptools import setup
 
 from sipd.version import VERSION
 
+# Cython is optional: without it, sipd falls back to the pure-Python parser.
+try:
+    from Cython.Build import cythonize
+    ext_modules = cythonize(
+        [Extension("sipd._cython.parser", ["sipd/_cython/parser.pyx"])],
+        compiler_directives={"language_level": 3},
+    )
+except ImportError:
+    ext_modules = []
+
 setup(
     name="sipd",
     packages=find_packages(),
+    ext_modules=ext_modules,
     description="active-recording Session Initiation Protocol daemon",
     url="https://github.com/initbar/sipd",
     version=VERSION,
@@ -0,0 +1,135 @@
+# Copyright 2018 (c) Herbert Shin  https://github.com/initbar/sipd
+#
+# This source code is licensed under the MIT license.
+
+# cython: language_level=3, boundscheck=False, wraparound=False
+
+"""
+sipd._cython.parser
+------------------
+
+Compiled counterparts of `sipd.sip.parser`. Every function must return
+exactly what its pure-Python implementation returns.
+"""
+
+from functools import lru_cache
+
+import logging
+
+from ..sip.methods import SIP_METHODS
+
+logger = logging.getLogger()
+
+__all__ = [
+    "convert_to_sip_message",
+    "is_sdp_line",
+    "parse_sip_message",
+]
+
+cdef str COLON = ":"
+cdef str COMMA = ","
+cdef str CRLF = "\r\n"
+
+
+cdef inline bint _is_sdp_line(str line):
+    # equivalent of `re.match("^[a-z]{1}=.+$", line)` for a single line.
+    cdef Py_ssize_t length = len(line)
+    cdef Py_UCS4 c
+    if length < 3 or line[1] != u"=":
+        return False
+    c = line[0]
+    if c < u"a" or c > u"z":
+        return False
+    # `.` does not match a line break, but `$` matches before a final one.
+    if length == 3 and line[2] == u"\n":
+        return False
+    return u"\n" not in line[2:length - 1]
+
+
+def is_sdp_line(str line) -> bool:
+    """ check if a SIP message line is an SDP line (e.g. 'v=0').
+    @line<str> -- SIP message line.
+    """
+    return _is_sdp_line(line)
+
+
+@lru_cache(maxsize=128, typed=True)
+def parse_sip_message(message: str) -> dict:
+    """ convert SIP message into SIP datagram.
+    @message<str> -- SIP message.
+    """
+    if not message:
+        return {}
+
+    cdef list lines = [line for line in message.replace(CRLF, "\n").split("\n") if line]
+    cdef dict headers = {}
+    cdef list values
+    cdef str line, k, v
+    cdef Py_ssize_t i, n = len(lines), colon
+
+    try:
+        method = (SIP_METHODS & set(lines[0].split())).pop()
+    except:
+        return
+    headers["Method"] = [method]
+
+    for i in range(1, n):
+        line = lines[i]
+        if _is_sdp_line(line):
+            continue
+        colon = line.find(COLON)
+        if colon < 0:
+            continue
+        k, v = line[:colon], line[colon + 1:]
+        values = headers.get(k)
+        if values is None:
+            headers[k] = [v.strip()]
+        else:
+            values.append(v.strip())
+
+    return {
+        "sip": {k: COMMA.join(values) for (k, values) in headers.items()},
+        "sdp": [],
+    }
+
+
+def convert_to_sip_message(template, datagram) -> str:
+    """ convert SIP datagram into SIP message.
+    @template<str> -- SIP response template.
+    @datagram<SipMessage|dict> -- SIP message or SIP datagram.
+    """
+    if not template:
+        return CRLF
+
+    if isinstance(datagram, dict):
+        headers, sdp_lines = datagram["sip"], datagram.get("sdp")
+    else:
+        headers, sdp_lines = datagram, datagram.sdp
+
+    cdef list parts = [template["status_line"], CRLF]
+    cdef list fields = []
+    cdef str sdp = None
+    try:
+        for sip_field in template["sip"]:
+            value = headers.get(sip_field)
+            if value:
+                fields.append("%s: %s" % (sip_field, value))
+    except TypeError:
+        logger.error("failed to parse using %s", datagram)
+        return CRLF
+    parts.append(CRLF.join(fields))
+
+    if template.get("sdp"):
+        sdp = CRLF.join(sdp_lines)
+        parts.append(CRLF + "Content-Type: application/sdp")
+        parts.append(CRLF + "Content-Length: " + str(len(sdp)))
+    else:
+        parts.append(CRLF + "Content-Length: 0")
+    parts.append(CRLF + CRLF)
+
+    if sdp:
+        parts.append(sdp)
+        if not sdp.endswith(CRLF):
+            parts.append(CRLF)
+
+    return "".join(parts)
@@ -13,6 +13,7 @@ from typing import Text
 import logging
 
 from ..sip import AsynchronousUDPServer
+from ..sip import ShardedUDPServer
 from ..version import BRANCH, VERSION
 from ..logging import Logger
 from .config import Config
@@ -35,6 +36,25 @@ class Application(object, metaclass=ABCMeta):
         raise NotImplementedError
 
 
+def _settings(config: Config) -> Dict:
+    """Convert configurations into the settings of the server core."""
+    server: Dict = {
+        k: getattr(config.server, k) for k in iter(config.server.__slots__)
+    }
+    server["worker"] = config.server.workers
+    return {
+        "server": server,
+        "sip": {
+            "version": config.sip.version,
+            "server": {"address": config.server.host},
+            "worker": {"headers": config.sip.headers},
+        },
+        "gc": {k: getattr(config.gc, k) for k in iter(config.gc.__slots__)},
+        "rtp": {k: getattr(config.rtp, k) for k in iter(config.rtp.__slots__)},
+        "db": {k: getattr(config.db, k) for k in iter(config.db.__slots__)},
+    }
+
+
 def _run(self):
     """Run application logic."""
     # -v, --version
@@ -42,8 +62,14 @@ def _run(self):
         print(self.version)
         return
 
-    server = AsynchronousUDPServer()
-    return server
+    # "reuseport": one SO_REUSEPORT socket and process per worker.
+    # "asyncio": a single event loop that never blocks on RTP handlers.
+    settings: Dict = _settings(self.config)
+    if self.config.server.mode == "reuseport":
+        server = ShardedUDPServer(settings=settings)
+    else:
+        server = AsynchronousUDPServer(settings=settings)
+    return server.serve()
 
 
 class Sipd(Application):
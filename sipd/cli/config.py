@@ -9,6 +9,7 @@ from multiprocessing import cpu_count
 from pathlib import Path
 from typing import Dict
 from typing import Generic
+from typing import List
 from typing import Text
 
 import json
@@ -69,6 +70,20 @@ def parse_arguments() -> Dict:
     return vars(args)
 
 
+def merge(defaults: Dict, values: Dict) -> Dict:
+    """Merge configuration values over their defaults, key by key.
+
+    Nested dictionaries are merged too, so a partial section in the
+    configuration file only overrides the keys that it sets.
+    """
+    merged: Dict = dict(defaults)
+    for k, v in iter(values.items()):
+        if isinstance(v, dict) and isinstance(merged.get(k), dict):
+            v = merge(merged[k], v)
+        merged[k] = v
+    return merged
+
+
 class ConfigEntry(object):
     """Configuration entry."""
 
@@ -117,6 +132,9 @@ class Config(ConfigEntry):
         self.server = Server(self)
         self.sip = Sip(self)
         self.sdp = Sdp(self)
+        self.gc = Gc(self)
+        self.rtp = Rtp(self)
+        self.db = Db(self)
 
 
 class Logging(ConfigEntry):
@@ -140,12 +158,16 @@ class Logging(ConfigEntry):
 class Server(ConfigEntry):
     """SIP server configuration entries."""
 
-    __slots__ = ("host", "port", "workers")
+    __slots__ = ("batch", "host", "mode", "port", "reuseport_policy", "routing", "workers")
 
     def __init__(self, cls):
         server = cls._file.get("server", {})
         self.host: Text = server.get("host", "127.0.0.1")
+        self.mode: Text = server.get("mode", "asyncio")  # or "reuseport".
         self.port: Text = server.get("port", 5060)
+        self.reuseport_policy: Text = server.get("reuseport_policy", None)  # or "cpu".
+        self.batch: int = server.get("batch", 64)  # datagrams per recvmmsg/sendmmsg.
+        self.routing: Text = server.get("routing", "affinity")  # or "kernel".
         self.workers: Text = server.get("workers", 1)
 
 
@@ -168,3 +190,126 @@ class Sdp(ConfigEntry):
     def __init__(self, cls):
         sdp = cls._file.get("sdp", {})
         self.headers: Dict = sdp.get("headers", {})
+
+
+class Gc(ConfigEntry):
+    """Garbage collector configuration entries."""
+
+    __slots__ = ("call_lifetime", "max_calls", "metrics_interval", "session_lifetime", "timer_resolution")
+
+    def __init__(self, cls):
+        gc = cls._file.get("gc", {})
+        self.call_lifetime: float = gc.get("call_lifetime", 1800)  # seconds.
+        self.max_calls: int = gc.get("max_calls", (0xffff - 6000) // 2)
+        self.metrics_interval: float = gc.get("metrics_interval", 60.0)  # seconds.
+        self.session_lifetime: float = gc.get("session_lifetime", self.call_lifetime)
+        self.timer_resolution: float = gc.get("timer_resolution", 0.1)  # seconds.
+
+
+class Rtp(ConfigEntry):
+    """RTP handler configuration entries."""
+
+    __slots__ = (
+        "balancer",
+        "cooldown",
+        "failure_threshold",
+        "handlers",
+        "hedge",
+        "max_retry",
+        "pool",
+        "recorder",
+        "stop_batch",
+        "timeout",
+        "vad",
+    )
+
+    def __init__(self, cls):
+        rtp = cls._file.get("rtp", {})
+        self.balancer: Text = rtp.get("balancer", "round-robin")
+        self.cooldown: float = rtp.get("cooldown", 5.0)  # seconds.
+        self.failure_threshold: int = rtp.get("failure_threshold", 3)
+        self.handlers: List = rtp.get("handlers", [])
+        self.hedge: Dict = merge(
+            {
+                "enabled": False,
+                "min_delay": 0.005,  # seconds.
+                "min_samples": 16,
+                "percentile": 95,
+            },
+            rtp.get("hedge", {}),
+        )
+        self.max_retry: int = rtp.get("max_retry", 1)
+        self.pool: Dict = merge(
+            {
+                "enabled": False,
+                "lifetime": 60.0,  # seconds.
+                "low_water": 4,
+                "size": 16,
+            },
+            rtp.get("pool", {}),
+        )
+        self.recorder: Dict = merge(
+            {
+                "enabled": False,
+                "address": None,  # advertised in SDP (default: SIP server address).
+                "compress": {
+                    "enabled": False,
+                    "max_queue": 256,  # recordings waiting for a worker.
+                    "method": "adpcm",  # or "gzip".
+                    "workers": 1,  # processes.
+                },
+                "directory": os.path.join(os.path.curdir, "recordings"),
+                "format": "wav",  # "raw" payloads, "wav" per leg, or "stereo".
+                "host": "0.0.0.0",
+                "jitter": 16,  # packets.
+                "ports": [20000, 30000],
+            },
+            rtp.get("recorder", {}),
+        )
+        self.stop_batch: Dict = merge({"enabled": True, "mtu": 1400}, rtp.get("stop_batch", {}))
+        self.timeout: float = rtp.get("timeout", 1.0)  # seconds.
+        self.vad: Dict = merge(
+            {
+                "enabled": False,
+                "min_silence": 1.0,  # seconds.
+                "mode": "mark",  # or "drop" silent runs from recordings.
+                "threshold": -50.0,  # dBFS.
+            },
+            rtp.get("vad", {}),
+        )
+
+
+class Db(ConfigEntry):
+    """Database interface (call metadata export) configuration entries."""
+
+    __slots__ = (
+        "backoff",
+        "batch",
+        "connections",
+        "enabled",
+        "flush_interval",
+        "host",
+        "max_bytes",
+        "max_held",
+        "max_queue",
+        "password",
+        "port",
+        "timeout",
+        "username",
+    )
+
+    def __init__(self, cls):
+        db = cls._file.get("db", {})
+        self.enabled: bool = db.get("enabled", False)
+        self.host: Text = db.get("host", "127.0.0.1")
+        self.port: int = db.get("port", 3306)
+        self.username: Text = db.get("username", "")
+        self.password: Text = db.get("password", "")
+        self.batch: int = db.get("batch", 100)  # records per frame.
+        self.connections: int = db.get("connections", 2)  # persistent connections.
+        self.flush_interval: float = db.get("flush_interval", 0.5)  # seconds.
+        self.max_bytes: int = db.get("max_bytes", 65536)  # per frame.
+        self.max_held: int = db.get("max_held", 1000)  # failed records held per connection.
+        self.backoff: float = db.get("backoff", 1.0)  # seconds between reconnects.
+        self.max_queue: int = db.get("max_queue", 10000)  # records.
+        self.timeout: float = db.get("timeout", 1.0)  # seconds.
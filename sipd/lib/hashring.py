@@ -0,0 +1,83 @@
+# Copyright 2018 (c) Herbert Shin  https://github.com/initbar/sipd
+#
+# This source code is licensed under the MIT license.
+
+from bisect import bisect
+from hashlib import blake2b
+
+
+def stable_hash(key) -> int:
+    """ 64-bit hash that is identical across processes (unlike `hash`). """
+    if isinstance(key, str):
+        key = key.encode()
+    return int.from_bytes(blake2b(key, digest_size=8).digest(), "big")
+
+
+class ConsistentHashRing(object):
+    """ consistent hash ring with virtual nodes.
+
+    Each node is placed on the ring `replicas` times so that keys spread
+    evenly, and adding or removing a node only remaps about 1/n of the keys.
+    """
+
+    def __init__(self, nodes=(), replicas=128, name=str):
+        """
+        @nodes<iterable> -- ring nodes.
+        @replicas<int> -- virtual nodes per node.
+        @name<callable> -- stable node name (hashed onto the ring).
+        """
+        self.replicas = replicas
+        self.name = name
+        self.nodes = []
+        self._points = []  # sorted virtual node hashes.
+        self._owners = []  # node of each virtual node hash.
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def _rebuild(self):
+        ring = sorted(
+            ((stable_hash("%s#%s" % (self.name(node), i)), node)
+             for node in self.nodes
+             for i in range(self.replicas)),
+            key=lambda point: point[0],
+        )
+        self._points = [point for (point, _) in ring]
+        self._owners = [node for (_, node) in ring]
+
+    def add(self, node):
+        self.nodes.append(node)
+        self._rebuild()
+
+    def remove(self, node):
+        self.nodes.remove(node)
+        self._rebuild()
+
+    def get(self, key):
+        """ return the node that owns a key.
+        @key<str|bytes> -- key (e.g. Call-ID).
+        """
+        if not self._points:
+            return
+        index = bisect(self._points, stable_hash(key)) % len(self._points)
+        return self._owners[index]
+
+    def iterate(self, key):
+        """ yield every node in ring order starting at the owner of a key.
+        @key<str|bytes> -- key (e.g. Call-ID).
+
+        Nodes after the owner are the key's failover order.
+        """
+        if not self._points:
+            return
+        start = bisect(self._points, stable_hash(key))
+        seen = set()
+        for i in range(len(self._points)):
+            node = self._owners[(start + i) % len(self._points)]
+            if id(node) not in seen:
+                seen.add(id(node))
+                yield node
+                if len(seen) == len(self.nodes):
+                    return
@@ -22,17 +22,17 @@
 #
 # https://github.com/initbar/sipd
 
-__all__ = ["SIP_RINGING"]
+__all__ = ["SIP_FORBIDDEN"]
 
 # 21.4.4 403 Forbidden
 #
 # The server understood the request, but is refusing to fulfill it.
 # Authorization will not help, and the request SHOULD NOT be repeated.
-SIP_RINGING = {
+SIP_FORBIDDEN = {
     "status_line": "SIP/%(sip_version)s 403 Forbidden",
     "sip": ["Contact"],
 }
 
-SIP_RINGING_SAMPLE = """\
+SIP_FORBIDDEN_SAMPLE = """\
 SIP/2.0 403 Forbidden
 """
@@ -0,0 +1,316 @@
+# Copyright 2018 (c) Herbert Shin  https://github.com/initbar/sipd
+#
+# This source code is licensed under the MIT license.
+
+"""
+sipd.net.export
+------------------
+"""
+
+from __future__ import absolute_import
+
+import json
+import logging
+import select
+import socket
+import struct
+import threading
+import time
+
+try:
+    from Queue import Empty, Full, Queue
+except ImportError:
+    from queue import Empty, Full, Queue
+
+logger = logging.getLogger()
+
+__all__ = ["ExportConnection", "MetadataExporter", "pack_frame"]
+
+# every frame is a 4-byte big-endian length followed by NDJSON records.
+FRAME_HEADER = struct.Struct("!I")
+
+# sentinel that stops a sender thread.
+STOP = object()
+
+
+def dump_record(record):
+    """ return a record as one NDJSON line.
+    @record<dict> -- JSON-serializable record.
+    """
+    return json.dumps(record, separators=(",", ":"), default=str).encode("utf-8") + b"\n"
+
+
+def pack_frame(lines):
+    """ return a length-prefixed frame of NDJSON lines.
+    @lines<list> -- NDJSON lines.
+    """
+    body = b"".join(lines)
+    return FRAME_HEADER.pack(len(body)) + body
+
+
+class ExportConnection(object):
+    """ persistent TCP connection to the export endpoint.
+
+    The connection is opened on the first send and kept open. After a
+    failure, it is reopened on the next send, but not sooner than `backoff`
+    seconds later.
+    """
+
+    def __init__(self, endpoint, timeout=1.0, backoff=1.0, handshake=None, clock=time.monotonic):
+        """
+        @endpoint<tuple> -- (host, port).
+        @timeout<float> -- connect and send timeout in seconds.
+        @backoff<float> -- seconds between reconnects.
+        @handshake<dict> -- record sent first on every new connection.
+        @clock<callable> -- monotonic time source.
+        """
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.backoff = backoff
+        self.handshake = handshake
+        self.clock = clock
+        self.socket = None
+        self.retry_at = 0.0
+        self.connects = 0  # only increment.
+
+    def __repr__(self):
+        return "ExportConnection(endpoint=%s, connected=%s)" % (self.endpoint, self.is_connected)
+
+    @property
+    def is_connected(self):
+        return self.socket is not None
+
+    def connect(self):
+        if self.clock() < self.retry_at:
+            raise ConnectionError("waiting to reconnect to %s:%s." % self.endpoint)
+        try:
+            self.socket = socket.create_connection(self.endpoint, timeout=self.timeout)
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            if self.handshake:
+                self.socket.sendall(pack_frame([dump_record(self.handshake)]))
+        except OSError:
+            self.close()
+            raise
+        self.connects += 1
+        logger.debug("<net>: connected to %s:%s", *self.endpoint)
+
+    def is_stale(self):
+        """ return whether the endpoint closed the kept connection.
+
+        Writing to a closed connection usually succeeds once before failing,
+        which would silently lose that frame: peek at the socket instead.
+        """
+        try:
+            (readable, _, _) = select.select([self.socket], [], [], 0)
+            return bool(readable) and self.socket.recv(1, socket.MSG_PEEK) == b""
+        except OSError:
+            return True
+
+    def send(self, frame):
+        """ send a frame; raise `OSError` on failure.
+        @frame<bytes> -- length-prefixed frame.
+        """
+        if self.socket is not None and self.is_stale():
+            logger.debug("<net>: connection to %s:%s was closed by the endpoint.", *self.endpoint)
+            self.close(failed=False)
+        if self.socket is None:
+            self.connect()
+        try:
+            self.socket.sendall(frame)
+        except OSError:
+            self.close()
+            raise
+
+    def close(self, failed=True):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+        if failed:
+            self.retry_at = self.clock() + self.backoff
+
+
+class ExportMetrics(object):
+    """ export statistics.
+    """
+
+    __slots__ = ("submitted", "dropped", "sent", "failed", "retried", "frames")
+
+    def __init__(self):
+        self.submitted = self.dropped = self.sent = self.failed = self.retried = self.frames = 0  # only increment.
+
+    def __repr__(self):
+        return "ExportMetrics(submitted=%s, dropped=%s, sent=%s, failed=%s, retried=%s, frames=%s)" % (
+            self.submitted,
+            self.dropped,
+            self.sent,
+            self.failed,
+            self.retried,
+            self.frames,
+        )
+
+
+class MetadataExporter(object):
+    """ batched call metadata export.
+
+    Records are queued by the workers and sent by a small pool of sender
+    threads, each owning one persistent connection. A sender waits for a
+    record, then keeps collecting records until `batch` records or
+    `max_bytes` are collected or `interval` seconds pass, and sends them as
+    one frame. The workers never wait: when the queue is full, records are
+    dropped and counted.
+
+    A batch that fails to send is held by its sender and sent again with the
+    next batch, once the connection's backoff is over. Up to `max_held`
+    records are held per sender; older records are given up on first, and
+    so are the held records left when the exporter is closed.
+    """
+
+    def __init__(self, settings=None, clock=time.monotonic):
+        """
+        @settings<dict> -- `db` settings.
+        @clock<callable> -- monotonic time source.
+        """
+        settings = settings or {}
+        self.endpoint = (settings.get("host", "127.0.0.1"), int(settings.get("port", 3306)))
+        self.batch = int(settings.get("batch", 100))
+        self.max_bytes = int(settings.get("max_bytes", 1 << 16))
+        self.interval = float(settings.get("flush_interval", 0.5))
+        self.max_held = int(settings.get("max_held", 1000))
+        self.clock = clock
+        handshake = None
+        if settings.get("username"):
+            handshake = {"user": settings["username"], "pass": settings.get("password", "")}
+        self.connections = [
+            ExportConnection(
+                self.endpoint,
+                timeout=float(settings.get("timeout", 1.0)),
+                backoff=float(settings.get("backoff", 1.0)),
+                handshake=handshake,
+                clock=clock,
+            )
+            for _ in range(max(1, int(settings.get("connections", 2))))
+        ]
+        self.queue = Queue(maxsize=int(settings.get("max_queue", 10000)))
+        self.metrics = ExportMetrics()
+        self.lock = threading.Lock()  # metrics are shared by every thread.
+        self.threads = []
+
+    def __repr__(self):
+        return "MetadataExporter(endpoint=%s, connections=%s, queued=%s, metrics=%s)" % (
+            self.endpoint,
+            len(self.connections),
+            self.queue.qsize(),
+            self.metrics,
+        )
+
+    def start(self):
+        for (i, connection) in enumerate(self.connections):
+            thread = threading.Thread(name="exporter-%s" % i, target=self.run, args=(connection,))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def submit(self, record):
+        """ queue a record without waiting; return whether it was queued.
+        @record<dict> -- JSON-serializable record.
+        """
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            with self.lock:
+                self.metrics.dropped += 1
+            logger.debug("<net>: export queue is full: dropped %s", record)
+            return False
+        with self.lock:
+            self.metrics.submitted += 1
+        return True
+
+    def collect(self, timeout=None):
+        """ return the next batch of NDJSON lines and whether to stop.
+        @timeout<float> -- seconds to wait for the first record (default: forever).
+        """
+        try:
+            record = self.queue.get(timeout=timeout)
+        except Empty:
+            return ([], False)
+        if record is STOP:
+            return ([], True)
+        lines = [dump_record(record)]
+        size = len(lines[0])
+        deadline = self.clock() + self.interval
+        while len(lines) < self.batch and size < self.max_bytes:
+            remaining = deadline - self.clock()
+            if remaining <= 0:
+                break
+            try:
+                record = self.queue.get(timeout=remaining)
+            except Empty:
+                break
+            if record is STOP:
+                return (lines, True)
+            lines.append(dump_record(record))
+            size += len(lines[-1])
+        return (lines, False)
+
+    def run(self, connection):
+        """ sender thread.
+        @connection<ExportConnection> -- connection owned by the thread.
+        """
+        held = []  # lines of failed batches, oldest first.
+        while True:
+            timeout = None
+            if held:  # send them again once the backoff is over.
+                timeout = max(connection.retry_at - self.clock(), 0.0)
+            (lines, stop) = self.collect(timeout)
+            retried, lines, held = len(held), held + lines, []
+            if lines and self.send(connection, lines):
+                with self.lock:
+                    self.metrics.retried += retried
+            elif lines:
+                held = [] if stop else lines[-self.max_held:]
+                with self.lock:
+                    self.metrics.failed += len(lines) - len(held)
+                if len(held) < len(lines):
+                    logger.warning("<net>: gave up on exporting %s records.", len(lines) - len(held))
+            if stop:
+                connection.close(failed=False)
+                return
+
+    def send(self, connection, lines):
+        """ send a batch, retrying once if a kept connection went stale;
+        return whether it was sent.
+        @connection<ExportConnection> -- export connection.
+        @lines<list> -- NDJSON lines.
+        """
+        frame = pack_frame(lines)
+        was_connected = connection.is_connected
+        try:
+            try:
+                connection.send(frame)
+            except OSError:
+                if not was_connected:
+                    raise
+                connection.retry_at = 0.0  # reconnect right away.
+                connection.send(frame)
+        except OSError as error:
+            logger.error("<net>: failed to export %s records: %s", len(lines), error)
+            return False
+        with self.lock:
+            self.metrics.sent += len(lines)
+            self.metrics.frames += 1
+        return True
+
+    def close(self, timeout=1.0):
+        """ send the queued records and stop the sender threads.
+        @timeout<float> -- seconds to wait on each thread.
+        """
+        for _ in self.threads:
+            try:
+                self.queue.put(STOP, timeout=timeout)
+            except Full:
+                break
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
@@ -6,6 +6,7 @@ from __future__ import absolute_import
 from contextlib import contextmanager
 from functools import lru_cache
 
+import ctypes
 import logging
 import random
 import re
@@ -65,6 +66,13 @@ def unsafe_allocate_udp_socket(
     if is_client:
         return udp_socket
 
+    # reuse the server socket. Options must be set before binding in order
+    # for several sockets to share the same port.
+    if is_reused:
+        udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, True)
+        if hasattr(socket, "SO_REUSEPORT"):
+            udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, True)
+
     # bind the server socket.
     try:
         logger.debug("attempting to bind to udp port: '%s'.", port)
@@ -72,17 +80,66 @@ def unsafe_allocate_udp_socket(
         udp_socket.bind((host, port))
     except socket.error:
         logger.error("failed to bind to udp port: '%s'.", port)
+        udp_socket.close()
         return
 
-    # reuse the server socket.
-    if is_reused:
-        udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, True)
-        udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, True)
-
     logger.info("successfully created udp socket port '%s'.", port)
     return udp_socket
 
 
+#
+# SO_REUSEPORT
+#
+
+
+# linux/asm-generic/socket.h
+SO_ATTACH_REUSEPORT_CBPF = getattr(socket, "SO_ATTACH_REUSEPORT_CBPF", 51)
+
+# linux/filter.h
+BPF_LD_W_ABS = 0x20  # BPF_LD | BPF_W | BPF_ABS
+BPF_ALU_MOD_K = 0x94  # BPF_ALU | BPF_MOD | BPF_K
+BPF_RET_A = 0x16  # BPF_RET | BPF_A
+SKF_AD_CPU = (-0x1000 + 36) & 0xffffffff  # SKF_AD_OFF + SKF_AD_CPU
+
+
+class SockFilter(ctypes.Structure):
+    _fields_ = [
+        ("code", ctypes.c_uint16),
+        ("jt", ctypes.c_uint8),
+        ("jf", ctypes.c_uint8),
+        ("k", ctypes.c_uint32),
+    ]
+
+
+class SockFprog(ctypes.Structure):
+    _fields_ = [
+        ("len", ctypes.c_ushort),
+        ("filter", ctypes.POINTER(SockFilter)),
+    ]
+
+
+def attach_reuseport_cpu_policy(udp_socket: socket, group_size: int) -> bool:
+    """ steer datagrams of a SO_REUSEPORT group to the socket of the receiving CPU.
+    @udp_socket<socket> -- any socket of the SO_REUSEPORT group.
+    @group_size<int> -- number of sockets in the group.
+
+    The classic BPF program returns `cpu % group_size`, which is the index
+    (bind order) of the socket in the group. Only supported on Linux 4.5+.
+    """
+    program = (SockFilter * 3)(
+        SockFilter(BPF_LD_W_ABS, 0, 0, SKF_AD_CPU),  # A = current cpu
+        SockFilter(BPF_ALU_MOD_K, 0, 0, group_size),  # A = A % group_size
+        SockFilter(BPF_RET_A, 0, 0, 0),  # return A
+    )
+    fprog = SockFprog(len(program), program)
+    try:
+        udp_socket.setsockopt(socket.SOL_SOCKET, SO_ATTACH_REUSEPORT_CBPF, bytes(fprog))
+    except (OSError, AttributeError) as error:
+        logger.warning("failed to attach reuseport policy: %s", error)
+        return False
+    return True
+
+
 @contextmanager
 def safe_allocate_udp_socket(*a, **kw) -> socket:
     """ create an UDP socket that automatically closes.
@@ -96,6 +153,7 @@ def safe_allocate_udp_socket(*a, **kw) -> socket:
 
 
 __all__ = [
+    "attach_reuseport_cpu_policy",
     "get_random_privileged_port",
     "get_random_unprivileged_port",
     "parse_ipv4_address",
@@ -0,0 +1,255 @@
+# Copyright 2018 (c) Herbert Shin  https://github.com/initbar/sipd
+#
+# This source code is licensed under the MIT license.
+
+"""
+sipd.net.mmsg
+---------------
+
+Batched UDP receive/send through Linux `recvmmsg(2)`/`sendmmsg(2)`. Where
+the syscalls are missing, both fall back to one `recvfrom`/`sendto` per
+datagram.
+"""
+
+from __future__ import absolute_import
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import socket
+import struct
+
+logger = logging.getLogger()
+
+try:
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    _recvmmsg = libc.recvmmsg
+    _sendmmsg = libc.sendmmsg
+except (AttributeError, OSError, TypeError):
+    _recvmmsg = _sendmmsg = None
+
+# linux/socket.h
+MSG_DONTWAIT = 0x40
+MSG_WAITFORONE = 0x10000
+
+SOCKADDR_SIZE = 16  # sizeof(struct sockaddr_in)
+
+
+class iovec(ctypes.Structure):
+    _fields_ = [
+        ("iov_base", ctypes.c_void_p),
+        ("iov_len", ctypes.c_size_t),
+    ]
+
+
+class msghdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(iovec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class mmsghdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_hdr", msghdr),
+        ("msg_len", ctypes.c_uint),
+    ]
+
+
+if _recvmmsg is not None:
+    _recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(mmsghdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    _recvmmsg.restype = ctypes.c_int
+    _sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(mmsghdr), ctypes.c_uint, ctypes.c_int]
+    _sendmmsg.restype = ctypes.c_int
+
+
+def is_supported() -> bool:
+    """ check if batched syscalls are available. """
+    return _recvmmsg is not None and _sendmmsg is not None
+
+
+def pack_sockaddr_in(endpoint: tuple) -> bytes:
+    """ pack IPv4 endpoint into `struct sockaddr_in`.
+    @endpoint<tuple> -- (host, port).
+    """
+    host, port = endpoint
+    family = struct.pack("=H", socket.AF_INET)  # sa_family_t is host-order.
+    return family + struct.pack("!H4s8x", port, socket.inet_aton(host))
+
+
+def unpack_sockaddr_in(buffer: bytes) -> tuple:
+    """ unpack `struct sockaddr_in` into IPv4 endpoint.
+    @buffer<bytes> -- packed sockaddr_in.
+    """
+    port, address = struct.unpack_from("!H4s", buffer, 2)
+    return (socket.inet_ntoa(address), port)
+
+
+class BatchReceiver(object):
+    """ receive up to `batch` datagrams per syscall into preallocated buffers.
+    """
+
+    def __init__(self, udp_socket, batch=64, size=0xffff):
+        """
+        @udp_socket<socket> -- bound IPv4 UDP socket.
+        @batch<int> -- maximum datagrams per syscall.
+        @size<int> -- maximum datagram size.
+        """
+        self.socket = udp_socket
+        self.batch = batch
+        self.size = size
+        self.syscalls = self.messages = 0  # only increment.
+        self.is_batched = is_supported()
+
+        # one contiguous receive buffer and one sockaddr per message; every
+        # returned datagram is a memoryview into it (valid until next recv).
+        self.buffer = bytearray(batch * size)
+        self.view = memoryview(self.buffer)
+        if not self.is_batched:
+            return
+        self._buffer = (ctypes.c_char * len(self.buffer)).from_buffer(self.buffer)
+        self._names = ctypes.create_string_buffer(batch * SOCKADDR_SIZE)
+        self._iovecs = (iovec * batch)()
+        self._msgs = (mmsghdr * batch)()
+        base = ctypes.addressof(self._buffer)
+        names = ctypes.addressof(self._names)
+        for i in range(batch):
+            self._iovecs[i].iov_base = base + i * size
+            self._iovecs[i].iov_len = size
+            hdr = self._msgs[i].msg_hdr
+            hdr.msg_name = names + i * SOCKADDR_SIZE
+            hdr.msg_iov = ctypes.pointer(self._iovecs[i])
+            hdr.msg_iovlen = 1
+
+    def recv(self, block=True) -> list:
+        """ receive datagrams as a list of (memoryview, endpoint).
+        @block<bool> -- wait for at least one datagram.
+        """
+        if not self.is_batched:
+            return self._recv_fallback(block)
+        for i in range(self.batch):
+            self._msgs[i].msg_hdr.msg_namelen = SOCKADDR_SIZE
+        flags = MSG_WAITFORONE if block else MSG_DONTWAIT
+        count = _recvmmsg(self.socket.fileno(), self._msgs, self.batch, flags, None)
+        self.syscalls += 1
+        if count < 0:
+            error = ctypes.get_errno()
+            if error in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return []
+            raise OSError(error, os.strerror(error))
+        self.messages += count
+        names = self._names.raw
+        return [
+            (
+                self.view[i * self.size:i * self.size + self._msgs[i].msg_len],
+                unpack_sockaddr_in(names[i * SOCKADDR_SIZE:(i + 1) * SOCKADDR_SIZE]),
+            )
+            for i in range(count)
+        ]
+
+    def _recv_fallback(self, block):
+        timeout = self.socket.gettimeout()
+        try:
+            self.socket.settimeout(None if block else 0.0)
+            nbytes, endpoint = self.socket.recvfrom_into(self.view[:self.size])
+        except (BlockingIOError, InterruptedError, socket.timeout):
+            return []
+        finally:
+            self.syscalls += 1
+            self.socket.settimeout(timeout)
+        self.messages += 1
+        return [(self.view[:nbytes], endpoint)]
+
+
+class BatchSender(object):
+    """ queue datagrams and send up to `batch` of them per syscall.
+
+    `sendto` has the same signature as `socket.sendto`, so this can be used
+    in place of a socket by code that only sends. Send errors are logged and
+    counted per datagram instead of raised: one unreachable endpoint must
+    not take the receive loop down.
+    """
+
+    def __init__(self, udp_socket, batch=64):
+        """
+        @udp_socket<socket> -- IPv4 UDP socket.
+        @batch<int> -- maximum datagrams per syscall.
+        """
+        self.socket = udp_socket
+        self.batch = batch
+        self.queue = []
+        self.syscalls = self.messages = self.errors = 0  # only increment.
+        self.is_batched = is_supported()
+
+    def sendto(self, data, endpoint):
+        self.queue.append((bytes(data), tuple(endpoint)))
+        if len(self.queue) >= self.batch:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        """ send every queued datagram.
+        """
+        queue, self.queue = self.queue, []
+        if not queue:
+            return
+        if not self.is_batched:
+            for (data, endpoint) in queue:
+                self.send_one(data, endpoint)
+            self.messages += len(queue)
+            return
+
+        count = len(queue)
+        msgs = (mmsghdr * count)()
+        iovecs = (iovec * count)()
+        keep = []  # keep buffers alive until the syscall returns.
+        for (i, (data, endpoint)) in enumerate(queue):
+            name = ctypes.create_string_buffer(pack_sockaddr_in(endpoint), SOCKADDR_SIZE)
+            data = ctypes.create_string_buffer(data, len(data))
+            keep.append((name, data))
+            iovecs[i].iov_base = ctypes.addressof(data)
+            iovecs[i].iov_len = len(data)
+            hdr = msgs[i].msg_hdr
+            hdr.msg_name = ctypes.addressof(name)
+            hdr.msg_namelen = SOCKADDR_SIZE
+            hdr.msg_iov = ctypes.pointer(iovecs[i])
+            hdr.msg_iovlen = 1
+
+        sent = 0
+        while sent < count:
+            offset = ctypes.addressof(msgs) + sent * ctypes.sizeof(mmsghdr)
+            result = _sendmmsg(self.socket.fileno(), ctypes.cast(offset, ctypes.POINTER(mmsghdr)), count - sent, 0)
+            self.syscalls += 1
+            if result < 0:
+                error = ctypes.get_errno()
+                if error == errno.EINTR:
+                    continue
+                logger.error("<net>: sendmmsg failed: %s", os.strerror(error))
+                # send the rest one by one rather than losing responses.
+                for (data, endpoint) in queue[sent:]:
+                    self.send_one(data, endpoint)
+                break
+            sent += result
+        self.messages += count
+
+    def send_one(self, data, endpoint):
+        """ send a single datagram; log and count a failure.
+        @data<bytes> -- datagram.
+        @endpoint<tuple> -- (host, port).
+        """
+        self.syscalls += 1
+        try:
+            self.socket.sendto(data, endpoint)
+        except OSError as error:
+            self.errors += 1
+            logger.error("<net>: failed to send to %s: %s", endpoint, error)
+
+
+__all__ = ["BatchReceiver", "BatchSender", "is_supported"]
@@ -0,0 +1,113 @@
+# Copyright 2018 (c) Herbert Shin  https://github.com/initbar/sipd
+#
+# This source code is licensed under the MIT license.
+
+"""
+sipd.rtp.batch
+------------------
+"""
+
+from __future__ import absolute_import
+
+import json
+import logging
+import threading
+
+from ..lib.rtp.stop import RTPD_STOP
+from ..lib.rtp.stop import RTPD_STOP_BATCH
+
+logger = logging.getLogger()
+
+__all__ = ["StopSignalBatch", "pack_stop_signals"]
+
+
+def pack_stop_signals(call_ids, mtu=1400):
+    """ pack Call-IDs into as few batch stop datagrams as fit in the MTU.
+    @call_ids<list> -- SIP Call-IDs.
+    @mtu<int> -- maximum datagram size in bytes.
+    """
+    template = dict(RTPD_STOP_BATCH)
+    template["Call-IDs"] = []
+    empty = json.dumps(template, separators=(",", ":")).encode()
+    prefix, suffix = empty[:-2], empty[-2:]  # split at the empty list: b"]}".
+
+    datagrams, batch, size = [], [], len(empty)
+    for call_id in call_ids:
+        item = json.dumps(call_id).encode()
+        if batch and size + len(item) + 1 > mtu:
+            datagrams.append(prefix + b",".join(batch) + suffix)
+            batch, size = [], len(empty)
+        size += len(item) + (1 if batch else 0)
+        batch.append(item)
+    if batch:
+        datagrams.append(prefix + b",".join(batch) + suffix)
+    return datagrams
+
+
+class StopSignalBatch(object):
+    """ stop signals coalesced until the next flush.
+
+    Handlers configured with "batch_stop" receive many Call-IDs per
+    datagram (up to `mtu` bytes). Every other handler keeps receiving one
+    `RTPD_STOP` datagram per call.
+
+    In threaded mode, calls are queued by the worker thread and flushed by
+    the garbage collector thread, so the queue is swapped under a lock.
+    """
+
+    def __init__(self, handlers=(), mtu=1400):
+        """
+        @handlers<list> -- RTP handler configurations.
+        @mtu<int> -- maximum datagram size in bytes.
+        """
+        self.handlers = list(handlers)
+        self.mtu = mtu
+        self.call_ids = {}  # insertion-ordered set.
+        self.flushes = self.datagrams = 0  # only increment.
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.call_ids)
+
+    def add(self, call_id):
+        """ queue a stop signal.
+        @call_id<str> -- SIP Call-ID.
+        """
+        if call_id:
+            with self.lock:
+                self.call_ids[call_id] = None
+
+    def flush(self, sendto):
+        """ send every queued stop signal and return the datagram count.
+        @sendto<callable> -- `socket.sendto`-like function.
+        """
+        with self.lock:
+            call_ids, self.call_ids = list(self.call_ids), {}
+        if not call_ids:
+            return 0
+        batched = pack_stop_signals(call_ids, mtu=self.mtu)
+        single = None  # lazy initialize.
+        count = 0
+        for handler in self.handlers:
+            handler_endpoint = (handler["host"], int(handler["port"]))
+            if handler.get("batch_stop"):
+                datagrams = batched
+            else:
+                if single is None:
+                    single = [
+                        json.dumps(dict(RTPD_STOP, **{"Call-ID": call_id})).encode()
+                        for call_id in call_ids
+                    ]
+                datagrams = single
+            for datagram in datagrams:
+                try:
+                    sendto(datagram, handler_endpoint)
+                except OSError as error:
+                    logger.error("<rtp>: failed to stop calls on %s: %s", handler_endpoint, error)
+                    break
+            count += len(datagrams)
+        with self.lock:
+            self.flushes += 1
+            self.datagrams += count
+        logger.debug("<rtp>: sent %s stop signals in %s datagrams", len(call_ids), count)
+        return count
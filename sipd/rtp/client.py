@@ -0,0 +1,245 @@
+# Copyright 2018 (c) Herbert Shin  https://github.com/initbar/sipd
+#
+# This source code is licensed under the MIT license.
+
+"""
+sipd.rtp.client
+------------------
+"""
+
+from __future__ import absolute_import
+from collections import OrderedDict
+
+import asyncio
+import json
+import logging
+
+from ..net.udp import safe_allocate_udp_client
+
+logger = logging.getLogger()
+
+__all__ = ["RTPControlClient", "RTPControlProtocol", "RTPReplyProtocol"]
+
+# Call-IDs of abandoned (timed out or cancelled) requests kept per client.
+MAX_TOMBSTONES = 1024
+
+
+def parse_reply(data, addr):
+    """ return an RTP handler reply (or None).
+    @data<bytes> -- JSON reply.
+    @addr<tuple> -- RTP handler (address, port).
+    """
+    try:
+        reply = json.loads(data)
+    except ValueError:
+        reply = None
+    if not isinstance(reply, dict):
+        logger.error("<rtp>: invalid reply from %s: %s", addr, data)
+        return
+    return reply
+
+
+class RTPControlProtocol(asyncio.DatagramProtocol):
+    """ RTP handler control protocol.
+
+    Replies are matched to outstanding requests by their "Call-ID" only.
+    Late replies to abandoned requests are dropped by tombstone, so that
+    they never answer a newer request of the same Call-ID.
+    """
+
+    def __init__(self):
+        self.transport = None
+        self.pending = OrderedDict()  # reply futures indexed by Call-ID.
+        self.tombstones = OrderedDict()  # late replies to drop by Call-ID.
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        reply = parse_reply(data, addr)
+        if reply is None:
+            return
+        call_id = reply.get("Call-ID")
+        if call_id in self.tombstones:
+            self.tombstones[call_id] -= 1
+            if not self.tombstones[call_id]:
+                del self.tombstones[call_id]
+            logger.debug("<rtp>: late reply from %s: %s", addr, reply)
+            return
+        future = self.pending.pop(call_id, None)
+        if future is None:
+            logger.debug("<rtp>: unmatched reply from %s: %s", addr, reply)
+            return
+        if not future.done():
+            future.set_result(reply)
+
+    def abandon(self, call_id, future):
+        """ stop waiting on a request and drop its reply if it comes.
+        @call_id<str> -- SIP Call-ID of the request.
+        @future<Future> -- reply future of the request.
+        """
+        if self.pending.get(call_id) is not future:
+            return
+        del self.pending[call_id]
+        self.tombstones[call_id] = self.tombstones.get(call_id, 0) + 1
+        self.tombstones.move_to_end(call_id)
+        while len(self.tombstones) > MAX_TOMBSTONES:
+            self.tombstones.popitem(last=False)
+
+    def error_received(self, error):
+        # ICMP port unreachable: the handler is down, so none of the
+        # outstanding requests will be answered.
+        logger.error("<rtp>: %s", error)
+        self.abort(error)
+
+    def connection_lost(self, error):
+        self.abort(error or ConnectionAbortedError("connection closed"))
+
+    def abort(self, error):
+        """ fail every outstanding request.
+        @error<Exception> -- reason.
+        """
+        pending, self.pending = self.pending, OrderedDict()
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+
+class RTPReplyProtocol(asyncio.DatagramProtocol):
+    """ RTP handler protocol of a single request.
+
+    The socket carries one request, so its first reply is the answer with
+    or without a "Call-ID". Late replies go to a closed socket.
+    """
+
+    def __init__(self):
+        self.reply = asyncio.get_running_loop().create_future()
+
+    def datagram_received(self, data, addr):
+        reply = parse_reply(data, addr)
+        if reply is not None and not self.reply.done():
+            self.reply.set_result(reply)
+
+    def error_received(self, error):
+        logger.error("<rtp>: %s", error)
+        if not self.reply.done():
+            self.reply.set_exception(error)
+
+
+class RTPControlClient(object):
+    """ pipelined RTP handler control client.
+
+    Replies of the default handler format carry no "Call-ID", so they can
+    only be matched by the socket they arrive on: until a handler is seen
+    echoing the "Call-ID" of a request, each request has its own socket.
+    From then on, one long-lived socket per handler carries every request
+    to it, and any number of requests can be outstanding at once. Each
+    request has its own deadline.
+    """
+
+    def __init__(self, endpoint, timeout=1.0):
+        """
+        @endpoint<tuple> -- RTP handler (address, port).
+        @timeout<float> -- default request deadline in seconds.
+        """
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.transport = None
+        self.protocol = None
+        self.requests = self.timeouts = 0  # only increment.
+        self.echoes = False  # whether the handler echoes "Call-ID".
+        self._lock = asyncio.Lock()
+
+    def __repr__(self):
+        return "RTPControlClient(endpoint=%s, pending=%s)" % (self.endpoint, len(self))
+
+    def __len__(self):
+        return len(self.protocol.pending) if self.protocol else 0
+
+    @property
+    def is_connected(self):
+        return self.transport is not None and not self.transport.is_closing()
+
+    async def connect(self):
+        """ (re)open the socket to the RTP handler.
+        """
+        async with self._lock:
+            if self.is_connected:
+                return
+            loop = asyncio.get_running_loop()
+            self.transport, self.protocol = await loop.create_datagram_endpoint(
+                RTPControlProtocol, remote_addr=self.endpoint
+            )
+            logger.debug("<rtp>: connected to %s", self.endpoint)
+
+    async def request(self, call_id, payload, timeout=None):
+        """ send a request and return the handler's reply.
+        @call_id<str> -- SIP Call-ID of the request.
+        @payload<bytes> -- JSON request.
+        @timeout<float> -- request deadline in seconds.
+
+        Raises `asyncio.TimeoutError` if the deadline passes and `OSError` if
+        the handler is unreachable.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        if not self.echoes:
+            return await self.request_once(call_id, payload, timeout)
+        await self.connect()
+        protocol = self.protocol
+        future = protocol.pending.get(call_id)
+        if future is None:  # otherwise, share the outstanding request.
+            future = protocol.pending[call_id] = asyncio.get_running_loop().create_future()
+            self.transport.sendto(payload)
+            self.requests += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            protocol.abandon(call_id, future)
+            raise
+        except asyncio.CancelledError:
+            protocol.abandon(call_id, future)
+            raise
+
+    async def request_once(self, call_id, payload, timeout):
+        """ send a request through its own socket and return the reply.
+        @call_id<str> -- SIP Call-ID of the request.
+        @payload<bytes> -- JSON request.
+        @timeout<float> -- request deadline in seconds.
+        """
+        loop = asyncio.get_running_loop()
+        transport, protocol = await loop.create_datagram_endpoint(
+            RTPReplyProtocol, remote_addr=self.endpoint
+        )
+        try:
+            transport.sendto(payload)
+            self.requests += 1
+            reply = await asyncio.wait_for(protocol.reply, timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            transport.close()
+        if reply.get("Call-ID") == call_id and not self.echoes:
+            logger.debug("<rtp>: %s echoes Call-ID: pipelining requests.", self.endpoint)
+            self.echoes = True
+        return reply
+
+    def send(self, payload):
+        """ send a request without waiting on a reply.
+        @payload<bytes> -- JSON request.
+        """
+        if self.is_connected:
+            self.transport.sendto(payload)
+            return True
+        try:  # requests still have their own sockets.
+            with safe_allocate_udp_client() as client:
+                client.sendto(payload, self.endpoint)
+        except OSError as error:
+            logger.error("<rtp>: failed to send to %s: %s", self.endpoint, error)
+            return False
+        return True
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
@@ -0,0 +1,174 @@
+# Copyright 2018 (c) Herbert Shin  https://github.com/initbar/sipd
+#
+# This source code is licensed under the MIT license.
+
+"""
+sipd.rtp.codec
+------------------
+"""
+
+from __future__ import absolute_import
+
+import logging
+
+# numpy is optional: without it, payloads are decoded with `bytes.translate`.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .wavfile import MappedWavFile
+
+logger = logging.getLogger()
+
+__all__ = ["PCMA", "PCMU", "WavWriter", "decode"]
+
+PCMU = 0  # G.711 mu-law.
+PCMA = 8  # G.711 A-law.
+
+SAMPLE_RATE = 8000  # Hz.
+SAMPLE_WIDTH = 2  # 16-bit linear PCM.
+
+
+def decode_ulaw_sample(octet):
+    """ return the 16-bit linear sample of a mu-law octet.
+    @octet<int> -- 0 to 255.
+    """
+    octet = ~octet & 0xff
+    magnitude = ((((octet & 0x0f) << 3) + 0x84) << ((octet & 0x70) >> 4)) - 0x84
+    return -magnitude if octet & 0x80 else magnitude
+
+
+def decode_alaw_sample(octet):
+    """ return the 16-bit linear sample of an A-law octet.
+    @octet<int> -- 0 to 255.
+    """
+    octet ^= 0x55
+    exponent = (octet & 0x70) >> 4
+    magnitude = (octet & 0x0f) << 4
+    if exponent:
+        magnitude = (magnitude + 0x108) << (exponent - 1)
+    else:
+        magnitude += 8
+    return magnitude if octet & 0x80 else -magnitude
+
+
+class DecodeTable(object):
+    """ precomputed 256-entry decode table of a G.711 law.
+
+    A payload is decoded as a whole: with numpy, by indexing the table with
+    the payload octets; otherwise, by translating the payload once into the
+    low bytes and once into the high bytes of the little-endian samples and
+    interleaving the two.
+    """
+
+    __slots__ = ("samples", "low", "high", "array")
+
+    def __init__(self, decode_sample):
+        """
+        @decode_sample<callable> -- octet to linear sample.
+        """
+        self.samples = [decode_sample(octet) for octet in range(256)]
+        self.low = bytes(sample & 0xff for sample in self.samples)
+        self.high = bytes((sample >> 8) & 0xff for sample in self.samples)
+        self.array = numpy.array(self.samples, dtype="<i2") if numpy is not None else None
+
+    def decode(self, payload):
+        """ return little-endian 16-bit PCM of a payload.
+        @payload<bytes> -- G.711 octets.
+        """
+        if self.array is not None:
+            return self.array[numpy.frombuffer(payload, dtype=numpy.uint8)].tobytes()
+        pcm = bytearray(len(payload) * 2)
+        pcm[0::2] = payload.translate(self.low)
+        pcm[1::2] = payload.translate(self.high)
+        return bytes(pcm)
+
+
+TABLES = {
+    PCMU: DecodeTable(decode_ulaw_sample),
+    PCMA: DecodeTable(decode_alaw_sample),
+}
+
+
+def decode(payload, payload_type):
+    """ return little-endian 16-bit PCM of a G.711 payload (or None).
+    @payload<bytes> -- RTP payload.
+    @payload_type<int> -- PCMU or PCMA.
+    """
+    table = TABLES.get(payload_type)
+    if table is None:
+        return
+    return table.decode(payload)
+
+
+class WavWriter(object):
+    """ stream G.711 payloads into a mono 8 kHz 16-bit WAV file.
+
+    Payloads are buffered and decoded in batches of at least `batch` octets,
+    so the per-call decoding cost is a handful of table lookups per second
+    of audio rather than one per packet.
+    """
+
+    def __init__(self, path, batch=8000, detector=None):
+        """
+        @path<str> -- WAV file path.
+        @batch<int> -- octets buffered before decoding (8000 = 1s).
+        @detector<EnergyDetector> -- silence detector of the decoded audio.
+        """
+        self.path = path
+        self.batch = batch
+        self.detector = detector
+        self.payload_type = None  # of the buffered payloads.
+        self.buffer = []
+        self.buffered = 0
+        self.frames = 0  # frames written (after silence is dropped).
+        self.file = MappedWavFile(path, channels=1, rate=SAMPLE_RATE, width=SAMPLE_WIDTH)
+
+    def __repr__(self):
+        return "WavWriter(path=%s, frames=%s)" % (self.path, self.frames)
+
+    @property
+    def duration(self):
+        """ seconds of audio written (including buffered payloads).
+        """
+        return float(self.frames + self.buffered) / SAMPLE_RATE
+
+    def write(self, payload, payload_type):
+        """ append a payload; return False if it is not G.711.
+        @payload<bytes> -- RTP payload.
+        @payload_type<int> -- PCMU or PCMA.
+        """
+        if payload_type not in TABLES:
+            return False
+        if payload_type != self.payload_type:  # codec changed mid-stream.
+            self.flush()
+            self.payload_type = payload_type
+        self.buffer.append(payload)
+        self.buffered += len(payload)
+        if self.buffered >= self.batch:
+            self.flush()
+        return True
+
+    def flush(self):
+        """ decode and write the buffered payloads.
+        """
+        if not self.buffer:
+            return
+        pcm = decode(b"".join(self.buffer), self.payload_type)
+        if self.detector is not None:
+            pcm = self.detector.process(pcm)
+        self.file.write(pcm)
+        self.frames += len(pcm) // SAMPLE_WIDTH
+        self.buffer = []
+        self.buffered = 0
+
+    def close(self):
+        """ flush and finalize the WAV header.
+        """
+        self.flush()
+        if self.detector is not None:
+            pcm = self.detector.close()
+            self.file.write(pcm)
+            self.frames += len(pcm) // SAMPLE_WIDTH
+        self.file.close()
@@ -0,0 +1,424 @@
+# Copyright 2018 (c) Herbert Shin  https://github.com/initbar/sipd
+#
+# This source code is licensed under the MIT license.
+
+"""
+sipd.rtp.compress
+------------------
+"""
+
+from __future__ import absolute_import
+from array import array
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import gzip
+import logging
+import os
+import shutil
+import struct
+import sys
+import threading
+import time
+import wave
+
+from .codec import numpy
+
+logger = logging.getLogger()
+
+__all__ = ["METHODS", "RecordingCompressor", "compress_recording", "encode_ima_adpcm"]
+
+METHODS = ("adpcm", "gzip")
+
+# IMA-ADPCM (Intel DVI ADPCM) step sizes and step index adjustments.
+IMA_STEPS = (
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45,
+    50, 55, 60, 66, 73, 80, 88, 97, 107, 118, 130, 143, 157, 173, 190, 209, 230,
+    253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796, 876, 963,
+    1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327,
+    3660, 4026, 4428, 4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442,
+    11487, 12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794,
+    32767,
+)
+IMA_INDEX = (-1, -1, -1, -1, 2, 4, 6, 8) * 2
+
+IMA_BLOCK = 256  # bytes per block and channel.
+IMA_SAMPLES = (IMA_BLOCK - 4) * 2 + 1  # samples per block and channel (505).
+IMA_LOOKAHEAD = 8  # sample differences the initial step size is estimated from.
+IMA_BATCH = 1024  # blocks encoded at a time per channel (about 65s at 8 kHz).
+IMA_HEADER = struct.Struct("<hBB")  # first sample, step index, reserved.
+WAVE_FORMAT_IMA_ADPCM = 0x0011
+
+
+def get_samples(pcm):
+    """ return the samples of 16-bit PCM as a numpy or `array` array.
+    @pcm<bytes> -- 16-bit little-endian PCM.
+    """
+    if numpy is not None:
+        return numpy.frombuffer(pcm, dtype="<i2")
+    samples = array("h")
+    samples.frombytes(pcm)
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return samples
+
+
+def encode_ima_adpcm(pcm, channels=1):
+    """ return IMA-ADPCM WAV blocks of 16-bit PCM.
+    @pcm<bytes> -- 16-bit little-endian PCM.
+    @channels<int> -- number of interleaved channels.
+
+    Every block restarts the encoder from its header, so the blocks are
+    independent: with numpy, all blocks of a channel are encoded at once, one
+    sample position at a time. Rather than carrying the step size over from
+    the previous block, each block starts from the step size closest to its
+    first few sample differences. PCM is encoded IMA_BATCH blocks at a time.
+    """
+    frames = len(pcm) // (2 * channels)
+    blocks = -(-frames // IMA_SAMPLES)
+    pcm = memoryview(pcm)[:frames * 2 * channels]
+    size = IMA_BATCH * IMA_SAMPLES * 2 * channels  # PCM octets per batch.
+    data = bytearray()
+    for offset in range(0, blocks * IMA_SAMPLES * 2 * channels, size):
+        data += encode_blocks(pcm[offset:offset + size], channels)
+    return bytes(data)
+
+
+def encode_blocks(pcm, channels):
+    """ return IMA-ADPCM WAV blocks of a batch of 16-bit PCM.
+    @pcm<bytes> -- 16-bit little-endian PCM of whole frames.
+    @channels<int> -- number of interleaved channels.
+    """
+    frames = len(pcm) // (2 * channels)
+    blocks = -(-frames // IMA_SAMPLES)
+    # pad the last block with its final sample.
+    padding = blocks * IMA_SAMPLES - frames
+    samples = get_samples(pcm)
+    if padding and numpy is not None:
+        samples = numpy.concatenate((samples, numpy.tile(samples[-channels:], padding)))
+    elif padding:
+        samples.extend(samples[-channels:] * padding)
+    encoded = []
+    for channel in range(channels):
+        encode = encode_channel if numpy is None else encode_channel_vectorized
+        encoded.append(encode(samples[channel::channels], blocks))
+    if channels == 1:
+        return b"".join(encoded[0])
+    # interleave the channels: block header, then 4 bytes (8 samples) per channel.
+    data = bytearray()
+    for block in range(blocks):
+        for channel in range(channels):
+            data += encoded[channel][block][:4]
+        for offset in range(4, IMA_BLOCK, 4):
+            for channel in range(channels):
+                data += encoded[channel][block][offset:offset + 4]
+    return bytes(data)
+
+
+def pack_block(first, index, nibbles):
+    """ return an IMA-ADPCM block of one channel.
+    @first<int> -- first sample.
+    @index<int> -- initial step index.
+    @nibbles<bytes> -- (IMA_SAMPLES - 1) 4-bit codes, low nibble first.
+    """
+    return IMA_HEADER.pack(first, index, 0) + nibbles
+
+
+def encode_channel(samples, blocks):
+    """ return the IMA-ADPCM blocks of one channel.
+    @samples<array> -- samples of the channel (`blocks` * IMA_SAMPLES).
+    @blocks<int> -- number of blocks.
+    """
+    encoded = []
+    for block in range(blocks):
+        block_samples = samples[block * IMA_SAMPLES:(block + 1) * IMA_SAMPLES]
+        predictor = block_samples[0]
+        lookahead = block_samples[:IMA_LOOKAHEAD + 1]
+        average = sum(abs(b - a) for (a, b) in zip(lookahead, lookahead[1:])) // IMA_LOOKAHEAD
+        index = first_index = min(bisect_left(IMA_STEPS, average), 88)
+        codes = []
+        for sample in block_samples[1:]:
+            step = IMA_STEPS[index]
+            diff = sample - predictor
+            code = 0
+            if diff < 0:
+                code = 8
+                diff = -diff
+            delta = step >> 3
+            for (bit, threshold) in ((4, step), (2, step >> 1), (1, step >> 2)):
+                if diff >= threshold:
+                    code |= bit
+                    diff -= threshold
+                    delta += threshold
+            predictor = predictor - delta if code & 8 else predictor + delta
+            predictor = min(max(predictor, -32768), 32767)
+            index = min(max(index + IMA_INDEX[code], 0), 88)
+            codes.append(code)
+        nibbles = bytes(codes[i] | (codes[i + 1] << 4) for i in range(0, len(codes), 2))
+        encoded.append(pack_block(block_samples[0], first_index, nibbles))
+    return encoded
+
+
+def encode_channel_vectorized(samples, blocks):
+    """ return the IMA-ADPCM blocks of one channel, encoding every block at once.
+    @samples<numpy.ndarray> -- samples of the channel (`blocks` * IMA_SAMPLES).
+    @blocks<int> -- number of blocks.
+    """
+    steps = numpy.array(IMA_STEPS, dtype=numpy.int32)
+    adjust = numpy.array(IMA_INDEX, dtype=numpy.int32)
+    samples = numpy.array(samples, dtype=numpy.int32).reshape(blocks, IMA_SAMPLES)
+    predictor = samples[:, 0].copy()
+    average = numpy.abs(numpy.diff(samples[:, :IMA_LOOKAHEAD + 1], axis=1)).sum(axis=1) // IMA_LOOKAHEAD
+    index = first_index = numpy.minimum(numpy.searchsorted(steps, average, side="left"), 88)
+    codes = numpy.empty((blocks, IMA_SAMPLES - 1), dtype=numpy.uint8)
+    for position in range(1, IMA_SAMPLES):
+        step = steps[index]
+        diff = samples[:, position] - predictor
+        code = numpy.where(diff < 0, 8, 0)
+        diff = numpy.abs(diff)
+        delta = step >> 3
+        for (bit, threshold) in ((4, step), (2, step >> 1), (1, step >> 2)):
+            hit = diff >= threshold
+            code |= numpy.where(hit, bit, 0)
+            diff = numpy.where(hit, diff - threshold, diff)
+            delta = numpy.where(hit, delta + threshold, delta)
+        predictor = numpy.clip(numpy.where(code & 8, predictor - delta, predictor + delta), -32768, 32767)
+        index = numpy.clip(index + adjust[code], 0, 88)
+        codes[:, position - 1] = code
+    nibbles = codes[:, 0::2] | (codes[:, 1::2] << 4)
+    return [
+        pack_block(int(samples[block, 0]), int(first_index[block]), nibbles[block].tobytes())
+        for block in range(blocks)
+    ]
+
+
+def write_ima_adpcm_wav(path, source):
+    """ write a 16-bit PCM WAV file as an IMA-ADPCM WAV file.
+    @path<str> -- WAV file path.
+    @source<wave.Wave_read> -- 16-bit PCM WAV file.
+
+    The source is read and encoded IMA_BATCH blocks at a time, and the sizes
+    in the header are filled in once every frame is written.
+    """
+    channels, rate = source.getnchannels(), source.getframerate()
+    align = IMA_BLOCK * channels
+    fmt = struct.pack(
+        "<HHIIHHHH",
+        WAVE_FORMAT_IMA_ADPCM,
+        channels,
+        rate,
+        rate * align // IMA_SAMPLES,  # byte rate.
+        align,
+        4,  # bits per sample.
+        2,  # extension size.
+        IMA_SAMPLES,
+    )
+    header = b"".join([
+        b"RIFF" + struct.pack("<I", 0),
+        b"WAVE",
+        b"fmt " + struct.pack("<I", len(fmt)) + fmt,
+        b"fact" + struct.pack("<I", 4) + struct.pack("<I", 0),
+        b"data" + struct.pack("<I", 0),
+    ])
+    frames = size = 0
+    with open(path, "wb") as f:
+        f.write(header)
+        while True:
+            pcm = source.readframes(IMA_BATCH * IMA_SAMPLES)
+            if not pcm:
+                break
+            data = encode_ima_adpcm(pcm, channels)
+            f.write(data)
+            frames += len(pcm) // (2 * channels)
+            size += len(data)
+        f.seek(4)
+        f.write(struct.pack("<I", len(header) - 8 + size))
+        f.seek(len(header) - 12)
+        f.write(struct.pack("<I", frames))
+        f.seek(len(header) - 4)
+        f.write(struct.pack("<I", size))
+
+
+def compress_recording(path, method="adpcm"):
+    """ compress a finished recording in place; run in a worker process.
+    @path<str> -- recording path.
+    @method<str> -- one of METHODS.
+
+    A PCM WAV recording is re-encoded as "<name>.adpcm.wav" with "adpcm";
+    everything else is gzipped to "<path>.gz". The original is removed once
+    the compressed file is complete. Returns (path, input bytes, output
+    bytes, CPU seconds).
+    """
+    started = time.process_time()
+    size = os.path.getsize(path)
+    output = None
+    if method == "adpcm" and path.endswith(".wav"):
+        with wave.open(path, "rb") as f:
+            if f.getsampwidth() == 2 and f.getcomptype() == "NONE":
+                output = path[:-len(".wav")] + ".adpcm.wav"
+                write_ima_adpcm_wav(output + ".part", f)
+    if output is None:
+        output = path + ".gz"
+        with open(path, "rb") as source, gzip.open(output + ".part", "wb") as target:
+            shutil.copyfileobj(source, target, 1 << 20)
+    os.replace(output + ".part", output)
+    os.remove(path)
+    return (output, size, os.path.getsize(output), time.process_time() - started)
+
+
+class CompressionMetrics(object):
+    """ recording compression statistics.
+    """
+
+    __slots__ = (
+        "submitted",
+        "completed",
+        "failed",
+        "rejected",
+        "input_bytes",
+        "output_bytes",
+        "total_wait",
+        "max_wait",
+        "total_time",
+        "max_time",
+        "total_cpu",
+    )
+
+    def __init__(self):
+        self.submitted = self.completed = self.failed = self.rejected = 0  # only increment.
+        self.input_bytes = self.output_bytes = 0
+        self.total_wait = self.max_wait = 0.0  # seconds queued.
+        self.total_time = self.max_time = 0.0  # seconds from dispatch to completion.
+        self.total_cpu = 0.0  # worker CPU seconds.
+
+    def __repr__(self):
+        return "CompressionMetrics(completed=%s, failed=%s, rejected=%s, ratio=%.3f, mean_time=%.3f)" % (
+            self.completed,
+            self.failed,
+            self.rejected,
+            self.ratio,
+            self.mean_time,
+        )
+
+    @property
+    def ratio(self):
+        return float(self.output_bytes) / self.input_bytes if self.input_bytes else 0.0
+
+    @property
+    def mean_time(self):
+        return self.total_time / self.completed if self.completed else 0.0
+
+
+class RecordingCompressor(object):
+    """ post-call recording compression.
+
+    Finished recordings are compressed in a process pool so that neither the
+    event loop nor the garbage collector spends CPU on them. At most
+    `workers` recordings are handed to the pool at a time and up to
+    `max_queue` more wait in memory; when the queue is full, further
+    recordings are left uncompressed and counted as rejected instead of
+    holding up the caller.
+    """
+
+    def __init__(self, method="adpcm", workers=1, max_queue=256, clock=time.monotonic):
+        """
+        @method<str> -- one of METHODS.
+        @workers<int> -- number of worker processes.
+        @max_queue<int> -- maximum number of waiting recordings.
+        @clock<callable> -- monotonic time source.
+        """
+        if method not in METHODS:
+            raise ValueError("unknown compression method: '%s'." % method)
+        self.method = method
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.clock = clock
+        self.queue = deque()  # (path, queued at) waiting for a worker.
+        self.running = 0
+        self.metrics = CompressionMetrics()
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        # completions arrive on the executor's thread, or right away on the
+        # submitting thread if the job already finished.
+        self.lock = threading.RLock()
+        self.is_closed = False
+
+    def __repr__(self):
+        return "RecordingCompressor(method=%s, running=%s, queued=%s, metrics=%s)" % (
+            self.method,
+            self.running,
+            len(self.queue),
+            self.metrics,
+        )
+
+    def __len__(self):
+        return self.running + len(self.queue)
+
+    def submit(self, paths):
+        """ queue finished recordings without waiting on them.
+        @paths<iterable> -- recording paths.
+        """
+        with self.lock:
+            for path in paths:
+                if self.is_closed or len(self.queue) >= self.max_queue:
+                    self.metrics.rejected += 1
+                    logger.warning("<gc>: compression queue is full: left %s uncompressed.", path)
+                    continue
+                self.queue.append((path, self.clock()))
+                self.metrics.submitted += 1
+                self.dispatch()
+
+    def dispatch(self):
+        # with `self.lock` held.
+        while self.queue and self.running < self.workers and not self.is_closed:
+            (path, queued) = self.queue.popleft()
+            started = self.clock()
+            wait = started - queued
+            self.metrics.total_wait += wait
+            self.metrics.max_wait = max(self.metrics.max_wait, wait)
+            try:
+                future = self.executor.submit(compress_recording, path, self.method)
+            except BrokenProcessPool as error:  # a worker died: start a new pool.
+                self.metrics.failed += 1
+                logger.error("<gc>: failed to compress %s: %s", path, error)
+                self.executor.shutdown(wait=False)
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+                continue
+            self.running += 1
+            future.add_done_callback(lambda future, path=path, started=started: self.done(future, path, started))
+
+    def done(self, future, path, started):
+        elapsed = self.clock() - started
+        with self.lock:
+            self.running -= 1
+            try:
+                (output, input_bytes, output_bytes, cpu) = future.result()
+            except Exception as error:  # the recording is left as is.
+                self.metrics.failed += 1
+                logger.error("<gc>: failed to compress %s: %s", path, error)
+            else:
+                self.metrics.completed += 1
+                self.metrics.input_bytes += input_bytes
+                self.metrics.output_bytes += output_bytes
+                self.metrics.total_time += elapsed
+                self.metrics.max_time = max(self.metrics.max_time, elapsed)
+                self.metrics.total_cpu += cpu
+                logger.info(
+                    "<gc>: compressed %s in %.3fs (%.3f CPU seconds, %s -> %s bytes)",
+                    output,
+                    elapsed,
+                    cpu,
+                    input_bytes,
+                    output_bytes,
+                )
+            self.dispatch()
+
+    def close(self, wait=False):
+        """ stop compressing; queued recordings are left uncompressed.
+        @wait<bool> -- wait for running jobs to finish.
+        """
+        with self.lock:
+            self.is_closed = True
+            self.queue.clear()
+        self.executor.shutdown(wait=wait)
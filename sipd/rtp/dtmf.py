@@ -0,0 +1,114 @@
+# Copyright 2018 (c) Herbert Shin  https://github.com/initbar/sipd
+#
+# This source code is licensed under the MIT license.
+
+"""
+sipd.rtp.dtmf
+------------------
+"""
+
+from __future__ import absolute_import
+
+import logging
+import struct
+
+logger = logging.getLogger()
+
+__all__ = ["DtmfExtractor", "TELEPHONE_EVENT"]
+
+# payload type of "rtpmap:96 telephone-event/8000" in the static SDP.
+TELEPHONE_EVENT = 96
+
+# 2.3 Payload Format
+#
+#  0                   1                   2                   3
+#  0 1 2 3 4 5 6 7 8 9 0 1 2 3 4 5 6 7 8 9 0 1 2 3 4 5 6 7 8 9 0 1
+# +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+# |     event     |E|R| volume    |          duration             |
+# +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+#
+# https://tools.ietf.org/html/rfc4733#section-2.3
+TELEPHONE_EVENT_PAYLOAD = struct.Struct("!BBH")
+
+# https://tools.ietf.org/html/rfc4733#section-3.2
+DTMF_EVENTS = "0123456789*#ABCD"
+
+
+class DtmfExtractor(object):
+    """ DTMF timeline of an RTP stream.
+
+    Only telephone-event packets are looked into. All packets of an event
+    share the RTP timestamp of its start, and the end-of-event packet is
+    usually sent three times: an event is recorded once, on its first end
+    packet, or with its last known duration when the end packets are lost
+    and the next event starts.
+
+    Events are recorded as (seconds from the first packet of the stream,
+    digit, duration in seconds).
+    """
+
+    __slots__ = ("payload_type", "clock_rate", "events", "base", "current", "duration", "ended")
+
+    def __init__(self, payload_type=TELEPHONE_EVENT, clock_rate=8000):
+        """
+        @payload_type<int> -- telephone-event payload type.
+        @clock_rate<int> -- RTP timestamp units per second.
+        """
+        self.payload_type = payload_type
+        self.clock_rate = clock_rate
+        self.events = []
+        self.base = None  # RTP timestamp of the first packet of the stream.
+        self.current = None  # (timestamp, event) of the event in progress.
+        self.duration = 0  # of the event in progress.
+        self.ended = None  # timestamp of the last recorded event.
+
+    def __repr__(self):
+        return "DtmfExtractor(events=%s)" % self.events
+
+    def __len__(self):
+        return len(self.events)
+
+    @property
+    def digits(self):
+        return "".join(digit for (_, digit, _) in self.events)
+
+    def receive(self, packet):
+        """ account an RTP packet.
+        @packet<RtpPacket> -- RTP packet in arrival order.
+        """
+        if self.base is None:
+            self.base = packet.timestamp
+        if packet.payload_type != self.payload_type:
+            return
+        try:
+            (event, flags, duration) = TELEPHONE_EVENT_PAYLOAD.unpack_from(packet.payload)
+        except struct.error:
+            return
+        timestamp = packet.timestamp
+        if timestamp == self.ended:  # retransmitted end or late packet.
+            return
+        if self.current is not None and self.current[0] != timestamp:
+            self.record()  # the previous event never ended.
+        self.current = (timestamp, event)
+        self.duration = max(self.duration, duration)
+        if flags & 0x80:  # end of event.
+            self.record()
+
+    def record(self):
+        (timestamp, event) = self.current
+        self.current = None
+        self.ended = timestamp
+        if event < len(DTMF_EVENTS):  # otherwise, not a DTMF event (e.g. flash).
+            self.events.append((
+                round(float((timestamp - self.base) & 0xffffffff) / self.clock_rate, 3),
+                DTMF_EVENTS[event],
+                round(float(self.duration) / self.clock_rate, 3),
+            ))
+        self.duration = 0
+
+    def close(self):
+        """ record the event in progress, if any.
+        """
+        if self.current is not None:
+            self.record()
+        return self.events
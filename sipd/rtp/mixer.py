@@ -0,0 +1,230 @@
+# Copyright 2018 (c) Herbert Shin  https://github.com/initbar/sipd
+#
+# This source code is licensed under the MIT license.
+
+"""
+sipd.rtp.mixer
+------------------
+"""
+
+from __future__ import absolute_import
+
+import logging
+import time
+
+from .codec import SAMPLE_RATE
+from .codec import SAMPLE_WIDTH
+from .codec import decode
+from .codec import numpy
+from .wavfile import MappedWavFile
+
+logger = logging.getLogger()
+
+__all__ = ["MixerChannel", "StereoMixer", "interleave"]
+
+
+def interleave(left, right):
+    """ return two-channel PCM of two equally long mono PCM buffers.
+    @left<bytes> -- 16-bit PCM of the first channel.
+    @right<bytes> -- 16-bit PCM of the second channel.
+    """
+    if numpy is not None:
+        frames = numpy.empty(len(left), dtype=numpy.int16)
+        frames[0::2] = numpy.frombuffer(left, dtype=numpy.int16)
+        frames[1::2] = numpy.frombuffer(right, dtype=numpy.int16)
+        return frames.tobytes()
+    frames = bytearray(len(left) * 2)
+    view = memoryview(frames).cast("H")
+    view[0::2] = memoryview(left).cast("H")
+    view[1::2] = memoryview(right).cast("H")
+    return bytes(frames)
+
+
+class StereoMixer(object):
+    """ streaming two-channel WAV writer.
+
+    Each channel is written at absolute sample positions. Positions that
+    are never written (packet loss, one-sided silence) are filled with
+    silence. Frames are written out as soon as both channels have them, and
+    no more than `window` frames are held per channel: when one channel runs
+    ahead by more than that, the other is written out as silence.
+
+    A write never inserts more than `max_gap` frames of silence past the
+    furthest frame written so far, since that silence is written on the
+    caller's thread (the event loop): longer gaps are shortened.
+
+    With a `detector`, the mixed frames are classified (and silence dropped)
+    before they are written, as a WavWriter does with a single leg.
+    """
+
+    def __init__(self, path, window=SAMPLE_RATE, channels=2, max_gap=60 * SAMPLE_RATE, detector=None):
+        """
+        @path<str> -- WAV file path.
+        @window<int> -- maximum number of buffered frames per channel.
+        @channels<int> -- number of channels writing to the mixer.
+        @max_gap<int> -- maximum number of silent frames inserted per write.
+        @detector<EnergyDetector> -- silence detector of the mixed (2-channel) audio.
+        """
+        self.path = path
+        self.window = window
+        self.max_gap = max_gap
+        self.detector = detector
+        self.buffers = [bytearray(), bytearray()]  # PCM from `frames` on.
+        self.frames = 0  # frames written.
+        self.late = 0  # frames dropped for arriving after they were written.
+        self.shortened = 0  # silent frames left out of longer gaps.
+        self.writers = channels  # channels not yet closed.
+        self.file = MappedWavFile(path, channels=2, rate=SAMPLE_RATE, width=SAMPLE_WIDTH)
+
+    def __repr__(self):
+        return "StereoMixer(path=%s, frames=%s, late=%s, shortened=%s)" % (
+            self.path,
+            self.frames,
+            self.late,
+            self.shortened,
+        )
+
+    def write(self, channel, position, pcm):
+        """ place PCM of a channel at a sample position.
+        @channel<int> -- 0 (left) or 1 (right).
+        @position<int> -- sample position from the start of the call.
+        @pcm<bytes> -- 16-bit PCM.
+        """
+        furthest = self.frames + max(len(buffer) for buffer in self.buffers) // SAMPLE_WIDTH
+        if position - furthest > self.max_gap:
+            self.shortened += position - furthest - self.max_gap
+            position = furthest + self.max_gap
+        end = position + len(pcm) // SAMPLE_WIDTH
+        if end - self.frames > self.window:
+            self.flush(end - self.frames - self.window)
+        start = position - self.frames
+        if start < 0:
+            self.late += min(-start, end - position)
+            pcm = pcm[-start * SAMPLE_WIDTH:]
+            start = 0
+            if not pcm:
+                return
+        buffer = self.buffers[channel]
+        offset = start * SAMPLE_WIDTH
+        if len(buffer) < offset:
+            buffer.extend(bytes(offset - len(buffer)))
+        buffer[offset:offset + len(pcm)] = pcm
+        self.flush()
+
+    def flush(self, frames=None):
+        """ write out frames; missing samples are written as silence.
+        @frames<int> -- number of frames (default: every frame both channels have).
+        """
+        if frames is None:
+            frames = min(len(buffer) for buffer in self.buffers) // SAMPLE_WIDTH
+        while frames > 0:
+            count = min(frames, self.window)
+            size = count * SAMPLE_WIDTH
+            left, right = [self.take(buffer, size) for buffer in self.buffers]
+            pcm = interleave(left, right)
+            if self.detector is not None:
+                pcm = self.detector.process(pcm)
+            self.file.write(pcm)
+            self.frames += count
+            frames -= count
+
+    def take(self, buffer, size):
+        data = bytes(buffer[:size])
+        del buffer[:size]
+        if len(data) < size:
+            data += bytes(size - len(data))
+        return data
+
+    def release(self):
+        """ close a channel; the file is finalized after the last one.
+        """
+        self.writers -= 1
+        if self.writers <= 0:
+            self.close()
+
+    def close(self):
+        if self.file is None:
+            return
+        self.flush(max(len(buffer) for buffer in self.buffers) // SAMPLE_WIDTH)
+        if self.detector is not None:
+            self.file.write(self.detector.close())
+        self.file.close()
+        self.file = None
+
+
+class MixerChannel(object):
+    """ recording sink of one call leg into a stereo mixer.
+
+    Packets are placed by RTP timestamp relative to an anchor packet, which
+    is itself placed by its arrival time relative to the start of the mix,
+    so that two legs with unrelated timestamp bases line up. The first
+    packet of a stream is an anchor, and so is a packet that starts a
+    talkspurt (marker bit) or jumps more than `max_jump` samples away from
+    the end of the previous one: a sender's timestamp jump or reset never
+    moves the leg further than real time did.
+    """
+
+    extension = "wav"
+
+    __slots__ = (
+        "mixer",
+        "channel",
+        "clock",
+        "max_jump",
+        "started",
+        "ssrc",
+        "base",
+        "offset",
+        "end",
+        "skipped",
+    )
+
+    def __init__(self, mixer, channel, clock=time.monotonic, max_jump=SAMPLE_RATE):
+        """
+        @mixer<StereoMixer> -- stereo mixer.
+        @channel<int> -- 0 (left) or 1 (right).
+        @clock<callable> -- monotonic time source.
+        @max_jump<int> -- timestamp jump (in samples) that re-anchors the leg.
+        """
+        self.mixer = mixer
+        self.channel = channel
+        self.clock = clock
+        self.max_jump = max_jump
+        self.started = clock()
+        self.ssrc = None
+        self.base = 0  # RTP timestamp of the first packet of the stream.
+        self.offset = 0  # sample position of the first packet of the stream.
+        self.end = 0  # sample position after the last packet.
+        self.skipped = 0  # payloads that are not G.711.
+
+    @property
+    def path(self):
+        return self.mixer.path
+
+    def write(self, packet):
+        """ place the decoded payload of an audio packet.
+        @packet<RtpPacket> -- RTP packet in sequence order.
+        """
+        pcm = decode(packet.payload, packet.payload_type)
+        if pcm is None:
+            self.skipped += 1
+            return
+        delta = (packet.timestamp - self.base) & 0xffffffff
+        if delta >= 0x80000000:
+            delta -= 0x100000000  # before the anchor.
+        position = self.offset + delta
+        if packet.ssrc != self.ssrc or packet.marker or abs(position - self.end) > self.max_jump:
+            # continue where the leg ended, or later if that much time passed.
+            elapsed = int((self.clock() - self.started) * SAMPLE_RATE)
+            self.ssrc = packet.ssrc
+            self.base = packet.timestamp
+            self.offset = position = max(self.end, elapsed)
+        elif delta < 0:  # reordered before the anchor.
+            return
+        self.mixer.write(self.channel, position, pcm)
+        self.end = max(self.end, position + len(pcm) // SAMPLE_WIDTH)
+
+    def close(self):
+        if self.skipped:
+            logger.warning("<rtp>: %s payloads of %s could not be decoded.", self.skipped, self.mixer.path)
+        self.mixer.release()
@@ -0,0 +1,187 @@
+# Copyright 2018 (c) Herbert Shin  https://github.com/initbar/sipd
+#
+# This source code is licensed under the MIT license.
+
+"""
+sipd.rtp.packet
+------------------
+"""
+
+from __future__ import absolute_import
+
+import logging
+import struct
+
+logger = logging.getLogger()
+
+__all__ = ["JitterBuffer", "RtpPacket", "parse_rtp_packet"]
+
+# 5.1 RTP Fixed Header Fields
+#
+#  0                   1                   2                   3
+#  0 1 2 3 4 5 6 7 8 9 0 1 2 3 4 5 6 7 8 9 0 1 2 3 4 5 6 7 8 9 0 1
+# +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
+# |V=2|P|X|  CC   |M|     PT      |       sequence number         |
+# |                           timestamp                           |
+# |           synchronization source (SSRC) identifier            |
+# +=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+=+
+#
+# https://tools.ietf.org/html/rfc3550#section-5.1
+RTP_HEADER = struct.Struct("!BBHII")
+RTP_EXTENSION = struct.Struct("!HH")  # profile, length in 32-bit words.
+RTP_VERSION = 2
+
+
+class RtpPacket(object):
+    """ RTP packet.
+    """
+
+    __slots__ = ("payload_type", "marker", "sequence", "timestamp", "ssrc", "payload")
+
+    def __init__(self, payload_type, marker, sequence, timestamp, ssrc, payload):
+        self.payload_type = payload_type
+        self.marker = marker
+        self.sequence = sequence
+        self.timestamp = timestamp
+        self.ssrc = ssrc
+        self.payload = payload
+
+    def __repr__(self):
+        return "RtpPacket(pt=%s, seq=%s, ts=%s, size=%s)" % (
+            self.payload_type,
+            self.sequence,
+            self.timestamp,
+            len(self.payload),
+        )
+
+
+def parse_rtp_packet(data):
+    """ parse an RTP packet (or return None).
+    @data<bytes> -- RTP datagram.
+    """
+    try:
+        (flags, marker_type, sequence, timestamp, ssrc) = RTP_HEADER.unpack_from(data)
+    except struct.error:
+        return
+    if flags >> 6 != RTP_VERSION:
+        return
+    offset = RTP_HEADER.size + 4 * (flags & 0x0f)  # CSRC list.
+    if flags & 0x10:  # header extension.
+        try:
+            (_, length) = RTP_EXTENSION.unpack_from(data, offset)
+        except struct.error:
+            return
+        offset += RTP_EXTENSION.size + 4 * length
+    end = len(data)
+    if flags & 0x20:  # padding; the last octet is the padding length.
+        end -= data[-1]
+    if offset > end:
+        return
+    return RtpPacket(
+        marker_type & 0x7f,
+        marker_type >> 7,
+        sequence,
+        timestamp,
+        ssrc,
+        bytes(data[offset:end]),
+    )
+
+
+# A.1 RTP Data Header Validity Checks
+#
+# https://tools.ietf.org/html/rfc3550#appendix-A.1
+MAX_DROPOUT = 3000
+MAX_MISORDER = 100
+
+
+class JitterBuffer(object):
+    """ per-stream reorder buffer.
+
+    Packets are released in sequence number order. A missing packet is
+    waited on until `depth` later packets are buffered, after which it is
+    given up on. Late packets and duplicates are dropped.
+
+    A new SSRC restarts the stream. As in RFC 3550 A.1, a sequence number
+    more than MAX_DROPOUT ahead or MAX_MISORDER behind is dropped unless the
+    next packet follows it, in which case the sender restarted its sequence
+    numbers and the buffer resyncs to them.
+    """
+
+    __slots__ = ("depth", "packets", "expected", "ssrc", "bad", "lost", "late", "duplicates", "resyncs")
+
+    def __init__(self, depth=16):
+        """
+        @depth<int> -- maximum number of buffered packets.
+        """
+        self.depth = depth
+        self.packets = {}  # buffered packets indexed by sequence number.
+        self.expected = None  # next sequence number to release.
+        self.ssrc = None
+        self.bad = None  # sequence number that would confirm a jump.
+        self.lost = self.late = self.duplicates = self.resyncs = 0  # only increment.
+
+    def __len__(self):
+        return len(self.packets)
+
+    def push(self, packet):
+        """ buffer a packet and return the packets ready in order.
+        @packet<RtpPacket> -- RTP packet.
+        """
+        sequence = packet.sequence
+        ready = []
+        if packet.ssrc != self.ssrc:
+            if self.ssrc is not None:
+                ready = self.resync()
+            self.ssrc = packet.ssrc
+            self.expected = sequence
+        delta = (sequence - self.expected) & 0xffff
+        if delta >= MAX_DROPOUT:
+            if delta >= 0x10000 - MAX_MISORDER:  # behind (mod 2^16).
+                self.late += 1
+                return ready
+            if sequence != self.bad:
+                self.bad = (sequence + 1) & 0xffff
+                self.late += 1
+                return ready
+            # two sequential packets after a jump: the sender restarted.
+            ready = self.resync()
+            self.expected = sequence
+        if sequence in self.packets:
+            self.duplicates += 1
+            return []
+        self.packets[sequence] = packet
+
+        ready.extend(self.drain())
+        if len(self.packets) > self.depth:
+            # give up on the missing packets before the oldest buffered one.
+            oldest = min(self.packets, key=lambda s: (s - self.expected) & 0xffff)
+            self.lost += (oldest - self.expected) & 0xffff
+            self.expected = oldest
+            ready.extend(self.drain())
+        return ready
+
+    def resync(self):
+        """ release the packets of the previous stream and start over.
+        """
+        ready = self.flush()
+        self.bad = None
+        self.resyncs += 1
+        return ready
+
+    def drain(self):
+        ready = []
+        while self.expected in self.packets:
+            ready.append(self.packets.pop(self.expected))
+            self.expected = (self.expected + 1) & 0xffff
+        return ready
+
+    def flush(self):
+        """ release every buffered packet in order.
+        """
+        ready = []
+        while self.packets:
+            oldest = min(self.packets, key=lambda s: (s - self.expected) & 0xffff)
+            self.lost += (oldest - self.expected) & 0xffff
+            self.expected = oldest
+            ready.extend(self.drain())
+        return ready
@@ -0,0 +1,199 @@
+# Copyright 2018 (c) Herbert Shin  https://github.com/initbar/sipd
+#
+# This source code is licensed under the MIT license.
+
+"""
+sipd.rtp.pool
+------------------
+"""
+
+from __future__ import absolute_import
+from collections import deque
+
+import asyncio
+import logging
+import time
+import uuid
+
+from .server import generate_start_signal
+
+logger = logging.getLogger()
+
+__all__ = ["PortLease", "PortLeasePool"]
+
+
+class PortLease(object):
+    """ RX/TX port pair opened ahead of time on an RTP handler.
+    """
+
+    __slots__ = ("lease_id", "address", "endpoint", "tx_port", "rx_port", "expiration")
+
+    def __init__(self, lease_id, address, endpoint, tx_port, rx_port, expiration):
+        """
+        @lease_id<str> -- Call-ID the handler opened the ports for.
+        @address<str> -- RTP handler address advertised in SDP.
+        @endpoint<tuple> -- RTP handler control endpoint.
+        @tx_port<int> -- caller port.
+        @rx_port<int> -- agent port.
+        @expiration<float> -- monotonic time the lease is released at.
+        """
+        self.lease_id = lease_id
+        self.address = address
+        self.endpoint = endpoint
+        self.tx_port = tx_port
+        self.rx_port = rx_port
+        self.expiration = expiration
+
+    def __repr__(self):
+        return "PortLease(lease_id=%s, endpoint=%s, tx_port=%s, rx_port=%s)" % (
+            self.lease_id,
+            self.endpoint,
+            self.tx_port,
+            self.rx_port,
+        )
+
+
+class PortLeasePool(object):
+    """ pre-fetched RX/TX port pairs.
+
+    Port pairs are requested from every enabled handler ahead of time with
+    synthetic Call-IDs, so an INVITE takes a lease from memory instead of
+    waiting on a handler round-trip. A background task refills the pool up
+    to `size` whenever it drops below `low_water`. Unused leases are released
+    through the stop signal once they expire; a taken lease is bound to the
+    call's Call-ID until the call is stopped.
+    """
+
+    def __init__(self, router, size=16, low_water=4, lifetime=60.0, clock=time.monotonic):
+        """
+        @router<AsynchronousRTPRouter> -- RTP router.
+        @size<int> -- number of leases to keep.
+        @low_water<int> -- refill when fewer leases are left.
+        @lifetime<float> -- seconds an unused lease is kept.
+        @clock<callable> -- monotonic time source.
+        """
+        self.router = router
+        self.size = size
+        self.low_water = low_water
+        self.lifetime = lifetime
+        self.clock = clock
+        self.leases = deque()
+        self.bindings = {}  # lease IDs indexed by Call-ID.
+        self.hits = self.misses = self.expired = 0  # only increment.
+        self._task = None
+        self._wakeup = None
+
+    def __repr__(self):
+        return "PortLeasePool(leases=%s, bindings=%s, hits=%s, misses=%s)" % (
+            len(self.leases),
+            len(self.bindings),
+            self.hits,
+            self.misses,
+        )
+
+    def __len__(self):
+        return len(self.leases)
+
+    def take(self, call_id):
+        """ bind an unexpired lease to a call and return it.
+        @call_id<str> -- SIP Call-ID.
+        """
+        self.expire()
+        try:
+            lease = self.leases.popleft()
+        except IndexError:
+            lease = None
+        if len(self.leases) < self.low_water and self._wakeup is not None:
+            self._wakeup.set()  # refill in the background.
+        if lease is None:
+            self.misses += 1
+            return
+        self.hits += 1
+        self.bindings[call_id] = lease.lease_id
+        return lease
+
+    def unbind(self, call_id):
+        """ return the Call-ID the handler knows a call by.
+        @call_id<str> -- SIP Call-ID.
+        """
+        return self.bindings.pop(call_id, call_id)
+
+    def release(self, lease):
+        """ close the ports of an unused lease.
+        @lease<PortLease> -- port lease.
+        """
+        try:
+            self.router.send_stop_signal(call_id=lease.lease_id)
+        except OSError as error:
+            logger.error("<rtp>: failed to release %s: %s", lease, error)
+
+    def expire(self):
+        """ release expired leases.
+        """
+        now = self.clock()
+        # leases are appended in the order they were requested.
+        while self.leases and self.leases[0].expiration <= now:
+            self.release(self.leases.popleft())
+            self.expired += 1
+
+    async def lease(self, handler):
+        """ request a port pair from a handler.
+        @handler<RTPHandler> -- RTP handler.
+        """
+        # the handler opens ports for a synthetic Call-ID.
+        lease_id = "sipd-lease-%s" % uuid.uuid4().hex
+        endpoint = handler.endpoint
+        try:
+            reply = await self.router.request(handler, lease_id, generate_start_signal(lease_id))
+        except (asyncio.TimeoutError, OSError) as error:
+            logger.warning("<rtp>: %s did not lease ports: %s", endpoint, str(error) or "timeout")
+            return
+        tx_port, rx_port = reply.get("TxPort"), reply.get("RxPort")
+        if not tx_port or not rx_port:
+            return
+        lease = PortLease(lease_id, endpoint[0], endpoint, tx_port, rx_port, self.clock() + self.lifetime)
+        self.leases.append(lease)
+        return lease
+
+    async def refill(self):
+        """ request port pairs up to the pool size, spread over every handler
+        in rotation.
+        """
+        missing = self.size - len(self.leases)
+        if missing <= 0:
+            return 0
+        handlers = self.router.balancer.spread(missing)
+        if not handlers:
+            return 0
+        leases = await asyncio.gather(*[self.lease(handler) for handler in handlers])
+        count = len([lease for lease in leases if lease])
+        logger.debug("<rtp>: leased %s port pairs: %s", count, self)
+        return count
+
+    async def run(self, interval=1.0):
+        """ keep the pool refilled and expire unused leases.
+        @interval<float> -- seconds between checks without a wakeup.
+        """
+        self._wakeup = asyncio.Event()
+        while True:
+            self.expire()
+            if len(self.leases) < self.low_water:
+                await self.refill()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self, interval=1.0):
+        self._task = asyncio.ensure_future(self.run(interval=interval))
+        return self._task
+
+    def stop(self):
+        """ stop refilling and release every unused lease.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        while self.leases:
+            self.release(self.leases.popleft())
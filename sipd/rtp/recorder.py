@@ -0,0 +1,394 @@
+# Copyright 2018 (c) Herbert Shin  https://github.com/initbar/sipd
+#
+# This source code is licensed under the MIT license.
+
+"""
+sipd.rtp.recorder
+------------------
+"""
+
+from __future__ import absolute_import
+from collections import OrderedDict
+from collections import deque
+
+import asyncio
+import logging
+import os
+import re
+import time
+
+from .codec import WavWriter
+from .dtmf import DtmfExtractor
+from .mixer import MixerChannel
+from .mixer import StereoMixer
+from .packet import JitterBuffer
+from .packet import parse_rtp_packet
+from .stats import StreamStats
+from .vad import EnergyDetector
+
+logger = logging.getLogger()
+
+__all__ = ["PortAllocator", "RTPRecorder", "RawFileSink", "RecordingLeg", "WavFileSink"]
+
+# static SDP legs: caller audio arrives on TxPort and agent audio on RxPort.
+LEGS = ("caller", "agent")
+
+# payload types advertised in the static SDP.
+AUDIO_PAYLOAD_TYPES = frozenset((0, 8, 18))  # PCMU, PCMA, G729.
+
+
+def get_recording_path(directory, call_id, leg, extension):
+    """ return the recording path of a call leg.
+    @directory<str> -- recording directory.
+    @call_id<str> -- SIP Call-ID.
+    @leg<str> -- "caller" or "agent".
+    @extension<str> -- file extension.
+    """
+    name = re.sub(r"[^\w.@-]", "_", call_id)
+    return os.path.join(directory, "%s.%s.%s" % (name, leg, extension))
+
+
+class PortAllocator(object):
+    """ RTP port allocator.
+
+    Ports are handed out in blocks of four: TxPort and RxPort are the even
+    RTP ports of the block, and the odd ports are left for RTCP.
+    """
+
+    def __init__(self, start=20000, end=30000):
+        """
+        @start<int> -- first port of the range.
+        @end<int> -- end of the range (exclusive).
+        """
+        start += start % 2
+        self.free = deque(range(start, end - 3, 4))
+        self.used = set()
+
+    def __len__(self):
+        return len(self.free)
+
+    def allocate(self):
+        """ return (tx_port, rx_port) or None if the range is exhausted.
+        """
+        try:
+            base = self.free.popleft()
+        except IndexError:
+            return
+        self.used.add(base)
+        return (base, base + 2)
+
+    def release(self, ports):
+        """ return ports to the allocator.
+        @ports<tuple> -- (tx_port, rx_port).
+        """
+        base = ports[0]
+        if base in self.used:
+            self.used.remove(base)
+            self.free.append(base)
+
+
+class RawFileSink(object):
+    """ write audio payloads of a call leg to disk as they arrive.
+    """
+
+    extension = "raw"
+
+    def __init__(self, path, vad=None):
+        """
+        @path<str> -- recording path.
+        @vad<dict> -- unused: payloads are not decoded.
+        """
+        self.path = path
+        self.file = open(path, "wb", buffering=1 << 16)
+        self.payload_type = None  # of the first audio packet.
+        self.size = 0
+
+    def write(self, packet):
+        """ append the payload of an audio packet.
+        @packet<RtpPacket> -- RTP packet in sequence order.
+        """
+        if packet.payload_type not in AUDIO_PAYLOAD_TYPES:
+            return
+        if self.payload_type is None:
+            self.payload_type = packet.payload_type
+        self.file.write(packet.payload)
+        self.size += len(packet.payload)
+
+    def close(self):
+        self.file.close()
+
+
+def create_detector(path, vad, channels=1):
+    """ return the silence detector of a recording (None if VAD is disabled).
+    @path<str> -- recording path.
+    @vad<dict> -- `rtp.vad` settings.
+    @channels<int> -- number of interleaved channels.
+    """
+    if not vad or not vad.get("enabled"):
+        return
+    return EnergyDetector(
+        os.path.splitext(path)[0] + ".vad",
+        threshold=float(vad.get("threshold", -50.0)),
+        min_silence=float(vad.get("min_silence", 1.0)),
+        mode=vad.get("mode", "mark"),
+        channels=channels,
+    )
+
+
+class WavFileSink(object):
+    """ decode G.711 payloads of a call leg into a WAV file as they arrive.
+    """
+
+    extension = "wav"
+
+    def __init__(self, path, vad=None):
+        """
+        @path<str> -- recording path.
+        @vad<dict> -- `rtp.vad` settings.
+        """
+        self.path = path
+        self.writer = WavWriter(path, detector=create_detector(path, vad))
+        self.skipped = 0  # payloads that are not G.711.
+
+    def write(self, packet):
+        """ append the decoded payload of an audio packet.
+        @packet<RtpPacket> -- RTP packet in sequence order.
+        """
+        if packet.payload_type not in AUDIO_PAYLOAD_TYPES:
+            return
+        if not self.writer.write(packet.payload, packet.payload_type):
+            self.skipped += 1
+
+    def close(self):
+        self.writer.close()
+        if self.skipped:
+            logger.warning("<rtp>: %s payloads of %s could not be decoded.", self.skipped, self.path)
+
+
+# recording sinks indexed by `rtp.recorder.format`; "stereo" mixes both legs
+# into one file instead.
+SINKS = {
+    "raw": RawFileSink,
+    "wav": WavFileSink,
+}
+
+
+class RecordingLeg(object):
+    """ receive path of one RTP stream.
+    """
+
+    __slots__ = ("call_id", "name", "jitter", "sink", "stats", "dtmf", "clock", "packets", "invalid", "failed")
+
+    def __init__(self, call_id, name, sink, depth=16, clock=time.monotonic):
+        """
+        @call_id<str> -- SIP Call-ID.
+        @name<str> -- "caller" or "agent".
+        @sink<object> -- recording sink.
+        @depth<int> -- jitter buffer depth in packets.
+        @clock<callable> -- monotonic time source.
+        """
+        self.call_id = call_id
+        self.name = name
+        self.jitter = JitterBuffer(depth=depth)
+        self.sink = sink
+        self.stats = StreamStats()
+        self.dtmf = DtmfExtractor()
+        self.clock = clock
+        self.packets = self.invalid = 0  # only increment.
+        self.failed = False  # the sink failed (e.g. disk full): stop writing.
+
+    def receive(self, data):
+        """ handle an RTP datagram.
+        @data<bytes> -- RTP datagram.
+        """
+        packet = parse_rtp_packet(data)
+        if packet is None:
+            self.invalid += 1
+            return
+        self.packets += 1
+        self.stats.update(packet, self.clock())
+        self.dtmf.receive(packet)
+        self.write(self.jitter.push(packet))
+
+    def write(self, packets):
+        """ write packets to the sink; a failed sink only fails its leg.
+        @packets<list> -- RTP packets in sequence order.
+        """
+        if self.failed:
+            return
+        try:
+            for packet in packets:
+                self.sink.write(packet)
+        except OSError as error:
+            self.failed = True
+            logger.error("<rtp>: stopped recording %s leg of %s: %s", self.name, self.call_id, error)
+
+    def close(self):
+        self.dtmf.close()
+        self.write(self.jitter.flush())
+        self.sink.close()
+
+
+class RTPLegProtocol(asyncio.DatagramProtocol):
+    """ RTP datagram protocol of one call leg.
+    """
+
+    def __init__(self, leg):
+        """
+        @leg<RecordingLeg> -- call leg.
+        """
+        self.leg = leg
+
+    def datagram_received(self, data, addr):
+        self.leg.receive(data)
+
+    def error_received(self, error):
+        logger.error("<rtp>: %s leg of %s: %s", self.leg.name, self.leg.call_id, error)
+
+
+class CallRecording(object):
+    """ ports, transports, and legs of a recorded call.
+    """
+
+    __slots__ = ("call_id", "ports", "transports", "legs")
+
+    def __init__(self, call_id, ports):
+        self.call_id = call_id
+        self.ports = ports
+        self.transports = []
+        self.legs = []
+
+    def close(self):
+        for transport in self.transports:
+            transport.close()
+        for leg in self.legs:
+            try:  # finalize every leg even if one fails.
+                leg.close()
+            except (OSError, ValueError) as error:
+                logger.error("<rtp>: failed to finalize %s leg of %s: %s", leg.name, self.call_id, error)
+
+
+class RTPRecorder(object):
+    """ built-in RTP handler.
+
+    Instead of asking an external handler for RX/TX ports, the recorder
+    allocates them itself, receives both legs of the call on the event loop,
+    and writes them to disk until the call is stopped.
+    """
+
+    def __init__(self, settings=None, sink=None):
+        """
+        @settings<dict> -- `config.json`
+        @sink<type> -- recording sink of each leg (default: by format).
+        """
+        recorder = settings["rtp"].get("recorder", {})
+        self.format = recorder.get("format", "wav")
+        if sink is None and self.format != "stereo":
+            sink = SINKS[self.format]
+        self.host = recorder.get("host", "0.0.0.0")
+        # address advertised in SDP.
+        self.address = recorder.get("address") or settings["sip"]["server"]["address"]
+        self.directory = recorder.get("directory", os.path.join(os.path.curdir, "recordings"))
+        self.depth = int(recorder.get("jitter", 16))
+        self.allocator = PortAllocator(*recorder.get("ports", (20000, 30000)))
+        self.sink = sink  # None to mix both legs.
+        self.vad = settings["rtp"].get("vad")  # silence detection of each recording.
+        self.calls = {}  # CallRecording indexed by Call-ID.
+        os.makedirs(self.directory, exist_ok=True)
+
+    def __repr__(self):
+        return "RTPRecorder(calls=%s, free=%s)" % (len(self.calls), len(self.allocator))
+
+    def __len__(self):
+        return len(self.calls)
+
+    async def start(self, call_id):
+        """ open RX/TX ports of a call and return them as a handler reply.
+        @call_id<str> -- SIP Call-ID.
+        """
+        recording = self.calls.get(call_id)
+        if recording is None:
+            recording = self.calls[call_id] = await self.open(call_id)
+        tx_port, rx_port = recording.ports
+        return {"Call-ID": call_id, "TxPort": tx_port, "RxPort": rx_port}
+
+    def create_sinks(self, call_id):
+        """ return the recording sink of each leg of a call.
+        @call_id<str> -- SIP Call-ID.
+        """
+        if self.sink is None:
+            path = get_recording_path(self.directory, call_id, "stereo", "wav")
+            mixer = StereoMixer(path, detector=create_detector(path, self.vad, channels=2))
+            return [MixerChannel(mixer, channel) for channel in range(len(LEGS))]
+        return [
+            self.sink(get_recording_path(self.directory, call_id, name, self.sink.extension), vad=self.vad)
+            for name in LEGS
+        ]
+
+    async def open(self, call_id):
+        loop = asyncio.get_running_loop()
+        for _ in range(8):  # skip ports taken by other processes.
+            ports = self.allocator.allocate()
+            if ports is None:
+                raise OSError("no free RTP ports.")
+            recording = CallRecording(call_id, ports)
+            for (name, sink) in zip(LEGS, self.create_sinks(call_id)):
+                recording.legs.append(RecordingLeg(call_id, name, sink, depth=self.depth))
+            try:
+                for (leg, port) in zip(recording.legs, ports):
+                    transport, _ = await loop.create_datagram_endpoint(
+                        lambda: RTPLegProtocol(leg), local_addr=(self.host, port)
+                    )
+                    recording.transports.append(transport)
+            except OSError as error:
+                logger.warning("<rtp>: failed to open ports %s: %s", ports, error)
+                recording.close()
+                self.allocator.release(ports)
+                continue
+            logger.info("<rtp>: recording %s on ports %s", call_id, ports)
+            return recording
+        raise OSError("failed to open RTP ports.")
+
+    def get_stream_stats(self, call_id):
+        """ return reception statistics of each leg of a call (or None).
+        @call_id<str> -- SIP Call-ID.
+        """
+        recording = self.calls.get(call_id)
+        if recording is None:
+            return
+        return {leg.name: leg.stats for leg in recording.legs}
+
+    def get_dtmf_events(self, call_id):
+        """ return the DTMF events of each leg of a call (or None).
+        @call_id<str> -- SIP Call-ID.
+        """
+        recording = self.calls.get(call_id)
+        if recording is None:
+            return
+        return {leg.name: leg.dtmf.events for leg in recording.legs}
+
+    def get_recording_paths(self, call_id):
+        """ return the recording paths of a call (or None).
+        @call_id<str> -- SIP Call-ID.
+        """
+        recording = self.calls.get(call_id)
+        if recording is None:
+            return
+        # both legs share one path when they are mixed.
+        return list(OrderedDict.fromkeys(leg.sink.path for leg in recording.legs))
+
+    def stop(self, call_id):
+        """ close RX/TX ports of a call and finish its recording.
+        @call_id<str> -- SIP Call-ID.
+        """
+        recording = self.calls.pop(call_id, None)
+        if recording is None:
+            return
+        recording.close()
+        self.allocator.release(recording.ports)
+        logger.info("<rtp>: stopped recording %s", call_id)
+        return recording
+
+    def close(self):
+        for call_id in list(self.calls):
+            self.stop(call_id)
@@ -1,3 +1,278 @@
 # Copyright 2018 (c) Herbert Shin  https://github.com/initbar/sipd
 #
 # This source code is licensed under the MIT license.
+
+"""
+sipd.rtp.router
+------------------
+"""
+
+from __future__ import absolute_import
+from collections import deque
+
+import logging
+import time
+
+from ..lib.hashring import ConsistentHashRing
+
+logger = logging.getLogger()
+
+__all__ = ["RTPBalancer", "RTPHandler", "STRATEGIES"]
+
+STRATEGIES = ("round-robin", "least-outstanding", "consistent-hash")
+
+# circuit breaker states.
+CLOSED = "closed"  # in rotation.
+OPEN = "open"  # out of rotation until the cooldown passes.
+HALF_OPEN = "half-open"  # a single probe request decides.
+
+
+class RTPHandler(object):
+    """ RTP handler health and counters.
+    """
+
+    __slots__ = (
+        "endpoint",
+        "weight",
+        "state",
+        "opened_at",
+        "outstanding",
+        "requests",
+        "replies",
+        "timeouts",
+        "failures",
+        "consecutive_failures",
+        "latency",
+        "latencies",
+        "current_weight",
+    )
+
+    def __init__(self, endpoint, weight=1, window=64):
+        """
+        @endpoint<tuple> -- RTP handler (address, port).
+        @weight<int> -- relative share of requests.
+        @window<int> -- number of recent reply latencies kept.
+        """
+        self.endpoint = endpoint
+        self.weight = max(1, int(weight))
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.outstanding = 0
+        self.requests = self.replies = self.timeouts = self.failures = 0  # only increment.
+        self.consecutive_failures = 0
+        self.latency = 0.0  # moving average in seconds.
+        self.latencies = deque(maxlen=window)
+        self.current_weight = 0  # smooth weighted round-robin state.
+
+    def __repr__(self):
+        return "RTPHandler(endpoint=%s, state=%s, outstanding=%s, latency=%.6f)" % (
+            self.endpoint,
+            self.state,
+            self.outstanding,
+            self.latency,
+        )
+
+    @property
+    def name(self):
+        return "%s:%s" % self.endpoint
+
+    def percentile(self, percentile):
+        """ return a percentile of the recent reply latencies.
+        @percentile<float> -- 0 to 100.
+        """
+        if not self.latencies:
+            return self.latency
+        latencies = sorted(self.latencies)
+        index = int(round(percentile / 100.0 * (len(latencies) - 1)))
+        return latencies[min(max(index, 0), len(latencies) - 1)]
+
+    def counters(self):
+        return {
+            "state": self.state,
+            "weight": self.weight,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "replies": self.replies,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "latency": self.latency,
+        }
+
+
+class RTPBalancer(object):
+    """ RTP handler balancer.
+
+    Handlers are picked by one of the following strategies:
+
+    - "round-robin": smooth weighted round-robin.
+    - "least-outstanding": fewest requests in flight relative to weight,
+      ties broken by reply latency.
+    - "consistent-hash": the handler that owns the Call-ID on a hash ring,
+      or the next handler on the ring while it is unavailable.
+
+    Health is tracked passively from request outcomes. After
+    `failure_threshold` consecutive timeouts or errors, a handler's circuit
+    opens and it is taken out of rotation. Once `cooldown` seconds pass, one
+    probe request is let through: a reply closes the circuit again and a
+    failure re-opens it.
+    """
+
+    def __init__(
+            self,
+            handlers=(),
+            strategy="round-robin",
+            failure_threshold=3,
+            cooldown=5.0,
+            alpha=0.2,
+            clock=time.monotonic):
+        """
+        @handlers<list> -- RTPHandler objects.
+        @strategy<str> -- one of STRATEGIES.
+        @failure_threshold<int> -- consecutive failures that open a circuit.
+        @cooldown<float> -- seconds before an open circuit is probed.
+        @alpha<float> -- latency moving average smoothing factor.
+        @clock<callable> -- monotonic time source.
+        """
+        if strategy not in STRATEGIES:
+            raise ValueError("unknown balancer strategy: '%s'." % strategy)
+        self.handlers = list(handlers)
+        self.strategy = strategy
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.alpha = alpha
+        self.clock = clock
+        self.ring = ConsistentHashRing(self.handlers, name=lambda handler: handler.name)
+        self._select = {
+            "round-robin": self.select_round_robin,
+            "least-outstanding": self.select_least_outstanding,
+            "consistent-hash": self.select_consistent_hash,
+        }[strategy]
+
+    def __repr__(self):
+        return "RTPBalancer(strategy=%s, handlers=%s)" % (self.strategy, self.handlers)
+
+    def __len__(self):
+        return len(self.handlers)
+
+    def is_available(self, handler):
+        """ check if a handler may receive a request.
+        @handler<RTPHandler> -- RTP handler.
+        """
+        if handler.state == CLOSED:
+            return True
+        if handler.state == OPEN and self.clock() - handler.opened_at >= self.cooldown:
+            handler.state = HALF_OPEN
+            logger.info("<rtp>: probing %s", handler.name)
+        # only one probe at a time.
+        return handler.state == HALF_OPEN and not handler.outstanding
+
+    def available(self):
+        """ return every handler in rotation.
+        """
+        return [handler for handler in self.handlers if self.is_available(handler)]
+
+    def spread(self, count):
+        """ return `count` handlers to send concurrent requests to.
+        @count<int> -- number of requests.
+
+        Requests are spread round-robin over the handlers in rotation, but
+        a half-open handler is only given the one probe.
+        """
+        handlers = self.available()
+        probes = [handler for handler in handlers if handler.state == HALF_OPEN][:count]
+        closed = [handler for handler in handlers if handler.state == CLOSED]
+        if not closed:
+            return probes
+        return probes + [closed[i % len(closed)] for i in range(count - len(probes))]
+
+    def select(self, call_id=None, exclude=()):
+        """ return the handler for a request (or None).
+        @call_id<str> -- SIP Call-ID.
+        @exclude<iterable> -- handlers not to pick.
+        """
+        return self._select(call_id, exclude)
+
+    def select_round_robin(self, call_id, exclude):
+        candidates = [h for h in self.available() if h not in exclude]
+        if not candidates:
+            return
+        total = 0
+        chosen = None
+        for handler in candidates:
+            handler.current_weight += handler.weight
+            total += handler.weight
+            if chosen is None or handler.current_weight > chosen.current_weight:
+                chosen = handler
+        chosen.current_weight -= total
+        return chosen
+
+    def select_least_outstanding(self, call_id, exclude):
+        candidates = [h for h in self.available() if h not in exclude]
+        if not candidates:
+            return
+        return min(candidates, key=lambda h: (h.outstanding / h.weight, h.latency))
+
+    def select_consistent_hash(self, call_id, exclude):
+        if call_id is None:
+            return self.select_least_outstanding(call_id, exclude)
+        for handler in self.ring.iterate(call_id):
+            if handler not in exclude and self.is_available(handler):
+                return handler
+
+    #
+    # request outcomes
+    #
+
+    def begin(self, handler):
+        """ record a request and return its start time.
+        @handler<RTPHandler> -- RTP handler.
+        """
+        handler.outstanding += 1
+        handler.requests += 1
+        return self.clock()
+
+    def success(self, handler, started):
+        """ record a reply.
+        @handler<RTPHandler> -- RTP handler.
+        @started<float> -- request start time.
+        """
+        latency = self.clock() - started
+        handler.outstanding -= 1
+        handler.replies += 1
+        handler.consecutive_failures = 0
+        handler.latencies.append(latency)
+        if handler.replies == 1:
+            handler.latency = latency
+        else:
+            handler.latency += self.alpha * (latency - handler.latency)
+        if handler.state != CLOSED:
+            handler.state = CLOSED
+            logger.info("<rtp>: %s is back in rotation.", handler.name)
+
+    def failure(self, handler, timeout=True):
+        """ record a timeout or an error.
+        @handler<RTPHandler> -- RTP handler.
+        @timeout<bool> -- request timed out (otherwise, errored).
+        """
+        handler.outstanding -= 1
+        if timeout:
+            handler.timeouts += 1
+        else:
+            handler.failures += 1
+        handler.consecutive_failures += 1
+        if handler.state == HALF_OPEN or (
+                handler.state == CLOSED and handler.consecutive_failures >= self.failure_threshold):
+            handler.state = OPEN
+            handler.opened_at = self.clock()
+            logger.warning("<rtp>: %s is out of rotation: %s", handler.name, handler.counters())
+
+    def cancel(self, handler):
+        """ record a request that was abandoned before its outcome.
+        @handler<RTPHandler> -- RTP handler.
+        """
+        handler.outstanding -= 1  # a half-open handler may be probed again.
+
+    def counters(self):
+        """ return counters of every handler indexed by handler name.
+        """
+        return {handler.name: handler.counters() for handler in self.handlers}
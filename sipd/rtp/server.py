@@ -2,16 +2,20 @@
 #
 # This source code is licensed under the MIT license.
 
+import asyncio
+import json
 import logging
-import random
-import time
+import socket
 
-from src.parser import dump_json
-from src.parser import parse_json
-from src.rtp.start import RTPD_START
-from src.rtp.stop import RTPD_STOP
-from src.sockets import safe_allocate_random_udp_socket
-from src.sockets import safe_allocate_udp_client
+from ..lib.rtp.start import RTPD_START
+from ..lib.rtp.stop import RTPD_STOP
+from ..net.udp import safe_allocate_random_udp_socket
+from ..net.udp import safe_allocate_udp_client
+from .batch import StopSignalBatch
+from .client import RTPControlClient
+from .client import parse_reply
+from .router import RTPBalancer
+from .router import RTPHandler
 
 logger = logging.getLogger()
 
@@ -22,93 +26,172 @@ class RTPRouter(object):
 
     def __init__(self, setting={}):
         self.setting = setting
-        self.handlers = filter(  # filter by enabled routers.
+        self.handlers = list(filter(  # filter by enabled routers.
             lambda handler: handler["enabled"], setting["rtp"]["handlers"]
+        ))
+
+        # balance requests over healthy handlers.
+        rtp = setting["rtp"]
+        self.balancer = RTPBalancer(
+            [
+                RTPHandler(endpoint, weight=handler.get("weight", 1))
+                for (handler, endpoint) in zip(
+                    self.handlers, map(self.resolve_handler_endpoint, self.handlers)
+                )
+                if endpoint
+            ],
+            strategy=rtp.get("balancer", "round-robin"),
+            failure_threshold=int(rtp.get("failure_threshold", 3)),
+            cooldown=float(rtp.get("cooldown", 5.0)),
         )
 
+        # coalesce stop signals until the next flush.
+        self.stops = None
+        stop_batch = rtp.get("stop_batch", {})
+        if stop_batch.get("enabled"):
+            self.stops = StopSignalBatch(self.handlers, mtu=int(stop_batch.get("mtu", 1400)))
+
         # logging context
         self.context = ""
         logger.debug("<rtp>: successfully loaded RTP configuration.")
         logger.debug("<rtp>: successfully initialized RTP handler.")
 
-    def get_random_handler(self):
-        """ return random handler.
+    def get_handler(self, call_id=None, exclude=()):
+        """ return the balanced handler of a call.
+        @call_id<str> -- SIP Call-ID.
+        @exclude<iterable> -- handlers not to pick.
         """
-        try:
-            handler = random.choice(self.handlers)
-        except IndexError:
-            handler = None
+        handler = self.balancer.select(call_id=call_id, exclude=exclude)
+        if handler is None:
+            logger.warning("<rtp>: all handlers are currently disabled or down.")
         return handler
 
-    def get_random_handler_address(self):
-        """ return random handler address.
+    def resolve_handler_endpoint(self, handler):
+        """ return (address, port) of a handler.
+        @handler<dict> -- RTP handler configuration.
         """
-        try:
-            handler = self.get_random_handler()
-            logger.info("%s <rtp>: balancing to %s", self.context, server)
-            server = (address, port) = handler["host"], int(handler["port"])
-            return address
-        except AttributeError as error:
-            logger.error("%s <rtp>: no handler enabled: %s", self.context, error)
-        except KeyError as error:
-            logger.error("%s <rtp>: no handler enabled: %s", self.context, error)
+        handler_endpoint = [handler.get("host"), int(handler.get("port"))]
+        if not all(handler_endpoint):  # check for None.
+            return
+        elif handler_endpoint[0] == "127.0.0.1":  # resolve localhost.
+            server_address = self.setting["sip"]["server"]["address"]
+            handler_endpoint[0] = server_address
+        return tuple(handler_endpoint)
+
+    def update_message(self, message, handler_address, reply):
+        """ append static SDP of the handler's RX/TX ports to the message.
+        @message<SipMessage> -- SIP message.
+        @handler_address<str> -- RTP handler address.
+        @reply<bytes|dict> -- RTP handler reply.
+        """
+        # parse RX/TX ports; an invalid reply is logged and answered without SDP.
+        rxtx_ports = parse_reply(reply, handler_address) if isinstance(reply, bytes) else reply
+        if not isinstance(rxtx_ports, dict):
+            return
+        tx_port, rx_port = rxtx_ports.get("TxPort"), rxtx_ports.get("RxPort")
+        logger.info("%s <rtp>: RxPort = %s", self.context, rx_port)
+        logger.info("%s <rtp>: TxPort = %s", self.context, tx_port)
+        message.sdp.extend(generate_static_sdp(handler_address, tx_port, rx_port))
+        return message  # updated message.
+
+
+def generate_start_signal(call_id, session_id=""):
+    """ populate RTP start template with existing message data.
+    @call_id<str> -- SIP Call-ID.
+    @session_id<str> -- Genesys GVP session ID.
+    """
+    template = dict(RTPD_START)
+    template["Call-ID"] = call_id
+    template["X-Genesys-GVP-Session-ID"] = session_id
+    return json.dumps(template).encode()
+
+
+def generate_stop_signal(call_id):
+    """ populate RTP stop template.
+    @call_id<str> -- SIP Call-ID.
+    """
+    template = dict(RTPD_STOP)
+    template["Call-ID"] = call_id
+    return json.dumps(template).encode()
+
+
+def generate_static_sdp(handler_address, tx_port, rx_port):
+    """ generate static SDP data.
+    @handler_address<str> -- RTP handler address.
+    @tx_port<int> -- caller port.
+    @rx_port<int> -- agent port.
+    """
+    return [
+        "o=- 0 0 IN IP4 %s" % handler_address,
+        "v=0",
+        "s=phone-call",
+        "c=IN IP4 %s" % handler_address,
+        "t=0 0",
+        # [caller]
+        "m=audio %s RTP/AVP 0 8 18 96" % tx_port,
+        "a=rtpmap:0 PCMU/8000",
+        "a=rtpmap:8 PCMA/8000",
+        "a=rtpmap:18 G729/8000",  # G729/8000
+        "a=rtpmap:96 telephone-event/8000",
+        "a=fmtp:96 0-15",
+        "a=recvonly",
+        "a=ptime:20",
+        "a=maxptime:1000",
+        # [agent]
+        "m=audio %s RTP/AVP 0 8 18 96" % rx_port,
+        "a=rtpmap:0 PCMU/8000",
+        "a=rtpmap:8 PCMA/8000",
+        "a=rtpmap:18 G729/8000",  # G729/8000
+        "a=rtpmap:96 telephone-event/8000",
+        "a=fmtp:96 0-15",
+        "a=recvonly",
+        "a=ptime:20",
+        "a=maxptime:1000",
+    ]
 
 
 class SynchronousRTPRouter(RTPRouter):
     """ RTP router implementation.
     """
 
-    def handle(self, datagram, action="start"):
+    def handle(self, message, action="start"):
         """
-        @datagram<dict> -- SIP response datagram.
+        @message<SipMessage> -- SIP message.
         @action<str> -- RTP handler action.
         """
-        if not datagram:
+        if not message:
             return
         if action == "start":  # request external handler to open RX/TX ports.
-            return self.send_start_signal(datagram=datagram)
+            return self.send_start_signal(message=message)
         else:  # request external handler to close RX/TX ports.
-            call_id = datagram["sip"].get("Call-ID")
-            return self.send_stop_signal(call_id=call_id)
+            return self.send_stop_signal(call_id=message.call_id)
 
-    def send_start_signal(self, datagram):
+    def send_start_signal(self, message):
         """ request external handler to open RX/TX ports.
-        @datagram<dict> -- SIP response datagram.
+        @message<SipMessage> -- SIP message.
         """
-        if not datagram:
+        if not message:
             return
-
-        handler = self.get_random_handler()
+        handler = self.get_handler(message.call_id)
         if not handler:
-            logger.warning("<rtp>: all handlers are currently disabled.")
-            return
-
-        handler_endpoint = [handler.get("host"), int(handler.get("port"))]
-        if not all(handler_endpoint):  # check for None.
             return
-        elif handler_endpoint[0] == "127.0.0.1":  # resolve localhost.
-            server_address = self.setting["sip"]["server"]["address"]
-            handler_endpoint[0] = server_address
-        handler_address = handler_endpoint[0]
-
-        # populate RTP template with existing datagram data.
-        template = RTPD_START
-        params = ["Call-ID", "X-Genesys-GVP-Session-ID"]
-        for param in params:
-            template[param] = datagram["sip"].get(param, "")
+        handler_endpoint = handler.endpoint
 
         # request to receive RX/TX port information.
-        json_template = dump_json(template)
+        started = self.balancer.begin(handler)
         with safe_allocate_random_udp_socket() as udp_socket:
-            udp_socket.sendto(json_template, tuple(handler_endpoint))
-            logger.debug(
-                "%s <<< <rtp>: requesting ports from %s", self.context, handler_endpoint
+            start_signal = generate_start_signal(
+                message.call_id, message.get("X-Genesys-GVP-Session-ID", "")
             )
-            logger.debug(
-                "%s <rtp>: waiting response from %s", self.context, handler_endpoint
-            )
-            try:
-                socket_data = udp_socket.recvfrom(0xff)
+            try:  # every outcome is recorded, or a probe would never end.
+                udp_socket.sendto(start_signal, handler_endpoint)
+                logger.debug(
+                    "%s <<< <rtp>: requesting ports from %s", self.context, handler_endpoint
+                )
+                logger.debug(
+                    "%s <rtp>: waiting response from %s", self.context, handler_endpoint
+                )
+                socket_data = udp_socket.recvfrom(0xffff)
                 logger.debug("%s <rtp>: %s is up.", self.context, handler_endpoint)
                 logger.debug(
                     "%s >>> <rtp>: received %s from %s",
@@ -117,50 +200,14 @@ class SynchronousRTPRouter(RTPRouter):
                     handler_endpoint,
                 )
             except Exception as message:
+                self.balancer.failure(handler, timeout=isinstance(message, socket.timeout))
                 logger.error(
                     "%s <rtp>: %s is down: %s", self.context, handler_endpoint, message
                 )
                 return
+        self.balancer.success(handler, started)
 
-        # parse RX/TX ports.
-        rxtx_ports = str(socket_data[0])
-        rxtx_ports = parse_json(rxtx_ports)
-
-        # generate static SDP data.
-        tx_port, rx_port = rxtx_ports.get("TxPort"), rxtx_ports.get("RxPort")
-        logger.info("%s <rtp>: RxPort = %s", self.context, rx_port)
-        logger.info("%s <rtp>: TxPort = %s", self.context, tx_port)
-        static_sdp = [
-            "o=- 0 0 IN IP4 %s" % handler_address,
-            "v=0",
-            "s=phone-call",
-            "c=IN IP4 %s" % handler_address,
-            "t=0 0",
-            # [caller]
-            "m=audio %s RTP/AVP 0 8 18 96" % tx_port,
-            "a=rtpmap:0 PCMU/8000",
-            "a=rtpmap:8 PCMA/8000",
-            "a=rtpmap:18 G729/8000",  # G729/8000
-            "a=rtpmap:96 telephone-event/8000",
-            "a=fmtp:96 0-15",
-            "a=recvonly",
-            "a=ptime:20",
-            "a=maxptime:1000",
-            # [agent]
-            "m=audio %s RTP/AVP 0 8 18 96" % rx_port,
-            "a=rtpmap:0 PCMU/8000",
-            "a=rtpmap:8 PCMA/8000",
-            "a=rtpmap:18 G729/8000",  # G729/8000
-            "a=rtpmap:96 telephone-event/8000",
-            "a=fmtp:96 0-15",
-            "a=recvonly",
-            "a=ptime:20",
-            "a=maxptime:1000",
-        ]
-        for sdp in static_sdp:
-            datagram["sdp"].append(sdp)
-
-        return datagram  # updated datagram.
+        return self.update_message(message, handler_endpoint[0], socket_data[0])
 
     def send_stop_signal(self, call_id):
         """ request external handler to close RX/TX ports.
@@ -168,10 +215,254 @@ class SynchronousRTPRouter(RTPRouter):
         """
         if not call_id:
             return
+        if self.stops is not None:
+            self.stops.add(call_id)  # sent at the next flush.
+            return
         # signal all handlers to remove Call-ID.
-        template = RTPD_STOP
-        template["Call-ID"] = call_id
+        stop_signal = generate_stop_signal(call_id)
         with safe_allocate_udp_client() as client:
             for handler in self.handlers:
                 handler_endpoint = (handler["host"], int(handler["port"]))
-                client.sendto(dump_json(template), handler_endpoint)
+                client.sendto(stop_signal, handler_endpoint)
+
+    def get_stream_stats(self, call_id):
+        """ return reception statistics of each leg of a call (or None).
+        @call_id<str> -- SIP Call-ID.
+
+        External handlers receive RTP themselves, so there are none here.
+        """
+        return
+
+    def get_dtmf_events(self, call_id):
+        """ return the DTMF events of each leg of a call (or None).
+        @call_id<str> -- SIP Call-ID.
+        """
+        return
+
+    def get_recording_paths(self, call_id):
+        """ return the recording paths of a call (or None).
+        @call_id<str> -- SIP Call-ID.
+        """
+        return
+
+    def flush_stop_signals(self):
+        """ send coalesced stop signals.
+        """
+        if not self.stops:
+            return
+        with safe_allocate_udp_client() as client:
+            self.stops.flush(client.sendto)
+
+
+class AsynchronousRTPRouter(SynchronousRTPRouter):
+    """ RTP router implementation for the event loop.
+
+    Start signals are pipelined through one long-lived control client per
+    handler and awaited instead of blocking the worker on the handler's
+    reply. Stop signals are fire-and-forget datagrams and are still sent
+    immediately.
+
+    With hedging enabled, a start signal that is not answered within a
+    percentile of the handler's recent reply latencies is also sent to a
+    second handler. The first reply wins, and the other handler is told to
+    stop right away.
+    """
+
+    def __init__(self, setting={}):
+        super().__init__(setting)
+        self.clients = {}  # RTPControlClient indexed by handler endpoint.
+        self.pool = None  # optional PortLeasePool.
+        self.recorder = None  # optional built-in RTPRecorder.
+        self.hedge = setting["rtp"].get("hedge", {})
+        self.hedges = self.hedge_wins = 0  # only increment.
+
+    def handle(self, message, action="start"):
+        """
+        @message<SipMessage> -- SIP message.
+        @action<str> -- RTP handler action.
+
+        "start" returns an awaitable of the updated message.
+        """
+        if action == "start":
+            return self.send_start_signal(message=message)
+        return super().handle(message=message, action=action)
+
+    def get_client(self, handler_endpoint):
+        """ return the control client of a handler.
+        @handler_endpoint<tuple> -- RTP handler (address, port).
+        """
+        client = self.clients.get(handler_endpoint)
+        if client is None:
+            timeout = float(self.setting["rtp"].get("timeout", 1.0))
+            client = self.clients[handler_endpoint] = RTPControlClient(handler_endpoint, timeout)
+        return client
+
+    async def request(self, handler, call_id, payload):
+        """ send a request to a handler and return its reply.
+        @handler<RTPHandler> -- RTP handler.
+        @call_id<str> -- SIP Call-ID of the request.
+        @payload<bytes> -- JSON request.
+        """
+        client = self.get_client(handler.endpoint)
+        started = self.balancer.begin(handler)
+        try:
+            reply = await client.request(call_id, payload)
+        except asyncio.TimeoutError:
+            self.balancer.failure(handler, timeout=True)
+            raise
+        except OSError:
+            self.balancer.failure(handler, timeout=False)
+            raise
+        except asyncio.CancelledError:
+            self.balancer.cancel(handler)
+            raise
+        self.balancer.success(handler, started)
+        return reply
+
+    def get_hedge_delay(self, handler):
+        """ return how long to wait on a handler before hedging.
+        @handler<RTPHandler> -- RTP handler.
+        """
+        if len(handler.latencies) < int(self.hedge.get("min_samples", 16)):
+            # too few replies to estimate the latency distribution.
+            return float(self.setting["rtp"].get("timeout", 1.0)) / 2
+        delay = handler.percentile(float(self.hedge.get("percentile", 95)))
+        return max(float(self.hedge.get("min_delay", 0.005)), delay)
+
+    async def hedged_request(self, handler, call_id, payload):
+        """ send a request to a handler (and to a second one if it is slow)
+        and return the first (handler, reply).
+        @handler<RTPHandler> -- RTP handler.
+        @call_id<str> -- SIP Call-ID of the request.
+        @payload<bytes> -- JSON request.
+        """
+        tasks = {asyncio.ensure_future(self.request(handler, call_id, payload)): handler}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.get_hedge_delay(handler))
+            if not done or next(iter(done)).exception() is not None:
+                hedge = self.balancer.select(call_id=call_id, exclude=[handler])
+                if hedge is not None:
+                    logger.debug("%s <rtp>: hedging %s to %s", self.context, call_id, hedge.name)
+                    self.hedges += 1
+                    tasks[asyncio.ensure_future(self.request(hedge, call_id, payload))] = hedge
+
+            # the first reply wins; errors only count once every request failed.
+            pending, winner, error = set(tasks), None, None
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        break
+                    error = task.exception()
+            if winner is None:
+                raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        # the other handler may have opened ports already: close them.
+        for (task, loser) in tasks.items():
+            if task is winner:
+                continue
+            if not task.done() or task.cancelled() or task.exception() is None:
+                self.get_client(loser.endpoint).send(generate_stop_signal(call_id))
+        if tasks[winner] is not handler:
+            self.hedge_wins += 1
+        return (tasks[winner], winner.result())
+
+    async def send_start_signal(self, message):
+        """ request external handler to open RX/TX ports.
+        @message<SipMessage> -- SIP message.
+        """
+        if not message:
+            return
+        if self.recorder is not None:
+            return await self.record(message)
+        handler = self.get_handler(message.call_id)
+        if not handler:
+            return
+        handler_endpoint = handler.endpoint
+
+        start_signal = generate_start_signal(
+            message.call_id, message.get("X-Genesys-GVP-Session-ID", "")
+        )
+        logger.debug("%s <<< <rtp>: requesting ports from %s", self.context, handler_endpoint)
+        try:
+            if self.hedge.get("enabled") and len(self.balancer) > 1:
+                (handler, reply) = await self.hedged_request(handler, message.call_id, start_signal)
+                handler_endpoint = handler.endpoint
+            else:
+                reply = await self.request(handler, message.call_id, start_signal)
+        except asyncio.TimeoutError:
+            logger.error("%s <rtp>: %s is down: timeout", self.context, handler_endpoint)
+            return
+        except OSError as error:
+            logger.error("%s <rtp>: %s is down: %s", self.context, handler_endpoint, error)
+            return
+        logger.debug("%s >>> <rtp>: received %s from %s", self.context, reply, handler_endpoint)
+
+        return self.update_message(message, handler_endpoint[0], reply)
+
+    async def record(self, message):
+        """ open RX/TX ports on the built-in recorder.
+        @message<SipMessage> -- SIP message.
+        """
+        try:
+            reply = await self.recorder.start(message.call_id)
+        except OSError as error:
+            logger.error("%s <rtp>: recorder is unavailable: %s", self.context, error)
+            return
+        return self.update_message(message, self.recorder.address, reply)
+
+    def lease_ports(self, message):
+        """ update the message with pre-fetched RX/TX ports, if any.
+        @message<SipMessage> -- SIP message.
+        """
+        if self.pool is None or not message:
+            return
+        lease = self.pool.take(message.call_id)
+        if lease is None:
+            return
+        logger.debug("%s <rtp>: leased %s", self.context, lease)
+        return self.update_message(message, lease.address, {"TxPort": lease.tx_port, "RxPort": lease.rx_port})
+
+    def get_stream_stats(self, call_id):
+        """ return reception statistics of each leg of a call (or None).
+        @call_id<str> -- SIP Call-ID.
+        """
+        if self.recorder is not None:
+            return self.recorder.get_stream_stats(call_id)
+
+    def get_dtmf_events(self, call_id):
+        """ return the DTMF events of each leg of a call (or None).
+        @call_id<str> -- SIP Call-ID.
+        """
+        if self.recorder is not None:
+            return self.recorder.get_dtmf_events(call_id)
+
+    def get_recording_paths(self, call_id):
+        """ return the recording paths of a call (or None).
+        @call_id<str> -- SIP Call-ID.
+        """
+        if self.recorder is not None:
+            return self.recorder.get_recording_paths(call_id)
+
+    def send_stop_signal(self, call_id):
+        """ request external handler to close RX/TX ports.
+        @call_id<str> -- SIP Call-ID.
+        """
+        if self.recorder is not None:
+            self.recorder.stop(call_id)
+            return
+        if self.pool is not None:
+            # leased ports are known to the handler by their lease ID.
+            call_id = self.pool.unbind(call_id)
+        super().send_stop_signal(call_id)
+
+    def close(self):
+        for client in self.clients.values():
+            client.close()
+        self.clients.clear()
+        if self.recorder is not None:
+            self.recorder.close()
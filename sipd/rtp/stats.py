@@ -0,0 +1,171 @@
+# Copyright 2018 (c) Herbert Shin  https://github.com/initbar/sipd
+#
+# This source code is licensed under the MIT license.
+
+"""
+sipd.rtp.stats
+------------------
+"""
+
+from __future__ import absolute_import
+
+import logging
+
+from .packet import MAX_DROPOUT
+from .packet import MAX_MISORDER
+
+logger = logging.getLogger()
+
+__all__ = ["StreamStats"]
+
+# sequence numbers remembered behind the highest one to detect duplicates.
+HISTORY = 64
+
+
+class StreamStats(object):
+    """ RTP stream reception statistics.
+
+    Updated in O(1) per packet in arrival order, without keeping packets:
+
+    - loss: expected packets (extended highest sequence number minus the
+      first one) minus unique packets received (RFC 3550, A.3).
+    - duplicates: detected within the last `HISTORY` sequence numbers.
+    - reordered: packets arriving after a higher sequence number.
+    - jitter: interarrival jitter estimate in timestamp units (RFC 3550, A.8).
+
+    As in RFC 3550 A.1 (and the JitterBuffer), a new SSRC restarts the
+    sequence numbering, and so does a sequence number more than MAX_DROPOUT
+    ahead or MAX_MISORDER behind once the next packet follows it. The
+    packets expected before a restart are kept, and the jitter's transit
+    time is re-anchored on the first packet after it.
+    """
+
+    __slots__ = (
+        "clock_rate",
+        "ssrc",
+        "bad",
+        "resyncs",
+        "prior",
+        "packets",
+        "octets",
+        "duplicates",
+        "reordered",
+        "base_sequence",
+        "max_sequence",
+        "cycles",
+        "history",
+        "jitter",
+        "arrival",
+        "timestamp",
+    )
+
+    def __init__(self, clock_rate=8000):
+        """
+        @clock_rate<int> -- RTP timestamp units per second.
+        """
+        self.clock_rate = clock_rate
+        self.ssrc = None
+        self.bad = None  # sequence number that would confirm a jump.
+        self.resyncs = 0  # only increment.
+        self.prior = 0  # packets expected before the last restart.
+        self.packets = self.octets = 0  # unique packets.
+        self.duplicates = self.reordered = 0  # only increment.
+        self.base_sequence = self.max_sequence = None
+        self.cycles = 0  # sequence number wraparounds (shifted by 16 bits).
+        self.history = 0  # bit n is set if `max_sequence - n` was received.
+        self.jitter = 0.0
+        self.arrival = self.timestamp = None  # of the previous packet.
+
+    def __repr__(self):
+        return "StreamStats(packets=%s, lost=%s, duplicates=%s, reordered=%s, jitter=%.2fms)" % (
+            self.packets,
+            self.lost,
+            self.duplicates,
+            self.reordered,
+            self.jitter_ms,
+        )
+
+    @property
+    def expected(self):
+        if self.base_sequence is None:
+            return 0
+        return self.prior + self.cycles + self.max_sequence - self.base_sequence + 1
+
+    @property
+    def lost(self):
+        return max(0, self.expected - self.packets)
+
+    @property
+    def jitter_ms(self):
+        return self.jitter * 1000.0 / self.clock_rate
+
+    def update(self, packet, arrival):
+        """ account a received packet.
+        @packet<RtpPacket> -- RTP packet.
+        @arrival<float> -- arrival time in seconds.
+        """
+        sequence = packet.sequence
+        if packet.ssrc != self.ssrc:
+            self.ssrc = packet.ssrc
+            self.resync(sequence)
+        else:
+            ahead = (sequence - self.max_sequence) & 0xffff
+            if ahead == 0:
+                self.duplicates += 1
+                return
+            if MAX_DROPOUT <= ahead < 0x10000 - MAX_MISORDER:
+                if sequence != self.bad:
+                    self.bad = (sequence + 1) & 0xffff
+                    return
+                # two sequential packets after a jump: the sender restarted.
+                self.resync(sequence)
+            elif ahead < MAX_DROPOUT:
+                if sequence < self.max_sequence:
+                    self.cycles += 1 << 16
+                self.history = ((self.history << ahead) | 1) & ((1 << HISTORY) - 1)
+                self.max_sequence = sequence
+            else:
+                behind = 0x10000 - ahead
+                if behind < HISTORY:
+                    if self.history >> behind & 1:
+                        self.duplicates += 1
+                        return
+                    self.history |= 1 << behind
+                self.reordered += 1
+        self.packets += 1
+        self.octets += len(packet.payload)
+
+        if self.arrival is not None:
+            # difference of relative transit times of two packets.
+            elapsed = (packet.timestamp - self.timestamp) & 0xffffffff
+            if elapsed >= 0x80000000:
+                elapsed -= 1 << 32
+            transit = (arrival - self.arrival) * self.clock_rate - elapsed
+            self.jitter += (abs(transit) - self.jitter) / 16.0
+        self.arrival = arrival
+        self.timestamp = packet.timestamp
+
+    def resync(self, sequence):
+        """ start counting sequence numbers over from a packet.
+        @sequence<int> -- sequence number of the packet.
+        """
+        if self.base_sequence is not None:
+            self.prior = self.expected
+            self.resyncs += 1
+        self.base_sequence = self.max_sequence = sequence
+        self.cycles = 0
+        self.history = 1
+        self.bad = None
+        self.arrival = None  # re-anchor the transit time.
+
+    def counters(self):
+        return {
+            "packets": self.packets,
+            "octets": self.octets,
+            "expected": self.expected,
+            "lost": self.lost,
+            "duplicates": self.duplicates,
+            "reordered": self.reordered,
+            "resyncs": self.resyncs,
+            "jitter": round(self.jitter_ms, 3),  # milliseconds.
+        }
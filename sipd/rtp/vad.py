@@ -0,0 +1,149 @@
+# Copyright 2018 (c) Herbert Shin  https://github.com/initbar/sipd
+#
+# This source code is licensed under the MIT license.
+
+"""
+sipd.rtp.vad
+------------------
+"""
+
+from __future__ import absolute_import
+from array import array
+from itertools import groupby
+
+import logging
+import math
+
+from .codec import SAMPLE_RATE
+from .codec import SAMPLE_WIDTH
+from .codec import numpy
+
+logger = logging.getLogger()
+
+__all__ = ["MODES", "EnergyDetector"]
+
+MODES = ("mark", "drop")
+
+
+class EnergyDetector(object):
+    """ energy-based silence detector of a decoded audio stream.
+
+    PCM is classified in frames of `frame` samples: a frame is silent if its
+    RMS level (over every channel of interleaved PCM) is below `threshold`
+    dBFS. With numpy, the level of every frame of a batch is computed at
+    once; otherwise each frame's sum of squares is computed in turn.
+
+    Silent runs of at least `min_silence` seconds are written to a sidecar
+    index as "<start> <end>" lines, in seconds from the start of the stream.
+    In "mark" mode the audio is kept as is; in "drop" mode those runs are
+    also removed from the audio, and the index maps them back to the call
+    timeline. Shorter pauses are always kept.
+    """
+
+    def __init__(self, index, threshold=-50.0, min_silence=1.0, mode="mark", frame=160, channels=1):
+        """
+        @index<str> -- sidecar index path.
+        @threshold<float> -- silence level in dBFS.
+        @min_silence<float> -- shortest silent run indexed (and dropped) in seconds.
+        @mode<str> -- one of MODES.
+        @frame<int> -- samples per classified frame (160 = 20ms).
+        @channels<int> -- number of interleaved channels.
+        """
+        if mode not in MODES:
+            raise ValueError("unknown VAD mode: '%s'." % mode)
+        self.index = index
+        self.mode = mode
+        self.frame = frame
+        self.width = SAMPLE_WIDTH * channels  # octets per sample of every channel.
+        self.level = 32768.0 * math.pow(10.0, threshold / 20.0)  # RMS amplitude.
+        self.energy = self.level * self.level  # mean square.
+        self.min_silence = int(min_silence * SAMPLE_RATE)  # samples.
+        self.position = 0  # samples classified.
+        self.run = None  # sample position the current silent run started at.
+        self.pending = bytearray()  # silence not yet known to be dropped.
+        self.runs = self.dropped = 0  # only increment.
+        self.file = None
+
+    def __repr__(self):
+        return "EnergyDetector(mode=%s, runs=%s, dropped=%.3fs)" % (
+            self.mode,
+            self.runs,
+            float(self.dropped) / SAMPLE_RATE,
+        )
+
+    def classify(self, pcm):
+        """ return whether each frame of a batch is silent.
+        @pcm<bytes> -- 16-bit PCM.
+        """
+        size = self.frame * self.width
+        count = -(-len(pcm) // size)
+        window = size // SAMPLE_WIDTH  # values per frame.
+        if numpy is not None:
+            samples = numpy.frombuffer(pcm, dtype=numpy.int16).astype(numpy.float32)
+            whole = len(pcm) // size * window
+            energy = numpy.square(samples[:whole]).reshape(-1, window).mean(axis=1)
+            silent = (energy < self.energy).tolist()
+            if whole < len(samples):
+                silent.append(bool(numpy.square(samples[whole:]).mean() < self.energy))
+            return silent
+        samples = array("h", pcm)
+        silent = []
+        for i in range(0, count * window, window):
+            values = samples[i:i + window]
+            silent.append(sum(value * value for value in values) < self.energy * len(values))
+        return silent
+
+    def process(self, pcm):
+        """ classify a batch and return the PCM to keep.
+        @pcm<bytes> -- 16-bit PCM.
+        """
+        size = self.frame * self.width
+        kept = bytearray()
+        offset = 0
+        for (silent, frames) in groupby(self.classify(pcm)):
+            chunk = pcm[offset:offset + len(list(frames)) * size]
+            offset += len(chunk)
+            if not silent:
+                kept += self.end_run()
+                kept += chunk
+            elif self.mode == "mark":
+                self.start_run()
+                kept += chunk
+            else:
+                self.start_run()
+                if self.position - self.run < self.min_silence:
+                    self.pending += chunk
+                    if self.position + len(chunk) // self.width - self.run >= self.min_silence:
+                        self.pending = bytearray()  # the run is long: drop it.
+            self.position += len(chunk) // self.width
+        return bytes(kept)
+
+    def start_run(self):
+        if self.run is None:
+            self.run = self.position
+
+    def end_run(self):
+        """ close the current silent run; return its PCM if it is kept.
+        """
+        if self.run is None:
+            return b""
+        (start, self.run) = (self.run, None)
+        pending, self.pending = bytes(self.pending), bytearray()
+        if self.position - start < self.min_silence:
+            return pending
+        self.runs += 1
+        if self.mode == "drop":
+            self.dropped += self.position - start
+        if self.file is None:
+            self.file = open(self.index, "w")
+        self.file.write("%.3f %.3f\n" % (float(start) / SAMPLE_RATE, float(self.position) / SAMPLE_RATE))
+        return b""
+
+    def close(self):
+        """ close the current silent run and the index; return the PCM to keep.
+        """
+        kept = self.end_run()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        return kept
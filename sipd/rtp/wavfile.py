@@ -0,0 +1,158 @@
+# Copyright 2018 (c) Herbert Shin  https://github.com/initbar/sipd
+#
+# This source code is licensed under the MIT license.
+
+"""
+sipd.rtp.wavfile
+------------------
+"""
+
+from __future__ import absolute_import
+
+import errno
+import logging
+import mmap
+import os
+import struct
+
+logger = logging.getLogger()
+
+__all__ = ["MappedWavFile", "generate_wav_header"]
+
+# RIFF/WAVE header of 16-bit linear PCM.
+WAV_HEADER = struct.Struct("<4sI4s4sIHHIIHH4sI")
+
+# preallocation unit; 1MiB is ~65s of 8kHz mono 16-bit audio.
+EXTENT = 1 << 20
+
+
+def generate_wav_header(size, channels=1, rate=8000, width=2):
+    """ return a WAV header.
+    @size<int> -- size of the PCM data in bytes.
+    @channels<int> -- number of channels.
+    @rate<int> -- frames per second.
+    @width<int> -- bytes per sample.
+    """
+    return WAV_HEADER.pack(
+        b"RIFF",
+        WAV_HEADER.size - 8 + size,
+        b"WAVE",
+        b"fmt ",
+        16,  # fmt chunk size.
+        1,  # PCM.
+        channels,
+        rate,
+        rate * channels * width,  # byte rate.
+        channels * width,  # block align.
+        width * 8,
+        b"data",
+        size,
+    )
+
+
+class MappedWavFile(object):
+    """ append-only WAV file written through memory-mapped windows.
+
+    The file is grown in preallocated extents, so it is laid out in a few
+    contiguous chunks no matter how many calls record at once, and frames are
+    copied into a mapped window of the current extent instead of being
+    written with one system call per packet. The header is only rewritten
+    when a new extent is allocated (a checkpoint a reader can rely on after a
+    crash) and when the file is closed, which also trims unused space.
+    """
+
+    def __init__(self, path, channels=1, rate=8000, width=2, extent=EXTENT):
+        """
+        @path<str> -- WAV file path.
+        @channels<int> -- number of channels.
+        @rate<int> -- frames per second.
+        @width<int> -- bytes per sample.
+        @extent<int> -- preallocation and mapping unit in bytes.
+        """
+        self.path = path
+        self.channels = channels
+        self.rate = rate
+        self.width = width
+        granularity = mmap.ALLOCATIONGRANULARITY
+        self.extent = max(granularity, -(-extent // granularity) * granularity)
+        self.size = 0  # bytes of PCM data.
+        self.allocated = 0  # bytes of file.
+        self.window = None
+        self.window_offset = 0
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        self.checkpoint()
+
+    def __repr__(self):
+        return "MappedWavFile(path=%s, size=%s, allocated=%s)" % (self.path, self.size, self.allocated)
+
+    @property
+    def closed(self):
+        return self.fd is None
+
+    @property
+    def frames(self):
+        return self.size // (self.channels * self.width)
+
+    def write(self, data):
+        """ append PCM frames.
+        @data<bytes> -- PCM frames.
+        """
+        view = memoryview(data)
+        while view:
+            offset = WAV_HEADER.size + self.size  # in the file.
+            if self.window is None or offset >= self.window_offset + self.extent:
+                self.remap(offset)
+            start = offset - self.window_offset
+            count = min(len(view), self.extent - start)
+            self.window[start:start + count] = view[:count]
+            self.size += count
+            view = view[count:]
+
+    def remap(self, offset):
+        """ map the extent containing a file offset.
+        @offset<int> -- file offset.
+        """
+        if self.window is not None:
+            self.window.close()
+            self.window = None
+        base = offset - offset % self.extent
+        if base + self.extent > self.allocated:
+            self.allocate(base + self.extent)
+            self.checkpoint()
+        self.window = mmap.mmap(self.fd, self.extent, offset=base)
+        self.window_offset = base
+
+    def allocate(self, size):
+        """ grow the file.
+        @size<int> -- new file size in bytes.
+        """
+        try:
+            os.posix_fallocate(self.fd, self.allocated, size - self.allocated)
+        except AttributeError:  # not supported by the platform.
+            os.ftruncate(self.fd, size)
+        except OSError as error:
+            # a sparse file on a full disk would SIGBUS on the next write
+            # through the map: only fall back if the filesystem lacks support.
+            if error.errno not in (errno.EOPNOTSUPP, errno.EINVAL):
+                raise
+            os.ftruncate(self.fd, size)
+        self.allocated = size
+
+    def checkpoint(self):
+        """ rewrite the header with the current data size.
+        """
+        header = generate_wav_header(self.size, self.channels, self.rate, self.width)
+        os.pwrite(self.fd, header, 0)
+
+    def close(self):
+        """ finalize the header and release unused space.
+        """
+        if self.fd is None:
+            return
+        if self.window is not None:
+            self.window.close()
+            self.window = None
+        os.ftruncate(self.fd, WAV_HEADER.size + self.size)
+        self.checkpoint()
+        os.close(self.fd)
+        self.fd = None
@@ -2,4 +2,6 @@
 #
 # This source code is licensed under the MIT license.
 
+from .message import SipMessage
 from .server import AsynchronousUDPServer
+from .server import ShardedUDPServer
@@ -6,8 +6,8 @@ import logging
 import threading
 import time
 
-from collections import deque
-from src.rtp.server import SynchronousRTPRouter
+from math import ceil
+from ..rtp.server import SynchronousRTPRouter
 
 # from multiprocessing import Queue
 try:
@@ -18,48 +18,232 @@ except ImportError:
 logger = logging.getLogger()
 
 
-class CallContainer(object):
-    """ call information container.
+class CallRegistry(object):
+    """ call information registry.
+
+    Calls are indexed by Call-ID in a hash map and expire through the garbage
+    collector's timer wheel, so lookup, register, and revoke are O(1). When
+    the registry is full, new calls are refused instead of silently dropping
+    older ones.
     """
 
-    def __init__(self):
+    def __init__(self, capacity=(0xffff - 6000) // 2):
         """
-        @history<deque> -- record of managed Call-ID by garbage collector.
-        @metadata<dict> -- CallMetadata objects index by Call-ID in history.
+        @capacity<int> -- maximum number of managed calls.
+        @metadata<dict> -- CallMetadata objects indexed by Call-ID.
         @count<int> -- general statistics of total received calls.
+        @refused<int> -- general statistics of refused calls.
         """
-        self.history = deque(maxlen=(0xffff - 6000) // 2)
+        self.capacity = capacity
         self.metadata = {}
         self.count = 0  # only increment.
+        self.refused = 0  # only increment.
+
+    def __contains__(self, call_id):
+        return call_id in self.metadata
+
+    def __len__(self):
+        return len(self.metadata)
 
-    def increment_count(self):
+    def is_full(self):
+        return len(self.metadata) >= self.capacity
+
+    def get(self, call_id):
+        return self.metadata.get(call_id)
+
+    def add(self, metadata):
+        """ add call metadata unless the registry is full.
+        @metadata<CallMetadata> -- call metadata.
+        """
+        if self.is_full():
+            self.refused += 1
+            return False
+        self.metadata[metadata.call_id] = metadata
         self.count += 1
+        return True
+
+    def pop(self, call_id):
+        return self.metadata.pop(call_id, None)
 
 
 class CallMetadata(object):
     """ call metadata container.
     """
 
-    def __init__(self, expiration):
+    __slots__ = ("call_id", "expiration", "timer", "stats", "dtmf", "recordings")
+
+    def __init__(self, call_id, expiration, timer=None, stats=None, dtmf=None, recordings=None):
+        self.call_id = call_id
         self.expiration = expiration
-        # TODO: add more.
+        self.timer = timer  # expiration timer.
+        self.stats = stats  # StreamStats of each recorded leg.
+        self.dtmf = dtmf  # (seconds, digit, duration) events of each recorded leg.
+        self.recordings = recordings  # recording paths.
+
+
+class Timer(object):
+    """ timer scheduled in a timer wheel.
+    """
+
+    __slots__ = ("deadline", "function", "args", "rounds", "slot")
+
+    def __init__(self, deadline, function, args, rounds, slot):
+        """
+        @deadline<float> -- monotonic time the timer is due at.
+        @function<callable> -- timer callback.
+        @args<tuple> -- timer callback arguments.
+        @rounds<int> -- remaining wheel revolutions before firing.
+        @slot<int> -- wheel slot index (None once fired or cancelled).
+        """
+        self.deadline = deadline
+        self.function = function
+        self.args = args
+        self.rounds = rounds
+        self.slot = slot
+
+    def __repr__(self):
+        return "Timer(deadline=%s, function=%s)" % (self.deadline, self.function)
+
+
+class TimerMetrics(object):
+    """ timer wheel statistics.
+    """
+
+    __slots__ = ("scheduled", "cancelled", "fired", "max_lag", "total_lag")
+
+    def __init__(self):
+        self.scheduled = self.cancelled = self.fired = 0  # only increment.
+        self.max_lag = self.total_lag = 0.0  # seconds.
+
+    def __repr__(self):
+        return "TimerMetrics(scheduled=%s, cancelled=%s, fired=%s, mean_lag=%.6f, max_lag=%.6f)" % (
+            self.scheduled,
+            self.cancelled,
+            self.fired,
+            self.mean_lag,
+            self.max_lag,
+        )
+
+    @property
+    def mean_lag(self):
+        return self.total_lag / self.fired if self.fired else 0.0
+
+
+class TimerWheel(object):
+    """ hashed timer wheel.
+
+    Timers are hashed into `size` slots by their deadline tick and carry the
+    number of wheel revolutions left before they are due, so scheduling and
+    cancelling are O(1) and each tick only visits a single slot. The wheel
+    is not thread-safe: it must be advanced and mutated by one thread (or
+    under a lock).
+    """
+
+    def __init__(self, resolution=0.1, size=4096, clock=time.monotonic):
+        """
+        @resolution<float> -- tick duration in seconds.
+        @size<int> -- number of wheel slots.
+        @clock<callable> -- monotonic time source.
+        """
+        self.resolution = resolution
+        self.size = size
+        self.clock = clock
+        self.slots = [{} for _ in range(size)]  # insertion-ordered sets.
+        self.start = clock()
+        self.ticks = 0  # ticks processed so far.
+        self.count = 0  # pending timers.
+        self.metrics = TimerMetrics()
+
+    def __len__(self):
+        return self.count
+
+    def schedule(self, delay, function, *args):
+        """ schedule `function(*args)` to run after `delay` seconds.
+        @delay<float> -- seconds from now.
+        @function<callable> -- timer callback.
+        """
+        deadline = self.clock() + delay
+        # first tick at (or after) the deadline, but never a processed one.
+        tick = max(self.ticks + 1, ceil((deadline - self.start) / self.resolution))
+        rounds = (tick - self.ticks - 1) // self.size
+        timer = Timer(deadline, function, args, rounds, tick % self.size)
+        self.slots[timer.slot][timer] = None
+        self.count += 1
+        self.metrics.scheduled += 1
+        return timer
+
+    def cancel(self, timer):
+        """ cancel a pending timer.
+        @timer<Timer> -- scheduled timer.
+        """
+        if timer is None or timer.slot is None:
+            return False
+        del self.slots[timer.slot][timer]
+        timer.slot = None
+        self.count -= 1
+        self.metrics.cancelled += 1
+        return True
+
+    def advance(self):
+        """ run every timer that is due and return the number of fired timers.
+        """
+        now = self.clock()
+        due = int((now - self.start) / self.resolution)
+        fired = 0
+        while self.ticks < due:
+            self.ticks += 1
+            slot = self.slots[self.ticks % self.size]
+            expired = []
+            for timer in slot:
+                if timer.rounds:
+                    timer.rounds -= 1
+                else:
+                    expired.append(timer)
+            for timer in expired:
+                del slot[timer]
+                timer.slot = None
+                self.count -= 1
+                lag = max(0.0, now - timer.deadline)
+                self.metrics.fired += 1
+                self.metrics.total_lag += lag
+                self.metrics.max_lag = max(self.metrics.max_lag, lag)
+                try:
+                    timer.function(*timer.args)
+                except Exception as error:
+                    logger.error("<gc>: timer %s failed: %s", timer, error)
+            fired += len(expired)
+        return fired
 
 
 class AsynchronousGarbageCollector(object):
     """ asynchronous garbage collector implementation.
     """
 
-    def __init__(self, settings={}):
+    def __init__(self, settings={}, loop=None):
         """
         @settings<dict> -- `config.json`
+        @loop<AbstractEventLoop> -- run on an event loop instead of a thread.
         """
         self.settings = settings
-        self.loop_interval = float(settings["gc"]["loop_interval"])
+        self.loop = loop
         self.call_lifetime = float(settings["gc"]["call_lifetime"])
+        self.session_lifetime = float(settings["gc"].get("session_lifetime", self.call_lifetime))
 
         # call information and metadata.
-        self.calls = CallContainer()
+        self.calls = CallRegistry(capacity=int(settings["gc"].get("max_calls", (0xffff - 6000) // 2)))
         self.rtp = None
+        self.compressor = None  # optional RecordingCompressor.
+
+        # calls expire through a timer wheel ticking at `timer_resolution`
+        # instead of a periodic scan over every managed call.
+        resolution = float(settings["gc"].get("timer_resolution", 0.1))
+        self.timers = TimerWheel(resolution=resolution)
+        self.lock = threading.Lock()  # timer wheel is shared with workers.
+        self.tables = []  # worker transaction tables expired on every tick.
+
+        # timer statistics are logged every `metrics_interval` seconds.
+        self.metrics_interval = float(settings["gc"].get("metrics_interval", 60.0))
+        self.reported = time.monotonic()
 
         # instead of directly manipulating garbage using multiple threads,
         # demultiplex tasks into a thread-safe queue and consume later.
@@ -70,12 +254,21 @@ class AsynchronousGarbageCollector(object):
         logger.debug("<gc>: successfully initialized garbage collector.")
 
     def initialize_garbage_collector(self):
-        """ create a garbage collector thread.
+        """ create a garbage collector thread (or event loop timer).
         """
+        if self.loop is not None:
+
+            def create_timer():
+                self.consume_tasks()
+                self.__timer = self.loop.call_later(self.timers.resolution, create_timer)
+
+            self.__timer = self.loop.call_later(self.timers.resolution, create_timer)
+            self.is_ready = True
+            return
 
         def create_thread():
             while True:
-                time.sleep(self.loop_interval)
+                time.sleep(self.timers.resolution)
                 self.consume_tasks()
 
         thread = threading.Thread(name="garbage-collector", target=create_thread)
@@ -84,6 +277,25 @@ class AsynchronousGarbageCollector(object):
         self.__thread.start()
         self.is_ready = True
 
+    def watch(self, table):
+        """ expire a transaction table on every tick.
+        @table<TransactionTable> -- worker transaction table.
+        """
+        self.tables.append(table)
+
+    def report_metrics(self, now=None):
+        """ log timer statistics once every `metrics_interval` seconds.
+        @now<float> -- monotonic time.
+        """
+        now = time.monotonic() if now is None else now
+        if now - self.reported < self.metrics_interval:
+            return False
+        self.reported = now
+        logger.info("<gc>: %s calls managed: %s", len(self.calls), self.timers.metrics)
+        for table in self.tables:
+            logger.info("<gc>: %s transactions: %s", len(table), table.timers.metrics)
+        return True
+
     def queue_task(self, function):
         """ demultiplex a new future garbage collector task.
         """
@@ -111,25 +323,14 @@ class AsynchronousGarbageCollector(object):
             except TypeError:
                 logger.error("<gc>: expected task: received %s", task)
 
-        now = int(time.time())
-        try:  # remove calls from management.
-            for _ in list(self.calls.history):
-                # since call queue is FIFO, the oldest call is placed on top
-                # (left) and the youngest call is placed on the bottom (right).
-                call_id = self.calls.history.popleft()
-                # if there is no metadata aligned with Call-ID or the current
-                # Call-ID has already expired, then force the RTP handler to
-                # relieve ports allocated for Call-ID.
-                metadata = self.calls.metadata.get(call_id)
-                if not metadata:
-                    continue
-                if now > metadata.expiration:
-                    self.revoke(call_id=call_id, expired=True)
-                # since the oldest call is yet to expire, that means remaining
-                # calls also don't need to be checked.
-                else:
-                    self.calls.history.appendleft(call_id)
-                    break
+        try:  # remove expired calls from management.
+            with self.lock:
+                self.timers.advance()
+            for table in self.tables:
+                table.expire()  # even if no request matched since.
+            self.report_metrics()
+            # one sweep may revoke thousands of calls: stop them in batches.
+            self.rtp.flush_stop_signals()
         except AttributeError:
             self.rtp = None  # unset to re-initialize at next iteration.
         finally:
@@ -138,23 +339,64 @@ class AsynchronousGarbageCollector(object):
     def register(self, call_id):
         """ register Call-ID and its' metadata.
         """
-        if call_id is None or call_id in self.calls.history:
-            return
-        metadata = CallMetadata(expiration=time.time() + self.call_lifetime)
-        self.calls.history.append(call_id)
-        self.calls.metadata[call_id] = metadata
-        self.calls.increment_count()
+        if call_id is None or call_id in self.calls:
+            return True
+        metadata = CallMetadata(call_id, expiration=time.time() + self.call_lifetime)
+        if self.rtp is not None:
+            # updated in place by the RTP receive path until the call ends.
+            metadata.stats = self.rtp.get_stream_stats(call_id)
+            metadata.dtmf = self.rtp.get_dtmf_events(call_id)
+            metadata.recordings = self.rtp.get_recording_paths(call_id)
+        if not self.calls.add(metadata):
+            logger.warning("<gc>: refused call (%s calls managed): %s", len(self.calls), call_id)
+            return False
+        with self.lock:
+            metadata.timer = self.timers.schedule(self.call_lifetime, self.expire, call_id)
         logger.info("<gc>: new call registered: %s", call_id)
         logger.debug("<gc>: total unique calls: %s", self.calls.count)
+        return True
+
+    def refresh(self, call_id):
+        """ extend Call-ID lifetime on a session refresh (re-INVITE/UPDATE).
+        """
+        metadata = self.calls.get(call_id)
+        if metadata is None:
+            return
+        metadata.expiration = time.time() + self.session_lifetime
+        with self.lock:
+            self.timers.cancel(metadata.timer)
+            metadata.timer = self.timers.schedule(self.session_lifetime, self.expire, call_id)
+        logger.debug("<gc>: call refreshed: %s", call_id)
+
+    def expire(self, call_id):
+        """ timer wheel callback of an expired Call-ID.
+        """
+        self.revoke(call_id=call_id, expired=True)
 
     def revoke(self, call_id, expired=False):
         """ force remove Call-ID and its' metadata.
         """
         if call_id is None:
             return
-        if self.calls.metadata.get(call_id):
-            del self.calls.metadata[call_id]
-        self.rtp.send_stop_signal(call_id=call_id)
+        metadata = self.calls.pop(call_id)
+        if metadata is not None and not expired:
+            with self.lock:
+                self.timers.cancel(metadata.timer)
+        if self.rtp is not None:
+            self.rtp.send_stop_signal(call_id=call_id)
+        else:  # the router is (re)created on the next tick.
+            self.queue_task(lambda: self.rtp.send_stop_signal(call_id=call_id))
+        if metadata is not None and metadata.stats:
+            logger.info(
+                "<gc>: stream stats of %s: %s",
+                call_id,
+                {leg: stats.counters() for (leg, stats) in metadata.stats.items()},
+            )
+        if metadata is not None and metadata.dtmf and any(metadata.dtmf.values()):
+            logger.info("<gc>: dtmf events of %s: %s", call_id, metadata.dtmf)
+        if metadata is not None and metadata.recordings and self.compressor is not None:
+            # the recordings were finalized by the stop signal.
+            self.compressor.submit(metadata.recordings)
         if expired:
             logger.debug("<gc>: call removed (expired): %s", call_id)
         else:
@@ -0,0 +1,102 @@
+# Copyright 2018 (c) Herbert Shin  https://github.com/initbar/sipd
+#
+# This source code is licensed under the MIT license.
+
+"""
+sipd.sip.message
+------------------
+"""
+
+from __future__ import absolute_import
+
+import logging
+
+from .parser import SipHeaders
+from .parser import parse_sip_buffer
+
+logger = logging.getLogger()
+
+__all__ = ["SipMessage"]
+
+
+class SipMessage(object):
+    """ lazily decoded SIP message.
+
+    The start line and the routing headers (Call-ID, CSeq, Via, From, To)
+    are decoded when the message is created since every handler reads them.
+    Any other header is decoded from the receive buffer the first time it is
+    read. Headers set on the message (e.g. configured response headers) take
+    precedence over the received headers.
+    """
+
+    __slots__ = (
+        "method",
+        "call_id",
+        "cseq",
+        "via",
+        "from_",
+        "to",
+        "sdp",
+        "_headers",
+        "_overrides",
+    )
+
+    def __init__(self, headers: SipHeaders):
+        """
+        @headers<SipHeaders> -- received SIP headers.
+        """
+        self._headers = headers
+        self._overrides = {}
+        self.method = headers.get("Method")
+        self.call_id = headers.get("Call-ID")
+        self.cseq = headers.get("CSeq")
+        self.via = headers.getall("Via")  # one entry per Via header.
+        self.from_ = headers.get("From")
+        self.to = headers.get("To")
+        self.sdp = []  # SDP lines to send back.
+
+    def __repr__(self):
+        return "SipMessage(method=%s, call_id=%s)" % (self.method, self.call_id)
+
+    def __str__(self):
+        return self.__repr__().__str__()
+
+    @classmethod
+    def from_buffer(cls, buffer):
+        """ create SIP message from a receive buffer.
+        @buffer<bytes|bytearray|memoryview> -- SIP message.
+        """
+        datagram = parse_sip_buffer(buffer)
+        if not datagram:
+            return
+        return cls(datagram["sip"])
+
+    def __getitem__(self, key):
+        try:
+            return self._overrides[key]
+        except KeyError:
+            return self._headers[key]  # raise KeyError.
+
+    def __setitem__(self, key, value):
+        self._overrides[key] = value
+
+    def __contains__(self, key):
+        return key in self._overrides or key in self._headers
+
+    def get(self, key, default=None):
+        """ return (comma-joined) header value.
+        @key<str> -- SIP header name.
+        @default<object> -- fallback value.
+        """
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def getall(self, key):
+        """ return every value of a repeated header.
+        @key<str> -- SIP header name.
+        """
+        if key in self._overrides:
+            return [self._overrides[key]]
+        return self._headers.getall(key)
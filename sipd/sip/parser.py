@@ -9,19 +9,26 @@ sipd.sip.parser
 
 from __future__ import absolute_import
 from collections import deque
+from collections.abc import Mapping
 from functools import lru_cache
 
 import logging
 import re
-import six
 
-from src.sip.methods import SIP_METHODS
+from .methods import SIP_METHODS
 
 logger = logging.getLogger()
 
 __all__ = [
+    "BACKEND",
+    "SipHeaders",
+    "compile_sip_template",
     "convert_to_sip_message",
+    "is_sdp_line",
+    "parse_sip_buffer",
     "parse_sip_message",
+    "peek_call_id",
+    "render_sip_template",
     "validate_sip_signature",
 ]
 
@@ -32,6 +39,7 @@ __all__ = [
 COLON = ":"
 COMMA = ","
 CRLF = "\r\n"
+CRLF_BYTES = b"\r\n"
 
 #
 # SIP
@@ -39,6 +47,13 @@ CRLF = "\r\n"
 
 SDP_PATTERN = re.compile("^[a-z]{1}=.+$")
 
+
+def is_sdp_line(line: str) -> bool:
+    """ check if a SIP message line is an SDP line (e.g. 'v=0').
+    @line<str> -- SIP message line.
+    """
+    return SDP_PATTERN.match(line) is not None
+
 # check if SIP signature exists inside SIP message.
 validate_sip_signature = lambda string: "SIP" in string
 
@@ -108,22 +123,147 @@ def parse_sip_message(message: str) -> dict:
     return datagram_compressed
 
 
-@lru_cache(maxsize=128, typed=True)
-def convert_to_sip_message(template: str, datagram: dict) -> str:
+#
+# SIP (zero-copy)
+#
+
+# first non-empty line of the buffer (i.e. request-line or status-line).
+SIP_START_LINE_PATTERN = re.compile(rb"(?:\r?\n)*([^\r\n][^\n]*)")
+
+# every remaining "key: value" line that is not an SDP line. Each match only
+# yields offsets into the receive buffer and the values are left undecoded.
+SIP_HEADER_PATTERN = re.compile(
+    rb"^(?![a-z]=.)([^:\n]*):[ \t\r\x0b\x0c]*([^\n]*?)[ \t\r\x0b\x0c]*$",
+    re.MULTILINE,
+)
+
+
+# Call-ID header (or its compact form "i") anywhere in the buffer.
+SIP_CALL_ID_PATTERN = re.compile(
+    rb"^(?:call-id|i)[ \t]*:[ \t]*([^\r\n]*?)[ \t]*\r?$",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+def peek_call_id(buffer) -> bytes:
+    """ return raw Call-ID of a SIP message buffer without parsing it.
+    @buffer<bytes|bytearray|memoryview> -- SIP message.
+    """
+    match = SIP_CALL_ID_PATTERN.search(buffer)
+    return match.group(1) if match else None
+
+
+class SipHeaders(Mapping):
+    """ read-only view of SIP headers backed by the receive buffer.
+
+    Only header names are decoded while parsing. Each value is stored as a
+    list of (start, end) offsets into the buffer and decoded (and cached)
+    the first time it is read, so headers nobody reads are never copied.
+    Bytes that are not UTF-8 are replaced rather than raised, as the buffer
+    comes off the wire.
+    """
+
+    __slots__ = ("_buffer", "_cache", "_spans")
+
+    def __init__(self, buffer, spans, cache=None):
+        """
+        @buffer<bytes|memoryview> -- SIP message buffer.
+        @spans<dict> -- header offsets indexed by header name.
+        @cache<dict> -- already decoded headers.
+        """
+        self._buffer = buffer
+        self._spans = spans
+        self._cache = {} if cache is None else cache
+
+    def __repr__(self):
+        return "SipHeaders(%s)" % dict(self.items())
+
+    def __getitem__(self, key):
+        try:
+            return self._cache[key]
+        except KeyError:
+            spans = self._spans[key]  # raise KeyError.
+        buffer = self._buffer
+        value = COMMA.join([str(buffer[i:j], "utf-8", "replace") for (i, j) in spans])
+        self._cache[key] = value
+        return value
+
+    def __contains__(self, key):
+        return key in self._cache or key in self._spans
+
+    def __iter__(self):
+        yield from self._cache
+        for key in self._spans:
+            if key not in self._cache:
+                yield key
+
+    def __len__(self):
+        return len(self._cache) + sum(1 for key in self._spans if key not in self._cache)
+
+    def getall(self, key):
+        """ return every occurrence of a header as a separate value.
+        @key<str> -- SIP header name.
+        """
+        if key not in self._spans:
+            return [self._cache[key]] if key in self._cache else []
+        buffer = self._buffer
+        return [str(buffer[i:j], "utf-8", "replace") for (i, j) in self._spans[key]]
+
+    def spans(self, key):
+        """ return buffer offsets of every occurrence of a header.
+        @key<str> -- SIP header name.
+        """
+        return self._spans.get(key, [])
+
+
+def parse_sip_buffer(buffer) -> dict:
+    """ convert SIP message buffer into SIP datagram without copying it.
+    @buffer<bytes|bytearray|memoryview> -- SIP message.
+    """
+    if not buffer:
+        return {}
+
+    # same rules as `parse_sip_message`, except that lines are matched in
+    # place: the start line is the only slice decoded up-front in order to
+    # resolve the SIP method.
+    match = SIP_START_LINE_PATTERN.match(buffer)
+    if match is None:
+        return
+    try:
+        method = (SIP_METHODS & set(match.group(1).decode().split())).pop()
+    except (KeyError, UnicodeDecodeError):
+        return
+
+    spans = {}
+    for header in SIP_HEADER_PATTERN.finditer(buffer, match.end()):
+        k = header.group(1).decode("utf-8", "replace")  # garbage never raises.
+        spans.setdefault(k, []).append(header.span(2))
+
+    return {"sip": SipHeaders(buffer, spans, {"Method": method}), "sdp": []}
+
+
+def convert_to_sip_message(template: str, datagram) -> str:
     """ convert SIP datagram into SIP message.
     @template<str> -- SIP response template.
-    @datagram<dict> -- SIP datagram.
+    @datagram<SipMessage|dict> -- SIP message or SIP datagram.
     """
     if not template:
         return CRLF
 
+    # `SipMessage` resolves its own headers (and only decodes the ones that
+    # the template asks for) whereas a datagram keeps them under "sip".
+    if isinstance(datagram, dict):
+        headers, sdp_lines = datagram["sip"], datagram.get("sdp")
+    else:
+        headers, sdp_lines = datagram, datagram.sdp
+
     # reconstruct SIP message from datagram.
     message = "%s%s" % (template["status_line"], CRLF)
     try:
         message += CRLF.join([
-            "%s: %s" % (sip_field, datagram["sip"].get(sip_field))
+            "%s: %s" % (sip_field, headers.get(sip_field))
             for sip_field in template["sip"]
-            if datagram["sip"].get(sip_field)
+            if headers.get(sip_field)
         ])
     except TypeError:
         logger.error("failed to parse using %s", datagram)
@@ -132,7 +272,7 @@ def convert_to_sip_message(template: str, datagram: dict) -> str:
     # reconstruct SDP message from datagram.
     if template.get("sdp"):
         message += "%s%s" % (CRLF, "Content-Type: application/sdp")
-        sdp = CRLF.join(datagram.get("sdp"))
+        sdp = CRLF.join(sdp_lines)
         sdp_length = str(len(sdp))
         message += "%s%s" % (CRLF, "Content-Length: " + sdp_length)
     else:
@@ -148,3 +288,107 @@ def convert_to_sip_message(template: str, datagram: dict) -> str:
         message += CRLF
 
     return message
+
+
+#
+# SIP templates
+#
+
+# "%(name)s" placeholders of a template status line.
+TEMPLATE_PARAM_PATTERN = re.compile(r"%\((\w+)\)s")
+
+# dynamic slots of a compiled template.
+SLOT_HEADER, SLOT_PARAM, SLOT_SDP = range(3)
+
+
+def compile_sip_template(template: dict, **params) -> list:
+    """ compile SIP response template into static byte chunks and slots.
+    @template<dict> -- SIP response template (e.g. `SIP_OK`).
+    @params<dict> -- status line parameters known in advance (e.g. sip_version).
+
+    Placeholders that are not given here are left as slots and resolved from
+    the parameters given to `render_sip_template`.
+    """
+    if not template:
+        return [CRLF_BYTES]
+
+    segments = []
+
+    def append_static(chunk):
+        # merge adjacent static chunks so that rendering joins fewer parts.
+        if segments and type(segments[-1]) is bytes:
+            segments[-1] += chunk
+        else:
+            segments.append(chunk)
+
+    status_line = TEMPLATE_PARAM_PATTERN.split(template["status_line"])
+    for (i, chunk) in enumerate(status_line):
+        if not i % 2:  # static text.
+            append_static(chunk.encode())
+        elif chunk in params:
+            append_static(str(params[chunk]).encode())
+        else:
+            segments.append((SLOT_PARAM, chunk))
+    append_static(CRLF_BYTES)
+
+    for sip_field in template["sip"]:
+        segments.append((SLOT_HEADER, ("%s: " % sip_field).encode(), sip_field))
+
+    if template.get("sdp"):
+        append_static(b"Content-Type: application/sdp\r\nContent-Length: ")
+        segments.append((SLOT_SDP,))
+    else:
+        append_static(b"Content-Length: 0\r\n\r\n")
+
+    return segments
+
+
+def render_sip_template(segments: list, datagram, **params) -> bytes:
+    """ render compiled SIP response template into SIP message.
+    @segments<list> -- compiled SIP response template.
+    @datagram<SipMessage|dict> -- SIP message or SIP datagram.
+    @params<dict> -- status line parameters left out at compile time.
+    """
+    if isinstance(datagram, dict):
+        headers, sdp_lines = datagram["sip"], datagram.get("sdp")
+    else:
+        headers, sdp_lines = datagram, datagram.sdp
+
+    chunks = []
+    for segment in segments:
+        if type(segment) is bytes:
+            chunks.append(segment)
+            continue
+        kind = segment[0]
+        if kind == SLOT_HEADER:
+            value = headers.get(segment[2])
+            if value:
+                chunks.extend((segment[1], str(value).encode(), CRLF_BYTES))
+        elif kind == SLOT_PARAM:
+            chunks.append(str(params[segment[1]]).encode())
+        else:  # SLOT_SDP
+            sdp = CRLF.join(sdp_lines).encode()
+            chunks.extend((str(len(sdp)).encode(), CRLF_BYTES, CRLF_BYTES, sdp))
+            if sdp and not sdp.endswith(CRLF_BYTES):
+                chunks.append(CRLF_BYTES)
+
+    return b"".join(chunks)
+
+
+#
+# backend
+#
+
+# keep the pure-Python implementations reachable (e.g. for comparing both
+# backends) before overriding them with the compiled `sipd._cython` ones.
+py_convert_to_sip_message = convert_to_sip_message
+py_is_sdp_line = is_sdp_line
+py_parse_sip_message = parse_sip_message
+
+try:
+    from .._cython.parser import convert_to_sip_message
+    from .._cython.parser import is_sdp_line
+    from .._cython.parser import parse_sip_message
+    BACKEND = "cython"
+except ImportError:
+    BACKEND = "python"
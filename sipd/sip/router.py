@@ -8,88 +8,112 @@ sipd.sip.router
 """
 
 from __future__ import absolute_import
-from abc import abstractmethod
-from abc import abstractproperty
-from multiprocessing import Process
-from multiprocessing import cpu_count
 
-import asyncore
-import attr
 import logging
-import random
+import select
+import socket
 
-from lib.coroutine import coroutine
-from sip.worker import SipWorker
+from ..lib.hashring import ConsistentHashRing
+from ..net.mmsg import SOCKADDR_SIZE
+from ..net.mmsg import pack_sockaddr_in
+from ..net.mmsg import unpack_sockaddr_in
+from .parser import peek_call_id
 
 logger = logging.getLogger()
 
-
-class PacketRouter(asyncore.dispatcher):
-    """ Base packet router """
-
-    def __repr__(self):
-        return "PacketRouter(settings=%s, socket=%s, workers=%s)" % (
-            self.settings,
-            self.socket,
-            self.workers,
-        )
-
-    def __str__(self):
-        return self.__repr__().__str__()
-
-    @abstractmethod
-    def route(self):
-        raise NotImplementedError
-
-
-class AsynchronousUDPRouter(PacketRouter):
-    """ Asynchronous UDP packet router """
-
-    def __init__(self, settings=None, socket=None):
-        asyncore.dispatcher.__init__(self, socket)
-        self.settings = settings
-        self.socket = socket
+__all__ = ["ShardRouter", "create_shard_routers"]
+
+
+class ShardRouter(object):
+    """ Call-ID affinity between SO_REUSEPORT shards.
+
+    The kernel spreads datagrams over shards by 4-tuple (or by receiving
+    CPU), which does not keep a dialog together: the BYE of a call may come
+    from another source port than its INVITE. Every shard hashes the
+    Call-ID of a datagram onto a consistent hash ring of shards, peeking
+    only at the Call-ID header, and forwards a datagram owned by another
+    shard to that shard's inbox (an AF_UNIX datagram socket) with the
+    sender's endpoint in front of it. The owner responds from its own
+    socket, which is bound to the same port.
+    """
+
+    def __init__(self, names, inboxes, index, batch=64):
+        """
+        @names<list> -- shard names.
+        @inboxes<list> -- (receiving, sending) socket pair of each shard.
+        @index<int> -- index of this shard.
+        @batch<int> -- maximum forwarded datagrams received at a time.
+        """
+        self.name = names[index]
+        self.ring = ConsistentHashRing(names)
+        self.inbox = inboxes[index][0]
+        self.peers = dict(zip(names, [sending for (_, sending) in inboxes]))
+        self.batch = batch
+        self.forwarded = self.received = self.errors = 0  # only increment.
 
     def __repr__(self):
-        return "AsynchronousUDPRouter(settings=%s, socket=%s, workers=%s)" % (
-            self.settings,
-            self.socket,
-            self.workers,
+        return "ShardRouter(name=%s, forwarded=%s, received=%s, errors=%s)" % (
+            self.name,
+            self.forwarded,
+            self.received,
+            self.errors,
         )
 
-    def handle_read(self):
+    def route(self, message, endpoint):
+        """ forward a datagram to its owner; return whether it is owned here.
+        @message<bytes|memoryview> -- SIP message buffer.
+        @endpoint<tuple> -- (host, port) of the sender.
+        """
+        call_id = peek_call_id(message)
+        if not call_id:
+            return True
+        owner = self.ring.get(call_id)
+        if owner == self.name:
+            return True
         try:
-            packet = self.recvfrom(0xffff)  # max bytes
-            endpoint, message = tuple(packet[1]), str(packet[0])
-            self.demultiplexer.send((endpoint, message))
-        except EOFError:
-            pass
-
-    @property
-    @coroutine
-    def demultiplexer(self, *a, **kw):
-        while True:
-            message = yield
-            random.choice(self.workers).enqueue(message)
-
-    def standby(self, *a, **kw):
-        # initialize and limit workers to the total number of CPU cores.
-        # If worker processes exceed the total core count, then performance
-        # benefits are minimal or even detrimental.
-        worker_count = min(max(1, self.settings["server"]["worker"]), cpu_count())
-        if worker_count != self.settings["server"]["worker"]:
-            logger.warning("throttled worker count to '%s'.", worker_count)
-
-        # wrap each workers in its own sub-process.
-        self.workers = [SipWorker(name="worker-%s" %i) for i in range(worker_count)]
-        self._workers = []
-        for worker in self.workers:
-            process = Process(name=worker.name, target=worker.standby)
-            process.daemon = True
-            process.start()
-            self._workers.append(process)
-            logger.info("successfully created '%s'.", worker.name)
-            logger.debug("worker: %s", worker)
-
-
-__all__ = ["AsynchronousUDPRouter", "PacketRouter"]
+            self.peers[owner].send(pack_sockaddr_in(endpoint) + bytes(message))
+        except OSError as error:  # e.g. the owner's inbox is full.
+            self.errors += 1
+            logger.error("<worker>: failed to forward %s to %s: %s", call_id, owner, error)
+            return True  # better handled here than dropped.
+        self.forwarded += 1
+        return False
+
+    def recv(self, receiver):
+        """ wait for datagrams; return those owned by this shard as a list
+        of (message, endpoint).
+        @receiver<BatchReceiver> -- receiver of the shard's SO_REUSEPORT socket.
+        """
+        (readable, _, _) = select.select([receiver.socket, self.inbox], [], [])
+        datagrams = []
+        if receiver.socket in readable:
+            datagrams.extend(
+                (message, endpoint)
+                for (message, endpoint) in receiver.recv(block=False)
+                if self.route(message, endpoint)
+            )
+        if self.inbox in readable:
+            datagrams.extend(self.receive_forwarded())
+        return datagrams
+
+    def receive_forwarded(self):
+        datagrams = []
+        while len(datagrams) < self.batch:
+            try:
+                data = self.inbox.recv(0xffff + SOCKADDR_SIZE, socket.MSG_DONTWAIT)
+            except (BlockingIOError, InterruptedError):
+                break
+            datagrams.append((memoryview(data)[SOCKADDR_SIZE:], unpack_sockaddr_in(data)))
+        self.received += len(datagrams)
+        return datagrams
+
+
+def create_shard_routers(names, batch=64):
+    """ return the router of each shard; create them before forking.
+    @names<list> -- shard names.
+    @batch<int> -- maximum forwarded datagrams received at a time.
+    """
+    inboxes = [socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM) for _ in names]
+    for (_, sending) in inboxes:
+        sending.setblocking(False)  # never wait on a busy shard.
+    return [ShardRouter(names, inboxes, index, batch=batch) for index in range(len(names))]
@@ -2,30 +2,218 @@
 #
 # This source code is licensed under the MIT license.
 
-import asyncore
+from multiprocessing import Process
+from multiprocessing import cpu_count
+
+import asyncio
 import logging
+import os
+
+from ..net.lib import attach_reuseport_cpu_policy
+from ..net.lib import unsafe_allocate_udp_socket
+from ..rtp.compress import RecordingCompressor
+from ..rtp.pool import PortLeasePool
+from ..rtp.recorder import RTPRecorder
+from ..rtp.server import AsynchronousRTPRouter
+from .garbage import AsynchronousGarbageCollector
+from .router import create_shard_routers
+from .worker import AsynchronousWorker
+from .worker import SipWorker
 
-# from net.lib import safe_allocate_udp_socket
-# from sip.router import AsynchronousUDPRouter
+# uvloop is optional: without it, the default asyncio event loop is used.
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 logger = logging.getLogger()
 
 
-# class AsynchronousUDPServer(object):
-#     """Asynchronous UDP server."""
+def new_event_loop():
+    """ create the fastest available event loop.
+    """
+    if uvloop is not None:
+        return uvloop.new_event_loop()
+    return asyncio.new_event_loop()
+
+
+class SipProtocol(asyncio.DatagramProtocol):
+    """ SIP datagram protocol.
+    """
+
+    def __init__(self, worker):
+        """
+        @worker<AsynchronousWorker> -- SIP worker.
+        """
+        self.worker = worker
+        self.transport = None
+
+    def connection_made(self, transport):
+        # responses are sent through the transport of the server socket.
+        self.transport = self.worker.socket = transport
 
-#     def serve(self):
-#         host = self.settings["server"]["host"]
-#         port = self.settings["server"]["port"]
-#         with safe_allocate_udp_socket(host=host, port=port, is_reused=True) as socket:
-#             router = AsynchronousUDPRouter(settings=self.settings, socket=socket)
-#             router.standby()
-#             logger.info("successfully created router.")
-#             logger.debug("router: %s", router)
-#             logger.info("successfully created server.")
-#             logger.debug("server: %s", self)
-#             asyncore.loop()
+    def datagram_received(self, data, addr):
+        self.worker.handle(message=data, endpoint=addr)
+
+    def error_received(self, error):
+        logger.error("<net>: %s", error)
 
 
 class AsynchronousUDPServer(object):
-    ...
+    """ asyncio UDP server.
+
+    SIP messages, RTP handler replies, and garbage collector timers all run
+    on a single event loop, so a worker never blocks while it waits on an
+    RTP handler.
+    """
+
+    def __init__(self, settings=None):
+        """
+        @settings<dict> -- `config.json`
+        """
+        self.settings = settings
+        self.loop = None
+        self.transport = None
+        self.worker = None
+        self.pool = None
+        self.compressor = None
+
+    def __repr__(self):
+        return "AsynchronousUDPServer(loop=%s, worker=%s)" % (
+            self.loop.__class__.__name__,
+            self.worker,
+        )
+
+    async def start(self):
+        """ bind the server socket and start receiving SIP messages.
+        """
+        host = self.settings["server"]["host"]
+        port = self.settings["server"]["port"]
+        udp_socket = unsafe_allocate_udp_socket(host=host, port=port, is_reused=True)
+        if udp_socket is None:
+            raise OSError("failed to bind udp port: '%s'." % port)
+
+        loop = asyncio.get_running_loop()
+        gc = AsynchronousGarbageCollector(settings=self.settings, loop=loop)
+        self.worker = AsynchronousWorker(name="worker", settings=self.settings, gc=gc)
+        # the garbage collector stops calls through the worker's router so
+        # that leased ports are released by their lease ID.
+        self.worker.rtp = gc.rtp = AsynchronousRTPRouter(self.settings)
+        recorder = self.settings["rtp"].get("recorder", {})
+        if recorder.get("enabled"):
+            # record calls in-process instead of signaling external handlers.
+            self.worker.rtp.recorder = RTPRecorder(self.settings)
+            compress = recorder.get("compress", {})
+            if compress.get("enabled"):
+                self.compressor = gc.compressor = RecordingCompressor(
+                    method=compress.get("method", "adpcm"),
+                    workers=int(compress.get("workers", 1)),
+                    max_queue=int(compress.get("max_queue", 256)),
+                )
+        pool = self.settings["rtp"].get("pool", {})
+        if pool.get("enabled") and self.worker.rtp.recorder is None:
+            self.pool = self.worker.rtp.pool = PortLeasePool(
+                self.worker.rtp,
+                size=int(pool.get("size", 16)),
+                low_water=int(pool.get("low_water", 4)),
+                lifetime=float(pool.get("lifetime", 60.0)),
+            )
+            self.pool.start()
+        self.transport, _ = await loop.create_datagram_endpoint(
+            lambda: SipProtocol(self.worker), sock=udp_socket
+        )
+        logger.info("successfully created server.")
+        logger.debug("server: %s", self)
+
+    def stop(self):
+        if self.transport is not None:
+            self.transport.close()
+        if self.pool is not None:
+            self.pool.stop()
+            self.worker.rtp.flush_stop_signals()  # released leases.
+        if self.worker is not None and self.worker.rtp is not None:
+            self.worker.rtp.close()  # RTP handler control clients.
+        if self.compressor is not None:
+            self.compressor.close()
+        if self.worker is not None:
+            self.worker.close()  # send queued metadata.
+
+    def serve(self):
+        self.loop = new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.start())
+            self.loop.run_forever()
+        finally:
+            self.stop()
+            self.loop.close()
+
+
+class ShardedUDPServer(object):
+    """ SO_REUSEPORT sharded UDP server.
+
+    Every worker process owns a socket bound to the same port and runs its
+    own receive loop, so the kernel spreads datagrams across cores without
+    a router process in between. With "affinity" routing, the workers then
+    forward every datagram to the worker that owns its Call-ID, so that all
+    messages of a dialog meet the same call and transaction state.
+    """
+
+    def __init__(self, settings=None):
+        """
+        @settings<dict> -- `config.json`
+        """
+        self.settings = settings
+        self.sockets = []
+        self.workers = []
+        self._workers = []
+
+    def __repr__(self):
+        return "ShardedUDPServer(sockets=%s, workers=%s)" % (len(self.sockets), self.workers)
+
+    def serve(self):
+        host = self.settings["server"]["host"]
+        port = self.settings["server"]["port"]
+        worker_count = min(max(1, self.settings["server"]["worker"]), cpu_count())
+        if worker_count != self.settings["server"]["worker"]:
+            logger.warning("throttled worker count to '%s'.", worker_count)
+
+        # bind every socket in the parent process so that the socket index
+        # inside of the SO_REUSEPORT group is the worker index.
+        for i in range(worker_count):
+            udp_socket = unsafe_allocate_udp_socket(host=host, port=port, is_reused=True)
+            if udp_socket is None:
+                raise OSError("failed to bind sharded udp port: '%s'." % port)
+            self.sockets.append(udp_socket)
+
+        # "cpu": each datagram is received by the worker pinned to the CPU
+        # that received it. Otherwise, the kernel hashes the 4-tuple. Neither
+        # keeps a dialog together, which Call-ID affinity does on top.
+        policy = self.settings["server"].get("reuseport_policy")
+        if policy == "cpu" and not attach_reuseport_cpu_policy(self.sockets[0], worker_count):
+            policy = None
+        routing = self.settings["server"].get("routing", "affinity")
+        if policy == "cpu" and routing != "affinity":
+            logger.warning("'cpu' reuseport policy splits dialogs: routing by Call-ID affinity.")
+            routing = "affinity"
+        names = ["worker-%s" % i for i in range(worker_count)]
+        routers = [None] * worker_count
+        if routing == "affinity" and worker_count > 1:
+            routers = create_shard_routers(names, batch=int(self.settings["server"].get("batch", 64)))
+        logger.info("routing mode: '%s'.", routing)
+
+        for (i, udp_socket) in enumerate(self.sockets):
+            worker = SipWorker(name=names[i], settings=self.settings)
+            process = Process(name=worker.name, target=worker.listen, args=(udp_socket, routers[i]))
+            process.daemon = True
+            process.start()
+            if policy == "cpu":
+                os.sched_setaffinity(process.pid, {i})
+            self.workers.append(worker)
+            self._workers.append(process)
+            logger.info("successfully created '%s'.", worker.name)
+        logger.info("successfully created server.")
+        logger.debug("server: %s", self)
+
+        for process in self._workers:
+            process.join()
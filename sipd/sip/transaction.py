@@ -0,0 +1,186 @@
+# Copyright 2018 (c) Herbert Shin  https://github.com/initbar/sipd
+#
+# This source code is licensed under the MIT license.
+
+"""
+sipd.sip.transaction
+------------------
+"""
+
+from __future__ import absolute_import
+
+import logging
+import re
+import threading
+import time
+
+from .garbage import TimerWheel
+
+logger = logging.getLogger()
+
+__all__ = ["ServerTransaction", "TransactionTable"]
+
+# 17.1.1.1 Overview of INVITE Transaction / Table 4: Summary of timers
+#
+# T1  500ms default  -- RTT estimate.
+# T4  5s             -- maximum duration a message will remain in the network.
+# H   64*T1          -- wait time for ACK receipt (INVITE server transaction).
+# I   T4             -- wait time for ACK retransmits (UDP).
+# J   64*T1          -- wait time for non-INVITE request retransmits (UDP).
+#
+# https://tools.ietf.org/html/rfc3261#appendix-A
+T1 = 0.5
+T4 = 5.0
+TIMER_H = 64 * T1
+TIMER_I = T4
+TIMER_J = 64 * T1
+
+# RFC 3261 compliant branch parameter of the top-most Via header.
+BRANCH_PATTERN = re.compile(r";\s*branch=([^;,\s]+)")
+BRANCH_MAGIC_COOKIE = "z9hG4bK"
+
+
+class ServerTransaction(object):
+    """ server transaction state.
+    """
+
+    __slots__ = ("key", "method", "state", "response", "timer")
+
+    def __init__(self, key, method):
+        """
+        @key<tuple> -- transaction key.
+        @method<str> -- request method.
+        """
+        self.key = key
+        self.method = method
+        self.state = "proceeding"
+        self.response = None  # last response sent (bytes).
+        self.timer = None  # running RFC timer.
+
+    def __repr__(self):
+        return "ServerTransaction(key=%s, state=%s)" % (self.key, self.state)
+
+
+def get_transaction_key(message):
+    """ return the server transaction key of a request.
+    @message<SipMessage> -- SIP request.
+
+    17.2.3 Matching Requests to Server Transactions: the branch parameter of
+    the top Via header and the CSeq method (ACK matches INVITE). Requests
+    from RFC 2543 clients without the magic cookie fall back to Call-ID,
+    CSeq and the top Via header.
+    """
+    try:
+        sequence, method = message.cseq.split()
+    except (AttributeError, ValueError):
+        return
+    if method == "ACK":
+        method = "INVITE"
+    top_via = message.via[0] if message.via else ""
+    branch = BRANCH_PATTERN.search(top_via)
+    if branch and branch.group(1).startswith(BRANCH_MAGIC_COOKIE):
+        return (branch.group(1), method)
+    return (message.call_id, sequence, method, top_via)
+
+
+class TransactionTable(object):
+    """ server transactions indexed by transaction key.
+
+    RFC timers run on a timer wheel owned by the table, which is advanced
+    whenever a request is matched and on every garbage collector tick, so
+    that transactions expire on an idle socket too. Every worker owns its
+    own table, shared only with its garbage collector.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        """
+        @clock<callable> -- monotonic time source.
+        """
+        self.transactions = {}
+        self.timers = TimerWheel(resolution=T1 / 5, size=1024, clock=clock)
+        self.retransmissions = 0  # only increment.
+        self.lock = threading.RLock()  # the garbage collector thread expires too.
+
+    def __len__(self):
+        return len(self.transactions)
+
+    def start_timer(self, transaction, duration):
+        """ (re)schedule transaction expiration.
+        @transaction<ServerTransaction> -- server transaction.
+        @duration<float> -- TIMER_H, TIMER_I, or TIMER_J.
+        """
+        self.timers.cancel(transaction.timer)
+        transaction.timer = self.timers.schedule(duration, self.terminate, transaction)
+
+    def terminate(self, transaction):
+        """ timer callback of an expired transaction.
+        @transaction<ServerTransaction> -- server transaction.
+        """
+        transaction.state = "terminated"
+        transaction.timer = None
+        if self.transactions.get(transaction.key) is transaction:
+            del self.transactions[transaction.key]
+
+    def expire(self):
+        """ remove expired transactions.
+        """
+        with self.lock:
+            self.timers.advance()
+
+    def match(self, message):
+        """ return the server transaction of a retransmitted request.
+        @message<SipMessage> -- SIP request.
+        """
+        key = get_transaction_key(message)
+        with self.lock:
+            self.timers.advance()
+            return self.match_transaction(self.transactions.get(key), message.method)
+
+    def match_transaction(self, transaction, method):
+        if transaction is None:
+            return
+        # 17.2.1 INVITE Server Transaction: an ACK for a non-2xx (or here,
+        # any) final response moves the transaction into "confirmed" and it
+        # absorbs any ACK retransmissions until Timer I fires.
+        if method == "ACK":
+            if transaction.state == "completed":
+                transaction.state = "confirmed"
+                self.start_timer(transaction, TIMER_I)
+        else:
+            self.retransmissions += 1
+        return transaction
+
+    def create(self, message):
+        """ create a server transaction for a new request.
+        @message<SipMessage> -- SIP request.
+        """
+        key = get_transaction_key(message)
+        if key is None or message.method == "ACK":
+            return
+        transaction = ServerTransaction(key, message.method)
+        with self.lock:
+            self.transactions[key] = transaction
+            # guard against requests that are never answered with a final response.
+            self.start_timer(transaction, TIMER_H if message.method == "INVITE" else TIMER_J)
+        return transaction
+
+    def update(self, transaction, response):
+        """ record the last response sent in a server transaction.
+        @transaction<ServerTransaction> -- server transaction.
+        @response<bytes> -- rendered SIP response.
+        """
+        if transaction is None:
+            return
+        try:
+            status = int(response.split(b" ", 2)[1])
+        except (IndexError, ValueError):
+            return
+        # the first final response is the one retransmissions are answered
+        # with: neither provisional nor later final responses replace it.
+        with self.lock:
+            if transaction.state != "proceeding":
+                return
+            transaction.response = response
+            if status >= 200:
+                transaction.state = "completed"
+                self.start_timer(transaction, TIMER_H if transaction.method == "INVITE" else TIMER_J)
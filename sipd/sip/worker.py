@@ -6,33 +6,37 @@ from __future__ import absolute_import
 from abc import abstractmethod
 from abc import abstractproperty
 
+import asyncio
 import attr
-import copy
 import logging
 import multiprocessing
+import signal
 import socket
+import sys
+import threading
 import time
 
-from lib.coroutine import coroutine
-
-# from src.debug import create_random_uuid
-# from src.debug import md5sum
-# from src.optimizer import memcache
-# from src.parser import convert_to_sip_packet
-# from src.parser import dump_json
-# from src.parser import parse_address
-# from src.parser import parse_sip_packet
-# from src.parser import validate_sip_signature
-# from src.rtp.server import SynchronousRTPRouter
-# from src.sip.static.ok import SIP_OK
-# from src.sip.static.ok import SIP_OK_NO_SDP
-# from src.sip.static.options import SIP_OPTIONS
-# from src.sip.static.ringing import SIP_RINGING
-# from src.sip.static.terminated import SIP_TERMINATE
-# from src.sip.static.trying import SIP_TRYING
-# from src.sockets import safe_allocate_tcp_client
-# from src.sockets import safe_allocate_udp_client
-# from src.sockets import unsafe_allocate_random_udp_socket
+from ..lib.coroutine import coroutine
+from ..lib.sip.busy import SIP_BUSY
+from ..lib.sip.forbidden import SIP_FORBIDDEN
+from ..lib.sip.ok import SIP_OK
+from ..lib.sip.ok import SIP_OK_NO_SDP
+from ..lib.sip.options import SIP_OPTIONS
+from ..lib.sip.ringing import SIP_RINGING
+from ..lib.sip.terminated import SIP_TERMINATE
+from ..lib.sip.trying import SIP_TRYING
+from ..net.export import MetadataExporter
+from ..net.mmsg import BatchReceiver
+from ..net.mmsg import BatchSender
+from ..net.udp import safe_allocate_udp_client
+from ..net.udp import unsafe_allocate_random_udp_socket
+from ..rtp.server import AsynchronousRTPRouter
+from ..rtp.server import SynchronousRTPRouter
+from .garbage import AsynchronousGarbageCollector
+from .message import SipMessage
+from .parser import compile_sip_template
+from .parser import render_sip_template
+from .transaction import TransactionTable
 
 logger = logging.getLogger()
 
@@ -43,7 +47,8 @@ class Worker(object):
 
     name = attr.ib(default="worker")
 
-    _input = multiprocessing.Queue()
+    # every worker owns its own queue so that messages can be routed to it.
+    _input = attr.ib(default=attr.Factory(multiprocessing.Queue), repr=False)
     _output = attr.ib(default=None)
 
     def __repr__(self):
@@ -65,244 +70,454 @@ class Worker(object):
         raise NotImplementedError
 
 
+@attr.s(frozen=True, slots=True, repr=False)
 class SipWorker(Worker):
-    """ """
+    """ SIP worker """
+
+    settings = attr.ib(default=None)
 
     def __repr__(self):
         return "SipWorker(name='%s', size=%s)" % (self.name, self.size)
 
+    def create_worker(self):
+        # per-process state is created inside of the worker process.
+        gc = AsynchronousGarbageCollector(settings=self.settings)
+        return LazyWorker(name=self.name, settings=self.settings, gc=gc)
+
     def standby(self, *a, **kw):
+        worker = self.create_worker()
+        try:
+            while True:
+                endpoint, message = self._input.get()
+                worker.handle(message=message, endpoint=endpoint)
+        finally:
+            worker.close()
+
+    def listen(self, udp_socket, router=None, *a, **kw):
+        """ receive and handle SIP messages on a socket owned by this worker.
+        @udp_socket<socket> -- SO_REUSEPORT server socket.
+        @router<ShardRouter> -- Call-ID affinity between shards.
+
+        Responses are sent from the same socket, so there is no queue
+        between the kernel and the handlers; with a router, only datagrams
+        of calls owned by another shard take one hop to that shard. Where
+        available, datagrams are received and responses are sent in batches
+        through recvmmsg/sendmmsg.
+        """
+        batch = int(self.settings["server"].get("batch", 64))
+        receiver = BatchReceiver(udp_socket, batch=batch)
+        worker = self.create_worker()
+        worker.socket = BatchSender(udp_socket, batch=batch)
+        udp_socket.settimeout(None)  # block on receive.
+        if threading.current_thread() is threading.main_thread():
+            # a shard process is stopped with SIGTERM: unwind to `finally`.
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            while True:
+                # nothing restarts a shard: errors are logged, never raised, or
+                # its share of the port would be received by nobody.
+                try:
+                    datagrams = receiver.recv() if router is None else router.recv(receiver)
+                except OSError as error:
+                    logger.error("<worker>: failed to receive: %s", error)
+                    continue
+                # datagrams are views into the receiver's buffer: handle each one
+                # before the next receive, then send the batch of responses.
+                for (message, endpoint) in datagrams:
+                    try:
+                        worker.handle(message=message, endpoint=endpoint)
+                    except Exception as error:  # e.g. a malformed message or reply.
+                        logger.exception("<worker>: failed to handle %s: %s", endpoint, error)
+                        worker.reset()
+                worker.flush()
+        finally:
+            worker.close()
+
+
+# SIP responses
+# -------------------------------------------------------------------------------
+
+SIPTemplates = {
+    "DEFAULT": SIP_OK_NO_SDP,
+    "BUSY": SIP_BUSY,
+    "FORBIDDEN": SIP_FORBIDDEN,
+    "OK +SDP": SIP_OK,
+    "OK -SDP": SIP_OK_NO_SDP,
+    "OPTIONS": SIP_OPTIONS,
+    "RINGING": SIP_RINGING,
+    "TERMINATE": SIP_TERMINATE,
+    "TRYING": SIP_TRYING,
+}
+
+
+def compile_sip_templates(sip_version="2.0"):
+    """ compile every SIP response template once.
+    @sip_version<str> -- SIP version of the status lines.
+    """
+    return {
+        method: compile_sip_template(template, sip_version=sip_version)
+        for (method, template) in SIPTemplates.items()
+    }
+
+
+def generate_response(templates, method, message):
+    """ SIP message generator.
+    @templates<dict> -- compiled SIP response templates.
+    @method<str> -- SIP response method.
+    @message<SipMessage> -- SIP message.
+    """
+    return render_sip_template(templates.get(method, templates["DEFAULT"]), message)
+
+
+def send_response(shared_socket, endpoint, response, method):
+    """ SIP message response sender.
+    @shared_socket<socket> -- shared UDP socket.
+    @endpoint<tuple> -- server endpoint address.
+    @response<bytes> -- rendered SIP message.
+    @method<str> -- SIP method.
+    """
+    if not endpoint:
+        logger.error("<worker>: unable to send response due to empty endpoint.")
         return
-
-
-
-# # SIP responses
-# # -------------------------------------------------------------------------------
-
-# SIPTemplates = {
-#     "DEFAULT": SIP_OK_NO_SDP,
-#     "OK +SDP": SIP_OK,
-#     "OK -SDP": SIP_OK_NO_SDP,
-#     "OPTIONS": SIP_OPTIONS,
-#     "RINGING": SIP_RINGING,
-#     "TERMINATE": SIP_TERMINATE,
-#     "TRYING": SIP_TRYING,
-# }
-
-# SIPColors = {
-#     "+++": "\033[01m\033[35m+++\033[0m",  # bold, purple, reset
-#     ">>>": "\033[01m\033[32m>>>\033[0m",  # bold, green, reset
-#     "<<<": "\033[01m\033[91m<<<\033[0m",  # bold, yellow, reset
-# }
-
-
-# @memcache(size=32)
-# def generate_response(method, datagram):
-#     """ memcached SIP message generator.
-#     @datagram<dict> -- SIP response datagram.
-#     @method<str> -- SIP response method.
-#     """
-#     return convert_to_sip_packet(
-#         template=SIPTemplates.get(method, SIPTemplates["DEFAULT"]), datagram=datagram
-#     )
-
-
-# def send_response(shared_socket, endpoint, datagram, method):
-#     """ SIP message response sender.
-#     @shared_socket<socket> -- shared UDP socket.
-#     @endpoint<tuple> -- server endpoint address.
-#     @datagram<dict> -- parsed SIP datagram.
-#     @method<str> -- SIP method.
-#     """
-#     if not endpoint:
-#         logger.error("<worker>: unable to send response due to empty endpoint.")
-#         return
-#     # generate response and send to the endpoint.
-#     response = generate_response(method, datagram)
-#     logger.info("%s <worker>: [\033[01m\033[91m%s\033[0m]", SIPColors["<<<"], method)
-#     logger.debug("%s <worker>: sent to %s\n%s", SIPColors["<<<"], endpoint, response)
-#     try:
-#         shared_socket.sendto(response, endpoint)
-#     except Exception as message:
-#         logging.error("<worker>: failed to send using shared socket: %s", message)
-#         try:  # close shared socket and re-create another one later.
-#             shared_socket.close()
-#             shared_socket = None  # unset to re-initialize at next iteration.
-#         except AttributeError:
-#             pass
-#         # temporarily allocate an udp client to send data.
-#         logging.info("<worker>: using backup client-socket to send response.")
-#         with safe_allocate_udp_client() as client:
-#             client.sendto(response, endpoint)
-
-
-# # SIP worker
-# # -------------------------------------------------------------------------------
-
-
-# class LazyWorker(object):
-#     """ worker implementation.
-#     """
-
-#     def __init__(self, name=None, settings=None, gc=None):
-#         """
-#         @name<str> -- worker name.
-#         @settings<dict> -- `config.json`
-#         @gc<SynchronousGarbageCollector> -- shared garbage collector.
-#         """
-#         if name is None:
-#             self.name = "temp-%s" % create_random_uuid()[:4]
-#         else:
-#             self.name = "worker-" + str(name)
-
-#         self.settings = settings
-#         self.gc = gc
-
-#         self.socket = None  # lazy initialize.
-#         self.rtp = None  # lazy initialize.
-#         self.handlers = {
-#             "DEFAULT": self.handle_default,
-#             "ACK": self.handle_ack,
-#             "BYE": self.handle_bye,
-#             "CANCEL": self.handle_cancel,
-#             "INVITE": self.handle_invite,
-#         }
-
-#         self.is_ready = True  # recyclable state.
-#         logger.debug("<worker>: successfully initialized %s.", self.name)
-
-#     def reset(self):
-#         """ reset worker.
-#         """
-#         self.call_id = self.datagram = self.endpoint = self.method = None
-#         self.is_ready = True
-
-#     def handle(self, message, endpoint):
-#         """ worker logic.
-#         @message<str> -- worker "work".
-#         @endpoint<tuple> -- worker response endpoint.
-#         """
-#         self.is_ready = False  # woker is busy.
-#         logger.refresh()  # create new context.
-
-#         if not message or not endpoint:
-#             logger.warning("<worker>: reset from incomplete work assignment.")
-#             self.reset()
-#             return
-#         else:  # prepare worker.
-#             self.endpoint = endpoint
-#             # self.message = message
-#             if self.socket is None:
-#                 self.socket = unsafe_allocate_random_udp_socket(is_reused=True)
-#             if self.rtp is None:
-#                 self.rtp = SynchronousRTPRouter(self.settings)
-#         self.rtp.context = logger.context
-
-#         # validate work.
-#         if not validate_sip_signature(message):
-#             logger.warning("<worker>: reset from invalid signature: '%s'", message)
-#             self.reset()
-#             return
-#         self.datagram = parse_sip_packet(message)
-#         try:  # override parsed headers with loaded headers.
-#             self.call_id = self.datagram["sip"]["Call-ID"]
-#             self.method = self.datagram["sip"]["Method"]
-#             logger.info("%s <worker>: reference %s", SIPColors[">>>"], self.call_id)
-#         except KeyError:
-#             logger.warning("<worker>: reset from invalid format: '%s'", message)
-#             self.reset()
-#             return
-
-#         # load eligible SIP headers from the configuration.
-#         sip_headers = self.settings["sip"]["worker"]["headers"]
-#         for (field, value) in sip_headers.items():
-#             try:
-#                 self.datagram["sip"][field] = value
-#             except TypeError:
-#                 logger.error("<worker>: unable to use header: %s %s", field, value)
-
-#         # set 'Contact' response header to delegate future messages.
-#         server_address = self.settings["sip"]["server"]["address"]  # server address.
-#         self.datagram["sip"]["Contact"] = (
-#             "<sip:SIPd@%s:5060;transport=udp>" % server_address
-#         )
-
-#         logger.info(
-#             "%s <worker>: [\033[01m\033[91m%s\033[0m]", SIPColors[">>>"], self.method
-#         )
-#         logger.debug(
-#             "%s <worker>: received from %s\n%s", SIPColors[">>>"], endpoint, message
-#         )
-#         self.handlers.get(self.method, self.handlers["DEFAULT"])()
-#         self.reset()
-
-#     #
-#     # custom handlers
-#     #
-
-#     def handle_default(self):
-#         send_response(self.socket, self.endpoint, self.datagram, "OK -SDP")
-
-#     def handle_ack(self):
-#         pass
-
-#     def handle_bye(self):
-#         send_response(self.socket, self.endpoint, self.datagram, "OK -SDP")
-#         send_response(self.socket, self.endpoint, self.datagram, "TERMINATE")
-#         self.gc.revoke(call_id=self.call_id)
-
-#     def handle_cancel(self):
-#         send_response(self.socket, self.endpoint, self.datagram, "OK -SDP")
-#         try:
-#             self.rtp.handle(datagram=self.datagram, action="stop")
-#         except AttributeError as error:
-#             logger.error("<rtp>:RTP handler is down: %s", error)
-#             self.rtp = None  # unset to re-initialize at next iteration.
-#         send_response(self.socket, self.endpoint, self.datagram, "TERMINATE")
-
-#     def handle_invite(self):
-#         if self.call_id in self.gc.calls.history:
-#             logger.warning("<worker>: detected duplicate Call-ID: %s", self.call_id)
-#             send_response(self.socket, self.endpoint, self.datagram, "OK -SDP")
-#             return
-#         # receive TX/RX ports to delegate RTP packets.
-#         send_response(self.socket, self.endpoint, self.datagram, "TRYING")
-#         max_retry = max(1, self.settings["rtp"].get("max_retry", 1))
-#         for _ in range(max_retry, 0, -1):
-#             send_response(self.socket, self.endpoint, self.datagram, "RINGING")
-#             # if external RTP handler replies with one or more ports, rewrite
-#             # and update the existing datagram with new information and respond.
-#             datagram = None
-#             try:
-#                 datagram = self.rtp.handle(datagram=self.datagram)
-#             except AttributeError as error:
-#                 logger.error("<rtp>:RTP handler is down: %s", error)
-#                 self.rtp = None  # unset to re-initialize at next iteration.
-#             if datagram:
-#                 self.datagram = datagram
-#                 send_response(self.socket, self.endpoint, self.datagram, "OK +SDP")
-#                 break
-#             else:
-#                 logger.warning("<worker>: RTP handler did not send RX/TX ports.")
-#                 send_response(self.socket, self.endpoint, self.datagram, "OK -SDP")
-#         try:
-#             self.gc.register(call_id=self.call_id)
-#             self.send_to_db_interface()
-#         except:
-#             pass
-
-#     def send_to_db_interface(self):
-#         """ send datagram to db interface.
-#         """
-#         db = self.settings["db"]
-#         if not db.get("enabled"):
-#             return
-#         db_host, db_port = db["host"], int(db["port"])
-#         db_username = db["username"]
-#         db_password = db["password"]
-#         with safe_allocate_tcp_client(host=db_host, port=db_port) as client:
-#             datagram = copy.deepcopy(self.datagram)
-#             datagram["user"] = db_username
-#             datagram["pass"] = db_password
-#             client.sendall(dump_json(datagram))
-#             logger.info("<worker>: sent metadata to remote database.")
+    logger.info("<<< <worker>: [%s]", method)
+    logger.debug("<<< <worker>: sent to %s\n%s", endpoint, response)
+    try:
+        shared_socket.sendto(response, endpoint)
+    except Exception as error:
+        logger.error("<worker>: failed to send using shared socket: %s", error)
+        # temporarily allocate an udp client to send data.
+        logger.info("<worker>: using backup client-socket to send response.")
+        with safe_allocate_udp_client() as client:
+            client.sendto(response, endpoint)
+
+
+# SIP worker
+# -------------------------------------------------------------------------------
+
+
+class LazyWorker(object):
+    """ worker implementation.
+    """
+
+    rtp_router = SynchronousRTPRouter
+
+    def __init__(self, name=None, settings=None, gc=None):
+        """
+        @name<str> -- worker name.
+        @settings<dict> -- `config.json`
+        @gc<AsynchronousGarbageCollector> -- garbage collector.
+        """
+        self.name = name
+        self.settings = settings
+        self.gc = gc
+
+        # render responses from templates compiled once per worker.
+        sip_version = settings["sip"].get("version", "2.0")
+        self.templates = compile_sip_templates(sip_version=sip_version)
+
+        self.socket = None  # lazy initialize.
+        self.rtp = None  # lazy initialize.
+        self.exporter = None  # lazy initialize.
+        self.transaction = None
+        self.transactions = TransactionTable()
+        if gc is not None:
+            gc.watch(self.transactions)
+        self.handlers = {
+            "DEFAULT": self.handle_default,
+            "ACK": self.handle_ack,
+            "BYE": self.handle_bye,
+            "CANCEL": self.handle_cancel,
+            "INVITE": self.handle_invite,
+            "UPDATE": self.handle_update,
+        }
+
+        self.is_ready = True  # recyclable state.
+        logger.debug("<worker>: successfully initialized %s.", self.name)
+
+    def close(self):
+        """ send the queued metadata and stop the exporter.
+        """
+        if self.exporter is not None:
+            self.exporter.close()
+            self.exporter = None
+
+    def reset(self):
+        """ reset worker.
+        """
+        self.call_id = self.message = self.endpoint = self.method = None
+        self.transaction = None
+        self.is_ready = True
+
+    def handle(self, message, endpoint):
+        """ worker logic.
+        @message<bytes> -- worker "work".
+        @endpoint<tuple> -- worker response endpoint.
+        """
+        if self.prepare(message, endpoint):
+            self.handlers.get(self.method, self.handlers["DEFAULT"])()
+        self.reset()
+
+    def prepare(self, message, endpoint):
+        """ load work into the worker and return whether it should be handled.
+        @message<bytes> -- worker "work".
+        @endpoint<tuple> -- worker response endpoint.
+        """
+        self.is_ready = False  # woker is busy.
+
+        if not message or not endpoint:
+            logger.warning("<worker>: reset from incomplete work assignment.")
+            return False
+        else:  # prepare worker.
+            self.endpoint = endpoint
+            if self.socket is None:
+                self.socket = unsafe_allocate_random_udp_socket(is_reused=True)
+            if self.rtp is None:
+                self.rtp = self.rtp_router(self.settings)
+
+        # validate work. Only the start line and the routing headers are
+        # decoded here; the remaining headers are decoded on demand.
+        self.message = SipMessage.from_buffer(message)
+        if not self.message or not self.message.call_id:
+            logger.warning("<worker>: reset from invalid format: '%s'", message)
+            return False
+        self.call_id = self.message.call_id
+        self.method = self.message.method
+        logger.info(">>> <worker>: reference %s", self.call_id)
+
+        # retransmitted requests are answered with the last response sent in
+        # their server transaction without going through the handlers again.
+        transaction = self.transactions.match(self.message)
+        if transaction is not None:
+            if transaction.response is not None and self.method != "ACK":
+                logger.debug(">>> <worker>: retransmission of %s", transaction)
+                send_response(self.socket, endpoint, transaction.response, "RETRANSMIT")
+            return False
+        self.transaction = self.transactions.create(self.message)
+
+        # load eligible SIP headers from the configuration.
+        sip_headers = self.settings["sip"]["worker"]["headers"]
+        for (field, value) in sip_headers.items():
+            self.message[field] = value
+
+        # set 'Contact' response header to delegate future messages.
+        server_address = self.settings["sip"]["server"]["address"]  # server address.
+        self.message["Contact"] = "<sip:SIPd@%s:5060;transport=udp>" % server_address
+
+        logger.info(">>> <worker>: [%s]", self.method)
+        logger.debug(">>> <worker>: received from %s\n%s", endpoint, message)
+        return True
+
+    def flush(self):
+        """ send responses queued by a batching socket.
+        """
+        flush = getattr(self.socket, "flush", None)
+        if flush is not None:
+            flush()
+
+    def handle_rtp_error(self, error):
+        """ log a failed RTP router call and drop the router.
+        @error<Exception> -- RTP router error.
+        """
+        logger.error("<rtp>:RTP handler is down: %s", error)
+        self.rtp = None  # unset to re-initialize at next iteration.
+
+    def respond(self, method):
+        """ render and send a response to the current message.
+        @method<str> -- SIP response method.
+        """
+        response = generate_response(self.templates, method, self.message)
+        self.transactions.update(self.transaction, response)
+        send_response(self.socket, self.endpoint, response, method)
+
+    #
+    # custom handlers
+    #
+
+    def handle_default(self):
+        self.respond("OK -SDP")
+
+    def handle_ack(self):
+        pass
+
+    def handle_bye(self):
+        self.respond("OK -SDP")
+        self.respond("TERMINATE")
+        self.gc.revoke(call_id=self.call_id)
+
+    def handle_cancel(self):
+        self.respond("OK -SDP")
+        try:
+            self.rtp.handle(message=self.message, action="stop")
+            self.rtp.flush_stop_signals()
+        except AttributeError as error:
+            self.handle_rtp_error(error)
+        self.respond("TERMINATE")
+
+    def handle_update(self):
+        self.gc.refresh(call_id=self.call_id)
+        self.respond("OK -SDP")
+
+    def admit_invite(self):
+        """ answer INVITEs that do not set up a new call and return whether
+        the current INVITE is a new call.
+        """
+        if self.call_id in self.gc.calls:
+            # re-INVITE of an existing call refreshes its session timer.
+            logger.warning("<worker>: detected duplicate Call-ID: %s", self.call_id)
+            self.gc.refresh(call_id=self.call_id)
+            self.respond("OK -SDP")
+            return False
+        if self.gc.calls.is_full():
+            logger.warning("<worker>: refused call at capacity: %s", self.call_id)
+            self.respond("BUSY")
+            return False
+        return True
+
+    def handle_invite(self):
+        if not self.admit_invite():
+            return
+        # receive TX/RX ports to delegate RTP packets.
+        self.respond("TRYING")
+        self.flush()  # do not hold TRYING back while waiting on RTP handlers.
+        max_retry = max(1, self.settings["rtp"].get("max_retry", 1))
+        message = None
+        for _ in range(max_retry, 0, -1):
+            self.respond("RINGING")
+            # if external RTP handler replies with one or more ports, the
+            # message is updated with static SDP and is ready to respond.
+            try:
+                message = self.rtp.handle(message=self.message)
+            except AttributeError as error:
+                self.handle_rtp_error(error)
+            if message:
+                break
+            logger.warning("<worker>: RTP handler did not send RX/TX ports.")
+        self.answer_invite("OK +SDP" if message else "OK -SDP")
+
+    def answer_invite(self, method):
+        """ register the call and answer its INVITE; return whether the call
+        was admitted.
+        @method<str> -- SIP response method of an admitted call.
+        """
+        if not self.gc.register(call_id=self.call_id):
+            # the registry filled up while the call was negotiating: close the
+            # ports (and recording) opened for it.
+            if self.rtp is not None:
+                self.rtp.send_stop_signal(call_id=self.call_id)
+                self.rtp.flush_stop_signals()
+            self.respond("BUSY")
+            return False
+        self.respond(method)
+        self.send_to_db_interface()
+        return True
+
+    def send_to_db_interface(self):
+        """ queue call metadata for the db interface.
+
+        Records are batched and sent by the exporter's own threads over
+        persistent connections, so the worker never waits on the database.
+        """
+        db = self.settings.get("db", {})
+        if not db.get("enabled") or self.message is None:
+            return
+        if self.exporter is None:
+            self.exporter = MetadataExporter(db).start()
+        self.exporter.submit({
+            "time": time.time(),
+            "call_id": self.call_id,
+            "method": self.method,
+            "from": self.message.from_,
+            "to": self.message.to,
+            "cseq": self.message.cseq,
+            "via": self.message.via,
+            "endpoint": list(self.endpoint),
+        })
+
+
+class AsynchronousWorker(LazyWorker):
+    """ worker implementation for the event loop.
+
+    Messages are handled as soon as they are received. Handlers that wait on
+    an RTP handler return a coroutine, which runs as a task so that other
+    messages are handled in the meantime. Since those messages reuse the
+    worker's state, a task restores its own message context every time it
+    resumes from an `await`.
+    """
+
+    rtp_router = AsynchronousRTPRouter
+
+    def __init__(self, name=None, settings=None, gc=None):
+        """
+        @name<str> -- worker name.
+        @settings<dict> -- `config.json`
+        @gc<AsynchronousGarbageCollector> -- garbage collector.
+        """
+        super().__init__(name=name, settings=settings, gc=gc)
+        self.tasks = set()  # keep references to pending handler tasks.
+
+    def handle(self, message, endpoint):
+        """ worker logic.
+        @message<bytes> -- worker "work".
+        @endpoint<tuple> -- worker response endpoint.
+        """
+        if self.prepare(message, endpoint):
+            pending = self.handlers.get(self.method, self.handlers["DEFAULT"])()
+            if asyncio.iscoroutine(pending):
+                task = asyncio.ensure_future(pending)
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+        self.reset()
+
+    def handle_rtp_error(self, error):
+        """ log a failed RTP router call.
+        @error<Exception> -- RTP router error.
+
+        The router is wired by the server with its lease pool, recorder and
+        control clients, and shared with the garbage collector: it is kept
+        rather than replaced by a bare one.
+        """
+        logger.error("<rtp>:RTP handler is down: %s", error)
+
+    def save(self):
+        """ return the message context of the current work.
+        """
+        return (self.call_id, self.message, self.endpoint, self.method, self.transaction)
+
+    def restore(self, context):
+        """ resume work from a saved message context.
+        @context<tuple> -- message context.
+        """
+        self.is_ready = False  # woker is busy.
+        (self.call_id, self.message, self.endpoint, self.method, self.transaction) = context
+
+    def handle_invite(self):
+        if not self.admit_invite():
+            return
+        # receive TX/RX ports to delegate RTP packets.
+        self.respond("TRYING")
+        if self.rtp.lease_ports(self.message):
+            # answered right away with ports leased ahead of time.
+            self.respond("RINGING")
+            self.answer_invite("OK +SDP")
+            return
+        return self.negotiate(self.save())
+
+    async def negotiate(self, context):
+        """ await RX/TX ports from the RTP handler and answer the INVITE.
+        @context<tuple> -- message context of the INVITE.
+        """
+        self.restore(context)
+        max_retry = max(1, self.settings["rtp"].get("max_retry", 1))
+        message = None
+        for _ in range(max_retry, 0, -1):
+            self.respond("RINGING")
+            try:
+                message = await self.rtp.handle(message=self.message)
+            except AttributeError as error:
+                self.handle_rtp_error(error)
+            self.restore(context)
+            if message:
+                break
+            logger.warning("<worker>: RTP handler did not send RX/TX ports.")
+        self.answer_invite("OK +SDP" if message else "OK -SDP")
+        self.reset()
@@ -0,0 +1,105 @@
+# MIT License
+#
+# Copyright (c) 2018 Herbert Shin
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# https://github.com/initbar/sipd
+
+import unittest
+
+from sipd.lib.sip.busy import SIP_BUSY
+from sipd.lib.sip.ok import SIP_OK
+from sipd.lib.sip.ok import SIP_OK_NO_SDP
+from sipd.lib.sip.ok import SIP_OK_SAMPLE
+from sipd.lib.sip.options import SIP_OPTIONS
+from sipd.lib.sip.options import SIP_OPTIONS_SAMPLE
+from sipd.lib.sip.ringing import SIP_RINGING
+from sipd.lib.sip.ringing import SIP_RINGING_SAMPLE
+from sipd.lib.sip.terminated import SIP_TERMINATE
+from sipd.lib.sip.trying import SIP_TRYING
+from sipd.sip import parser
+
+try:
+    from sipd._cython import parser as cparser
+except ImportError:
+    cparser = None
+
+SAMPLES = [
+    SIP_OK_SAMPLE,
+    SIP_OPTIONS_SAMPLE,
+    SIP_OPTIONS_SAMPLE.replace("\n", "\r\n"),
+    SIP_OPTIONS_SAMPLE.replace("OPTIONS sip", "INVITE sip") + "Via: SIP/2.0/TCP 192.168.1.4:7090\n",
+    SIP_RINGING_SAMPLE,
+    "",
+]
+
+TEMPLATES = [
+    SIP_BUSY,
+    SIP_OK,
+    SIP_OK_NO_SDP,
+    SIP_OPTIONS,
+    SIP_RINGING,
+    SIP_TERMINATE,
+    SIP_TRYING,
+]
+
+
+@unittest.skipIf(cparser is None, "sipd._cython.parser is not compiled")
+class TestBackends(unittest.TestCase):
+
+    #
+    # SDP line classifier
+    #
+
+    def test_backends_is_sdp_line(self):
+        lines = ["v=0", "a=", "a=\n", "a=x\n", "A=0", "ab=0", "=0", "", "Via: x=y", "m=audio 0 RTP/AVP 0"]
+        for line in lines:
+            self.assertEqual(cparser.is_sdp_line(line), parser.py_is_sdp_line(line), line)
+
+    #
+    # SIP message unpack
+    #
+
+    def test_backends_parse_sip_message(self):
+        for sample in SAMPLES:
+            answer = parser.py_parse_sip_message(sample)
+            attempt = cparser.parse_sip_message(sample)
+            self.assertEqual(attempt, answer)
+            if answer:
+                self.assertEqual(list(attempt["sip"].items()), list(answer["sip"].items()))
+
+    #
+    # SIP message pack
+    #
+
+    def test_backends_convert_to_sip_message(self):
+        for sample in filter(None, SAMPLES):
+            datagram = parser.py_parse_sip_message(sample)
+            if not datagram:
+                continue
+            datagram = {"sip": dict(datagram["sip"]), "sdp": ["v=0", "s=phone-call"]}
+            for template in TEMPLATES:
+                self.assertEqual(
+                    cparser.convert_to_sip_message(template, datagram).encode(),
+                    parser.py_convert_to_sip_message(template, datagram).encode(),
+                )
+
+    def test_backends_convert_to_sip_message_empty_template(self):
+        self.assertEqual(cparser.convert_to_sip_message({}, {}), parser.py_convert_to_sip_message({}, {}))
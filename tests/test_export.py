@@ -0,0 +1,253 @@
+# MIT License
+#
+# Copyright (c) 2018 Herbert Shin
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# https://github.com/initbar/sipd
+
+
+import json
+import multiprocessing
+import socket
+import threading
+import time
+import unittest
+
+from sipd.lib.sip.options import SIP_OPTIONS_SAMPLE
+from sipd.net.export import FRAME_HEADER
+from sipd.net.export import ExportConnection
+from sipd.net.export import MetadataExporter
+from sipd.net.export import pack_frame
+from sipd.sip.worker import SipWorker
+
+
+def read_exactly(connection, size):
+    data = b""
+    while len(data) < size:
+        chunk = connection.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+class ExportServer(object):
+    """ local TCP server collecting frames; closes each connection after `limit` frames.
+    """
+
+    def __init__(self, limit=None, listening=True):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.bind(("127.0.0.1", 0))  # connections are refused until it listens.
+        self.endpoint = self.socket.getsockname()
+        self.limit = limit
+        self.frames = []
+        self.connections = 0
+        self.lock = threading.Lock()
+        if listening:
+            self.listen()
+
+    def listen(self):
+        self.socket.listen(8)
+        thread = threading.Thread(target=self.serve)
+        thread.daemon = True
+        thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                (connection, _) = self.socket.accept()
+            except OSError:
+                return
+            with self.lock:
+                self.connections += 1
+            thread = threading.Thread(target=self.receive, args=(connection,))
+            thread.daemon = True
+            thread.start()
+
+    def receive(self, connection):
+        count = 0
+        with connection:
+            while self.limit is None or count < self.limit:
+                header = read_exactly(connection, FRAME_HEADER.size)
+                if header is None:
+                    return
+                body = read_exactly(connection, FRAME_HEADER.unpack(header)[0])
+                with self.lock:
+                    self.frames.append([json.loads(line) for line in body.decode().splitlines()])
+                count += 1
+
+    @property
+    def records(self):
+        with self.lock:
+            return [record for frame in self.frames for record in frame if "call_id" in record]
+
+    def wait(self, count, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while len(self.records) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self.records
+
+    def close(self):
+        self.socket.close()
+
+
+def create_settings(endpoint, **kwargs):
+    settings = {"host": endpoint[0], "port": endpoint[1], "connections": 1, "flush_interval": 0.05}
+    settings.update(kwargs)
+    return settings
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ExportServer()
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_export_frame(self):
+        frame = pack_frame([b'{"a":1}\n', b'{"b":2}\n'])
+        self.assertEqual(FRAME_HEADER.unpack_from(frame)[0], 16)
+        self.assertEqual(frame[FRAME_HEADER.size:], b'{"a":1}\n{"b":2}\n')
+
+    def test_export_batch(self):
+        exporter = MetadataExporter(create_settings(self.server.endpoint, batch=10, flush_interval=1.0))
+        for i in range(10):  # queued before the sender starts: one full batch.
+            exporter.submit({"call_id": str(i)})
+        exporter.start()
+        records = self.server.wait(10)
+        exporter.close()
+        self.assertEqual([record["call_id"] for record in records], [str(i) for i in range(10)])
+        self.assertEqual(len(self.server.frames), 1)
+        self.assertEqual(exporter.metrics.sent, 10)
+        self.assertEqual(exporter.metrics.frames, 1)
+
+    def test_export_interval(self):
+        exporter = MetadataExporter(create_settings(self.server.endpoint, batch=100)).start()
+        exporter.submit({"call_id": "a"})
+        self.assertEqual(len(self.server.wait(1)), 1)  # sent before the batch is full.
+        exporter.close()
+
+    def test_export_handshake(self):
+        settings = create_settings(self.server.endpoint, username="user", password="pass")
+        exporter = MetadataExporter(settings).start()
+        exporter.submit({"call_id": "a"})
+        self.server.wait(1)
+        exporter.close()
+        self.assertEqual(self.server.frames[0], [{"user": "user", "pass": "pass"}])
+        self.assertTrue(all("pass" not in record for record in self.server.records))
+
+    def test_export_persistent(self):
+        exporter = MetadataExporter(create_settings(self.server.endpoint)).start()
+        for i in range(3):
+            exporter.submit({"call_id": str(i)})
+            self.server.wait(i + 1)
+        exporter.close()
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(exporter.metrics.frames, 3)
+
+    def test_export_reconnect(self):
+        self.server.limit = 1  # the server drops the connection after every frame.
+        exporter = MetadataExporter(create_settings(self.server.endpoint)).start()
+        exporter.submit({"call_id": "a"})
+        self.server.wait(1)
+        time.sleep(0.05)  # let the server close the connection.
+        exporter.submit({"call_id": "b"})
+        records = self.server.wait(2)
+        exporter.close()
+        self.assertEqual([record["call_id"] for record in records], ["a", "b"])
+        self.assertEqual(self.server.connections, 2)
+
+    def test_export_queue_full(self):
+        exporter = MetadataExporter(create_settings(self.server.endpoint, max_queue=2))
+        self.assertEqual([exporter.submit({"call_id": str(i)}) for i in range(3)], [True, True, False])
+        self.assertEqual(exporter.metrics.submitted, 2)
+        self.assertEqual(exporter.metrics.dropped, 1)
+
+    def test_export_unreachable(self):
+        self.server.close()
+        # a closed port could be reused by the exporter's own connection.
+        self.server = ExportServer(listening=False)
+        exporter = MetadataExporter(create_settings(self.server.endpoint, timeout=0.1)).start()
+        exporter.submit({"call_id": "a"})
+        exporter.close()
+        self.assertEqual(exporter.metrics.failed, 1)
+        self.assertEqual(exporter.metrics.sent, 0)
+
+    def test_export_held(self):
+        self.server.close()
+        self.server = ExportServer(listening=False)
+        exporter = MetadataExporter(create_settings(self.server.endpoint, backoff=0.1)).start()
+        exporter.submit({"call_id": "a"})
+        deadline = time.monotonic() + 2.0
+        while not exporter.connections[0].retry_at and time.monotonic() < deadline:
+            time.sleep(0.01)  # the first send failed.
+        self.server.listen()
+        records = self.server.wait(1)  # sent again after the backoff.
+        exporter.close()
+        self.assertEqual([record["call_id"] for record in records], ["a"])
+        self.assertEqual((exporter.metrics.sent, exporter.metrics.retried, exporter.metrics.failed), (1, 1, 0))
+
+    def test_export_held_bound(self):
+        self.server.close()
+        self.server = ExportServer(listening=False)
+        exporter = MetadataExporter(create_settings(self.server.endpoint, max_held=2, backoff=10.0))
+        for i in range(3):  # one batch.
+            exporter.submit({"call_id": str(i)})
+        exporter.start()
+        deadline = time.monotonic() + 2.0
+        while not exporter.metrics.failed and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(exporter.metrics.failed, 1)  # the oldest record.
+        exporter.close()
+        self.assertEqual(exporter.metrics.failed, 3)  # held records are given up on close.
+
+    def test_export_sharded_worker_closed(self):
+        settings = {
+            "server": {"host": "127.0.0.1", "port": 0},
+            "sip": {"server": {"address": "127.0.0.1"}, "worker": {"headers": {}}},
+            "gc": {"call_lifetime": 60, "max_calls": 100},
+            "rtp": {"handlers": [], "timeout": 0.1},
+            "db": dict(create_settings(self.server.endpoint, flush_interval=30.0), enabled=True),
+        }
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as udp_socket:
+            udp_socket.bind(("127.0.0.1", 0))
+            worker = SipWorker(name="worker-0", settings=settings)
+            process = multiprocessing.Process(target=worker.listen, args=(udp_socket,))
+            process.daemon = True
+            process.start()
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as client:
+                client.settimeout(5.0)
+                client.sendto(SIP_OPTIONS_SAMPLE.replace("OPTIONS", "INVITE").encode(), udp_socket.getsockname())
+                while not client.recv(4096).startswith(b"SIP/2.0 200"):
+                    pass
+        process.terminate()  # the record is still queued.
+        process.join(5.0)
+        self.assertEqual(len(self.server.wait(1)), 1)
+
+    def test_export_backoff(self):
+        now = [0.0]
+        connection = ExportConnection(("127.0.0.1", 9), backoff=1.0, clock=lambda: now[0])
+        connection.close()
+        with self.assertRaises(ConnectionError):
+            connection.send(b"")
+        now[0] = 2.0
+        with self.assertRaises(OSError):  # past the backoff: tries again.
+            connection.send(b"")
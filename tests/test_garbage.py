@@ -0,0 +1,157 @@
+# MIT License
+#
+# Copyright (c) 2018 Herbert Shin
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# https://github.com/initbar/sipd
+
+import asyncio
+import random
+import unittest
+
+from sipd.sip.garbage import AsynchronousGarbageCollector
+from sipd.sip.garbage import CallMetadata
+from sipd.sip.garbage import CallRegistry
+from sipd.sip.garbage import TimerWheel
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestGarbage(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.wheel = TimerWheel(resolution=0.1, size=64, clock=self.clock)
+        self.fired = []
+
+    #
+    # timer wheel
+    #
+
+    def test_garbage_timer_wheel_fire(self):
+        self.wheel.schedule(1.0, self.fired.append, "a")
+        self.clock.now = 0.9
+        self.wheel.advance()
+        self.assertEqual(self.fired, [])
+        self.clock.now = 1.0
+        self.wheel.advance()
+        self.assertEqual(self.fired, ["a"])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_garbage_timer_wheel_cancel(self):
+        timer = self.wheel.schedule(1.0, self.fired.append, "a")
+        self.assertTrue(self.wheel.cancel(timer))
+        self.assertFalse(self.wheel.cancel(timer))
+        self.clock.now = 2.0
+        self.wheel.advance()
+        self.assertEqual(self.fired, [])
+        self.assertEqual(self.wheel.metrics.cancelled, 1)
+
+    def test_garbage_timer_wheel_multiple_rounds(self):
+        # 64 slots * 0.1s = 6.4s per revolution.
+        self.wheel.schedule(20.0, self.fired.append, "a")
+        self.clock.now = 19.9
+        self.wheel.advance()
+        self.assertEqual(self.fired, [])
+        self.clock.now = 20.0
+        self.wheel.advance()
+        self.assertEqual(self.fired, ["a"])
+
+    def test_garbage_timer_wheel_lag(self):
+        self.wheel.schedule(1.0, self.fired.append, "a")
+        self.clock.now = 1.5
+        self.wheel.advance()
+        self.assertAlmostEqual(self.wheel.metrics.max_lag, 0.5)
+        self.assertAlmostEqual(self.wheel.metrics.mean_lag, 0.5)
+
+    def test_garbage_timer_wheel_order(self):
+        for delay in [3.0, 1.0, 2.0]:
+            self.wheel.schedule(delay, self.fired.append, delay)
+        self.clock.now = 10.0
+        self.wheel.advance()
+        self.assertEqual(self.fired, [1.0, 2.0, 3.0])
+
+    def test_garbage_timer_wheel_many_calls(self):
+        wheel = TimerWheel(resolution=0.1, size=4096, clock=self.clock)
+        timers = [wheel.schedule(random.uniform(0, 1800), self.fired.append, i) for i in range(100000)]
+        for timer in timers[::2]:
+            wheel.cancel(timer)
+        while self.clock.now < 1800.1:
+            self.clock.now += 1.0
+            wheel.advance()
+            # nothing fires before its deadline.
+            self.assertTrue(all(timers[i].deadline <= self.clock.now for i in self.fired[-10:]))
+        self.assertEqual(sorted(self.fired), list(range(1, 100000, 2)))
+        self.assertEqual(len(wheel), 0)
+
+    #
+    # call registry
+    #
+
+    def test_garbage_call_registry(self):
+        registry = CallRegistry(capacity=2)
+        self.assertTrue(registry.add(CallMetadata("a", expiration=0)))
+        self.assertIn("a", registry)
+        self.assertIs(registry.pop("a").call_id, "a")
+        self.assertNotIn("a", registry)
+        self.assertIsNone(registry.pop("a"))
+
+    def test_garbage_call_registry_capacity(self):
+        registry = CallRegistry(capacity=2)
+        for call_id in ["a", "b", "c"]:
+            registry.add(CallMetadata(call_id, expiration=0))
+        # existing calls are kept and the new call is refused.
+        self.assertEqual(sorted(registry.metadata), ["a", "b"])
+        self.assertEqual(registry.refused, 1)
+        self.assertTrue(registry.is_full())
+
+    #
+    # garbage collector
+    #
+
+    def test_garbage_revoke_before_router(self):
+        class Router(object):
+            def __init__(self):
+                self.stopped = []
+
+            def send_stop_signal(self, call_id):
+                self.stopped.append(call_id)
+
+            def flush_stop_signals(self):
+                pass
+
+        loop = asyncio.new_event_loop()
+        try:
+            gc = AsynchronousGarbageCollector({"gc": {"call_lifetime": 60}}, loop=loop)
+            gc.register("call")
+            gc.revoke("call")  # before the first tick created the router.
+            self.assertNotIn("call", gc.calls)
+            gc.rtp = Router()
+            gc.consume_tasks()
+            self.assertEqual(gc.rtp.stopped, ["call"])
+        finally:
+            loop.close()
@@ -0,0 +1,72 @@
+# MIT License
+#
+# Copyright (c) 2018 Herbert Shin
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# https://github.com/initbar/sipd
+
+import unittest
+
+from sipd.lib.hashring import ConsistentHashRing
+from sipd.lib.hashring import stable_hash
+
+
+class TestHashRing(unittest.TestCase):
+
+    def setUp(self):
+        self.keys = ["%s@192.168.1.3" % i for i in range(10000)]
+
+    def test_hashring_stable_hash(self):
+        self.assertEqual(stable_hash("a"), stable_hash(b"a"))
+        self.assertNotEqual(stable_hash("a"), stable_hash("b"))
+
+    def test_hashring_empty(self):
+        self.assertIsNone(ConsistentHashRing().get("a"))
+
+    def test_hashring_same_key_same_node(self):
+        ring = ConsistentHashRing(["worker-0", "worker-1", "worker-2"])
+        for key in self.keys[:100]:
+            self.assertEqual(ring.get(key), ring.get(key.encode()))
+
+    def test_hashring_balanced(self):
+        ring = ConsistentHashRing(["worker-%s" % i for i in range(4)])
+        counts = {}
+        for key in self.keys:
+            node = ring.get(key)
+            counts[node] = counts.get(node, 0) + 1
+        self.assertEqual(len(counts), 4)
+        self.assertTrue(all(count > len(self.keys) / 8 for count in counts.values()))
+
+    def test_hashring_resize_remaps_fraction(self):
+        ring = ConsistentHashRing(["worker-%s" % i for i in range(4)])
+        before = {key: ring.get(key) for key in self.keys}
+        ring.add("worker-4")
+        moved = [key for key in self.keys if ring.get(key) != before[key]]
+        # only keys taken over by the new node move (~1/5).
+        self.assertTrue(all(ring.get(key) == "worker-4" for key in moved))
+        self.assertLess(len(moved), len(self.keys) / 3)
+
+    def test_hashring_iterate_failover_order(self):
+        ring = ConsistentHashRing(["worker-%s" % i for i in range(4)])
+        for key in self.keys[:100]:
+            order = list(ring.iterate(key))
+            self.assertEqual(order[0], ring.get(key))
+            self.assertEqual(sorted(order), sorted(ring.nodes))
+        self.assertEqual(list(ConsistentHashRing().iterate("a")), [])
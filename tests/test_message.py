@@ -0,0 +1,70 @@
+# MIT License
+#
+# Copyright (c) 2018 Herbert Shin
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# https://github.com/initbar/sipd
+
+import unittest
+
+from sipd.lib.sip.ok import SIP_OK_NO_SDP
+from sipd.lib.sip.options import SIP_OPTIONS_SAMPLE
+from sipd.sip.message import SipMessage
+from sipd.sip.parser import convert_to_sip_message
+from sipd.sip.parser import parse_sip_message
+
+
+class TestMessage(unittest.TestCase):
+
+    #
+    # SIP message
+    #
+
+    def test_message_empty_buffer(self):
+        self.assertIsNone(SipMessage.from_buffer(b""))
+
+    def test_message_routing_headers(self):
+        message = SipMessage.from_buffer(SIP_OPTIONS_SAMPLE.encode())
+        self.assertEqual(message.method, "OPTIONS")
+        self.assertEqual(message.call_id, "9E565000-FB73-F13E-6076-D8822FB9A4E4-15064@192.168.1.3")
+        self.assertEqual(message.cseq, "307103 OPTIONS")
+        self.assertEqual(message.to, "sip:192.168.1.6:5060")
+        self.assertEqual(message.via, ["SIP/2.0/UDP 192.168.1.3:15064;branch=z9hG4bK0x2473c35084b6b1"])
+
+    def test_message_multiple_via(self):
+        packet = SIP_OPTIONS_SAMPLE + "Via: SIP/2.0/TCP 192.168.1.4:7090\n"
+        message = SipMessage.from_buffer(packet.encode())
+        self.assertEqual(len(message.via), 2)
+        self.assertEqual(message.getall("Via"), message.via)
+        self.assertEqual(message["Via"], ",".join(message.via))
+
+    def test_message_override_header(self):
+        message = SipMessage.from_buffer(SIP_OPTIONS_SAMPLE.encode())
+        message["Supported"] = "timer"
+        self.assertEqual(message["Supported"], "timer")
+        self.assertEqual(message.get("Unknown", "x"), "x")
+
+    def test_message_convert_to_sip_message(self):
+        datagram = parse_sip_message(SIP_OPTIONS_SAMPLE)
+        message = SipMessage.from_buffer(SIP_OPTIONS_SAMPLE.encode())
+        self.assertEqual(
+            convert_to_sip_message(SIP_OK_NO_SDP, message),
+            convert_to_sip_message(SIP_OK_NO_SDP, datagram),
+        )
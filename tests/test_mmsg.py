@@ -0,0 +1,98 @@
+# MIT License
+#
+# Copyright (c) 2018 Herbert Shin
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# https://github.com/initbar/sipd
+
+import socket
+import unittest
+
+from sipd.net import mmsg
+
+
+class TestBatchedSockets(unittest.TestCase):
+    def setUp(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.server.bind(("127.0.0.1", 0))
+        self.client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.client.bind(("127.0.0.1", 0))
+
+    def tearDown(self):
+        self.server.close()
+        self.client.close()
+
+    def exchange(self, batched):
+        sender = mmsg.BatchSender(self.client, batch=4)
+        receiver = mmsg.BatchReceiver(self.server, batch=8, size=2048)
+        sender.is_batched = batched and sender.is_batched
+        payloads = [b"datagram-%d" % i for i in range(6)]
+        for payload in payloads:
+            sender.sendto(payload, self.server.getsockname())
+        self.assertEqual(len(sender.queue), 2)  # first 4 were auto-flushed.
+        sender.flush()
+        self.assertEqual(sender.messages, 6)
+
+        received = []
+        while len(received) < len(payloads):
+            received.extend(receiver.recv())
+        self.assertEqual([bytes(message) for (message, _) in received], payloads)
+        for (_, endpoint) in received:
+            self.assertEqual(endpoint, self.client.getsockname())
+        self.assertEqual(receiver.recv(block=False), [])
+        return sender, receiver
+
+    @unittest.skipUnless(mmsg.is_supported(), "recvmmsg/sendmmsg unavailable")
+    def test_mmsg_batched(self):
+        sender, receiver = self.exchange(batched=True)
+        self.assertEqual(sender.syscalls, 2)
+        self.assertLess(receiver.syscalls, receiver.messages)
+
+    def test_mmsg_fallback(self):
+        sender, _ = self.exchange(batched=False)
+        self.assertEqual(sender.syscalls, 6)
+
+    def send_with_error(self, batched):
+        sender = mmsg.BatchSender(self.client, batch=8)
+        sender.is_batched = batched and sender.is_batched
+        endpoint = self.server.getsockname()
+        # broadcast without SO_BROADCAST fails with EACCES.
+        for target in [endpoint, ("255.255.255.255", endpoint[1]), endpoint]:
+            sender.sendto(b"datagram", target)
+        sender.flush()
+        self.assertEqual(sender.errors, 1)
+        receiver = mmsg.BatchReceiver(self.server, batch=8, size=2048)
+        received = []
+        while len(received) < 2:
+            received.extend(receiver.recv())
+        return sender
+
+    @unittest.skipUnless(mmsg.is_supported(), "recvmmsg/sendmmsg unavailable")
+    def test_mmsg_batched_send_error(self):
+        self.send_with_error(batched=True)
+
+    def test_mmsg_fallback_send_error(self):
+        self.send_with_error(batched=False)
+
+    def test_mmsg_sockaddr(self):
+        endpoint = ("10.0.0.1", 5060)
+        packed = mmsg.pack_sockaddr_in(endpoint)
+        self.assertEqual(len(packed), mmsg.SOCKADDR_SIZE)
+        self.assertEqual(mmsg.unpack_sockaddr_in(packed), endpoint)
@@ -0,0 +1,90 @@
+# MIT License
+#
+# Copyright (c) 2018 Herbert Shin
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# https://github.com/initbar/sipd
+
+import json
+import threading
+import unittest
+
+from sipd.rtp.batch import StopSignalBatch
+from sipd.rtp.batch import pack_stop_signals
+
+
+class TestStopSignalBatch(unittest.TestCase):
+    def setUp(self):
+        self.call_ids = ["%032x@192.168.1.3" % i for i in range(1000)]
+
+    def test_batch_pack_single_datagram(self):
+        datagrams = pack_stop_signals(self.call_ids[:3])
+        self.assertEqual(len(datagrams), 1)
+        self.assertEqual(json.loads(datagrams[0]), {"Action": "stop-batch", "Call-IDs": self.call_ids[:3]})
+
+    def test_batch_pack_mtu(self):
+        datagrams = pack_stop_signals(self.call_ids, mtu=1400)
+        self.assertTrue(all(len(datagram) <= 1400 for datagram in datagrams))
+        # fill each datagram instead of sending one per call.
+        self.assertLess(len(datagrams), len(self.call_ids) / 20)
+        call_ids = [c for datagram in datagrams for c in json.loads(datagram)["Call-IDs"]]
+        self.assertEqual(call_ids, self.call_ids)
+
+    def test_batch_pack_empty(self):
+        self.assertEqual(pack_stop_signals([]), [])
+
+    def test_batch_flush(self):
+        handlers = [
+            {"host": "10.0.0.1", "port": 5061, "batch_stop": True},
+            {"host": "10.0.0.2", "port": "5061"},  # single stops only.
+        ]
+        sent = []
+        stops = StopSignalBatch(handlers)
+        for call_id in self.call_ids[:10] + self.call_ids[:2]:
+            stops.add(call_id)
+        self.assertEqual(len(stops), 10)
+        self.assertEqual(stops.flush(lambda data, endpoint: sent.append((endpoint, json.loads(data)))), 11)
+        self.assertEqual(len(stops), 0)
+
+        batched = [request for (endpoint, request) in sent if endpoint == ("10.0.0.1", 5061)]
+        self.assertEqual(batched, [{"Action": "stop-batch", "Call-IDs": self.call_ids[:10]}])
+        single = [request for (endpoint, request) in sent if endpoint == ("10.0.0.2", 5061)]
+        self.assertEqual(single, [{"Action": "stop", "Call-ID": c} for c in self.call_ids[:10]])
+        self.assertEqual(stops.flush(lambda data, endpoint: None), 0)
+
+    def test_batch_concurrent_flush(self):
+        handlers = [{"host": "10.0.0.1", "port": 5061, "batch_stop": True}]
+        stops = StopSignalBatch(handlers)
+        sent = []
+
+        def sendto(datagram, endpoint):
+            sent.extend(json.loads(datagram)["Call-IDs"])
+
+        def add():
+            for call_id in self.call_ids:
+                stops.add(call_id)
+
+        thread = threading.Thread(target=add)
+        thread.start()
+        while thread.is_alive():
+            stops.flush(sendto)
+        thread.join()
+        stops.flush(sendto)
+        self.assertEqual(sorted(sent), sorted(self.call_ids))
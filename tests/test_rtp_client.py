@@ -0,0 +1,145 @@
+# MIT License
+#
+# Copyright (c) 2018 Herbert Shin
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# https://github.com/initbar/sipd
+
+import asyncio
+import json
+import time
+import unittest
+
+from sipd.rtp.client import RTPControlClient
+
+
+class RTPHandlerProtocol(asyncio.DatagramProtocol):
+    """ RTP handler that replies after a per-Call-ID delay. """
+
+    def __init__(self, delays, echo=True):
+        self.delays = delays
+        self.echo = echo
+        self.requests = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.requests += 1
+        call_id = json.loads(data)["Call-ID"]
+        delay = self.delays.get(call_id, 0.0)
+        if delay is None:  # never reply.
+            return
+        reply = {"TxPort": 20000, "RxPort": 20002, "Port": call_id, "Request": self.requests}
+        if self.echo:
+            reply["Call-ID"] = call_id
+        asyncio.get_running_loop().call_later(delay, self.transport.sendto, json.dumps(reply).encode(), addr)
+
+
+def start_signal(call_id):
+    return json.dumps({"Action": "start", "Call-ID": call_id}).encode()
+
+
+class TestRTPControlClient(unittest.TestCase):
+    def run_client(self, scenario, delays, echo=True):
+        async def main():
+            loop = asyncio.get_running_loop()
+            transport, handler = await loop.create_datagram_endpoint(
+                lambda: RTPHandlerProtocol(delays, echo), local_addr=("127.0.0.1", 0)
+            )
+            client = RTPControlClient(transport.get_extra_info("sockname"), timeout=0.5)
+            try:
+                return await scenario(client, handler)
+            finally:
+                client.close()
+                transport.close()
+
+        return asyncio.run(main())
+
+    def test_rtp_client_matches_call_id(self):
+        async def scenario(client, handler):
+            return await asyncio.gather(
+                client.request("slow", start_signal("slow")),
+                client.request("fast", start_signal("fast")),
+            )
+
+        slow, fast = self.run_client(scenario, {"slow": 0.1, "fast": 0.0})
+        self.assertEqual(slow["Port"], "slow")
+        self.assertEqual(fast["Port"], "fast")
+
+    def test_rtp_client_matches_in_order(self):
+        async def scenario(client, handler):
+            return await asyncio.gather(*[client.request(str(i), start_signal(str(i))) for i in range(3)])
+
+        replies = self.run_client(scenario, {}, echo=False)
+        self.assertEqual([reply["Port"] for reply in replies], ["0", "1", "2"])
+
+    def test_rtp_client_pipelines_requests(self):
+        async def scenario(client, handler):
+            start = time.monotonic()
+            await asyncio.gather(*[client.request(str(i), start_signal(str(i))) for i in range(50)])
+            self.assertEqual(handler.requests, 50)
+            self.assertEqual(len(client), 0)
+            return time.monotonic() - start
+
+        elapsed = self.run_client(scenario, {str(i): 0.1 for i in range(50)})
+        self.assertLess(elapsed, 1.0)  # serialized, this would take 5 seconds.
+
+    def test_rtp_client_request_deadline(self):
+        async def scenario(client, handler):
+            lost = client.request("lost", start_signal("lost"), timeout=0.1)
+            found = client.request("found", start_signal("found"))
+            return await asyncio.gather(lost, found, return_exceptions=True)
+
+        lost, found = self.run_client(scenario, {"lost": None, "found": 0.2})
+        self.assertIsInstance(lost, asyncio.TimeoutError)
+        self.assertEqual(found["Port"], "found")
+
+    def test_rtp_client_learns_call_id_echo(self):
+        async def scenario(client, handler):
+            await client.request("a", start_signal("a"))
+            self.assertIsNone(client.protocol)  # the first request had its own socket.
+            await client.request("b", start_signal("b"))
+            return client
+
+        client = self.run_client(scenario, {})
+        self.assertTrue(client.echoes)
+        self.assertIsNotNone(client.protocol)
+
+    def test_rtp_client_late_reply_without_call_id(self):
+        async def scenario(client, handler):
+            with self.assertRaises(asyncio.TimeoutError):
+                await client.request("late", start_signal("late"), timeout=0.1)
+            # the late reply arrives while the next request is outstanding.
+            return await client.request("next", start_signal("next"))
+
+        reply = self.run_client(scenario, {"late": 0.15, "next": 0.1}, echo=False)
+        self.assertEqual(reply["Port"], "next")
+
+    def test_rtp_client_late_reply_tombstone(self):
+        async def scenario(client, handler):
+            await client.request("warmup", start_signal("warmup"))
+            with self.assertRaises(asyncio.TimeoutError):
+                await client.request("call", start_signal("call"), timeout=0.1)
+            # retried with the same Call-ID: the first reply must not answer it.
+            return await client.request("call", start_signal("call"))
+
+        reply = self.run_client(scenario, {"call": 0.15})
+        self.assertEqual(reply["Request"], 3)
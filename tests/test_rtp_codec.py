@@ -0,0 +1,81 @@
+# MIT License
+#
+# Copyright (c) 2018 Herbert Shin
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# https://github.com/initbar/sipd
+
+import os
+import tempfile
+import unittest
+import wave
+
+from sipd.rtp import codec
+
+
+class TestCodec(unittest.TestCase):
+
+    def test_codec_ulaw_samples(self):
+        table = codec.TABLES[codec.PCMU]
+        self.assertEqual(table.samples[0x00], -32124)
+        self.assertEqual(table.samples[0x80], 32124)
+        self.assertEqual(table.samples[0xff], 0)
+        self.assertEqual(table.samples[0x7f], 0)
+
+    def test_codec_alaw_samples(self):
+        table = codec.TABLES[codec.PCMA]
+        self.assertEqual(table.samples[0xd5], 8)
+        self.assertEqual(table.samples[0x55], -8)
+        self.assertEqual(table.samples[0xaa], 32256)
+        self.assertEqual(table.samples[0x2a], -32256)
+
+    def test_codec_decode_batch(self):
+        payload = bytes(range(256)) * 2
+        for payload_type in (codec.PCMU, codec.PCMA):
+            table = codec.TABLES[payload_type]
+            expected = b"".join(
+                (table.samples[octet] & 0xffff).to_bytes(2, "little") for octet in payload
+            )
+            self.assertEqual(codec.decode(payload, payload_type), expected)
+
+    def test_codec_decode_translate(self):
+        table = codec.DecodeTable(codec.decode_ulaw_sample)
+        table.array = None  # force the numpy-less path.
+        self.assertEqual(table.decode(bytes(range(256))), codec.decode(bytes(range(256)), codec.PCMU))
+
+    def test_codec_decode_unknown(self):
+        self.assertIsNone(codec.decode(b"\x00" * 10, 18))
+
+    def test_codec_wav_writer(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "call.wav")
+            writer = codec.WavWriter(path, batch=320)
+            for _ in range(3):
+                self.assertTrue(writer.write(b"\xff" * 160, codec.PCMU))
+            self.assertTrue(writer.write(b"\xd5" * 160, codec.PCMA))  # codec change.
+            self.assertFalse(writer.write(b"\x00" * 20, 18))
+            self.assertEqual(writer.duration, 0.08)
+            writer.close()
+            with wave.open(path, "rb") as f:
+                self.assertEqual((f.getnchannels(), f.getsampwidth(), f.getframerate()), (1, 2, 8000))
+                self.assertEqual(f.getnframes(), 640)
+                frames = f.readframes(640)
+            self.assertEqual(frames[:960], b"\x00" * 960)
+            self.assertEqual(frames[960:], b"\x08\x00" * 160)
@@ -0,0 +1,268 @@
+# MIT License
+#
+# Copyright (c) 2018 Herbert Shin
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# https://github.com/initbar/sipd
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import asyncio
+import gzip
+import math
+import os
+import struct
+import tempfile
+import time
+import unittest
+import wave
+
+from sipd.rtp import compress
+from sipd.rtp.compress import IMA_INDEX
+from sipd.rtp.compress import IMA_SAMPLES
+from sipd.rtp.compress import IMA_STEPS
+from sipd.rtp.compress import RecordingCompressor
+from sipd.rtp.compress import compress_recording
+from sipd.rtp.compress import encode_ima_adpcm
+from sipd.sip.garbage import AsynchronousGarbageCollector
+
+
+def decode_ima_adpcm(data, channels=1):
+    """ reference IMA-ADPCM WAV block decoder.
+    """
+    size = 256 * channels
+    output = [[] for _ in range(channels)]
+    for offset in range(0, len(data), size):
+        block = data[offset:offset + size]
+        state = []
+        for channel in range(channels):
+            (predictor, index, _) = struct.unpack_from("<hBB", block, 4 * channel)
+            output[channel].append(predictor)
+            state.append([predictor, index])
+        for group in range(4 * channels, size, 4 * channels):
+            for channel in range(channels):
+                for octet in block[group + 4 * channel:group + 4 * channel + 4]:
+                    for code in (octet & 0x0f, octet >> 4):
+                        (predictor, index) = state[channel]
+                        step = IMA_STEPS[index]
+                        delta = step >> 3
+                        delta += step if code & 4 else 0
+                        delta += step >> 1 if code & 2 else 0
+                        delta += step >> 2 if code & 1 else 0
+                        predictor = min(max(predictor - delta if code & 8 else predictor + delta, -32768), 32767)
+                        state[channel] = [predictor, min(max(index + IMA_INDEX[code], 0), 88)]
+                        output[channel].append(predictor)
+    return output
+
+
+def create_tone(frames, channels=1):
+    samples = []
+    for i in range(frames):
+        for channel in range(channels):
+            samples.append(int(8000 * math.sin(2 * math.pi * (400 + 200 * channel) * i / 8000)))
+    return struct.pack("<%dh" % len(samples), *samples)
+
+
+def write_wav(path, pcm, channels=1):
+    with wave.open(path, "wb") as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(8000)
+        f.writeframes(pcm)
+
+
+class TestCompress(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def assertCloseTo(self, decoded, pcm, channels):
+        samples = struct.unpack("<%dh" % (len(pcm) // 2), pcm)
+        for channel in range(channels):
+            original = samples[channel::channels]
+            error = [abs(a - b) for (a, b) in zip(decoded[channel][16:len(original)], original[16:])]
+            self.assertLess(sum(error) / len(error), 320)  # 4% of the amplitude.
+
+    def test_compress_ima_adpcm_mono(self):
+        pcm = create_tone(2000)
+        data = encode_ima_adpcm(pcm)
+        self.assertEqual(len(data), 4 * 256)  # 2000 samples in 505 sample blocks.
+        self.assertCloseTo(decode_ima_adpcm(data), pcm, 1)
+
+    def test_compress_ima_adpcm_stereo(self):
+        pcm = create_tone(1000, channels=2)
+        data = encode_ima_adpcm(pcm, channels=2)
+        self.assertEqual(len(data), 2 * 512)
+        self.assertCloseTo(decode_ima_adpcm(data, channels=2), pcm, 2)
+
+    def test_compress_ima_adpcm_backends(self):
+        if compress.numpy is None:
+            self.skipTest("numpy is not installed.")
+        pcm = create_tone(3 * IMA_SAMPLES + 7, channels=2)  # the last block is padded.
+        vectorized = encode_ima_adpcm(pcm, channels=2)
+        numpy, compress.numpy = compress.numpy, None
+        try:
+            self.assertEqual(encode_ima_adpcm(pcm, channels=2), vectorized)
+        finally:
+            compress.numpy = numpy
+
+    def test_compress_ima_adpcm_batches(self):
+        pcm = create_tone(3 * IMA_SAMPLES + 7, channels=2)
+        data = encode_ima_adpcm(pcm, channels=2)
+        batch, compress.IMA_BATCH = compress.IMA_BATCH, 1
+        try:
+            self.assertEqual(encode_ima_adpcm(pcm, channels=2), data)
+        finally:
+            compress.IMA_BATCH = batch
+
+    def test_compress_ima_adpcm_empty(self):
+        self.assertEqual(encode_ima_adpcm(b""), b"")
+
+    def test_compress_recording_adpcm(self):
+        path = os.path.join(self.directory.name, "call.caller.wav")
+        write_wav(path, create_tone(8000))
+        (output, input_bytes, output_bytes, cpu) = compress_recording(path, "adpcm")
+        self.assertEqual(output, os.path.join(self.directory.name, "call.caller.adpcm.wav"))
+        self.assertFalse(os.path.exists(path))
+        self.assertLess(output_bytes * 3, input_bytes)
+        with open(output, "rb") as f:
+            data = f.read()
+        self.assertEqual(data[:4] + data[8:16], b"RIFFWAVEfmt ")
+        self.assertEqual(struct.unpack_from("<HH", data, 20), (0x0011, 1))
+        self.assertEqual(data[40:44], b"fact")
+        self.assertEqual(struct.unpack_from("<I", data, 48)[0], 8000)
+
+    def test_compress_recording_adpcm_batches(self):
+        path = os.path.join(self.directory.name, "call.stereo.wav")
+        pcm = create_tone(8000, channels=2)
+        write_wav(path, pcm, channels=2)
+        batch, compress.IMA_BATCH = compress.IMA_BATCH, 2  # read in 2 block batches.
+        try:
+            (output, _, output_bytes, _) = compress_recording(path, "adpcm")
+        finally:
+            compress.IMA_BATCH = batch
+        with open(output, "rb") as f:
+            data = f.read()
+        self.assertEqual(len(data), output_bytes)
+        self.assertEqual(struct.unpack_from("<I", data, 4)[0], len(data) - 8)
+        self.assertEqual(struct.unpack_from("<I", data, 48)[0], 8000)
+        self.assertEqual(data[52:56], b"data")
+        self.assertEqual(struct.unpack_from("<I", data, 56)[0], len(data) - 60)
+        self.assertEqual(data[60:], encode_ima_adpcm(pcm, channels=2))
+
+    def test_compress_recording_gzip(self):
+        path = os.path.join(self.directory.name, "call.caller.raw")
+        with open(path, "wb") as f:
+            f.write(b"\xff" * 16000)
+        (output, _, output_bytes, _) = compress_recording(path, "adpcm")  # not PCM.
+        self.assertEqual(output, path + ".gz")
+        with gzip.open(output, "rb") as f:
+            self.assertEqual(f.read(), b"\xff" * 16000)
+
+    def test_compress_compressor(self):
+        paths = []
+        for i in range(3):
+            paths.append(os.path.join(self.directory.name, "call-%s.caller.wav" % i))
+            write_wav(paths[-1], create_tone(4000))
+        compressor = RecordingCompressor(method="gzip", workers=1, max_queue=1)
+        try:
+            compressor.submit(paths)
+            # one recording is compressing, one is waiting, and one is left.
+            self.assertEqual(compressor.metrics.rejected, 1)
+            self.assertEqual(compressor.metrics.submitted, 2)
+            deadline = time.monotonic() + 30
+            while len(compressor) and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            compressor.close(wait=True)
+        self.assertEqual((compressor.metrics.completed, compressor.metrics.failed), (2, 0))
+        self.assertTrue(os.path.exists(paths[2]))
+        self.assertGreater(compressor.metrics.total_time, 0)
+        self.assertLess(compressor.metrics.ratio, 1)
+        compressor.submit(paths[2:])  # closed.
+        self.assertEqual(compressor.metrics.rejected, 2)
+
+    def test_compress_compressor_failure(self):
+        compressor = RecordingCompressor(method="gzip")
+        try:
+            with self.assertLogs(level="ERROR"):
+                compressor.submit([os.path.join(self.directory.name, "missing.wav")])
+                deadline = time.monotonic() + 30
+                while len(compressor) and time.monotonic() < deadline:
+                    time.sleep(0.01)
+        finally:
+            compressor.close(wait=True)
+        self.assertEqual(compressor.metrics.failed, 1)
+
+    def test_compress_compressor_broken_pool(self):
+        class BrokenExecutor(object):
+            def submit(self, *args):
+                raise BrokenProcessPool("a worker died.")
+
+            def shutdown(self, wait=True):
+                pass
+
+        compressor = RecordingCompressor(method="gzip")
+        compressor.executor.shutdown()
+        compressor.executor = BrokenExecutor()
+        try:
+            with self.assertLogs(level="ERROR"):
+                compressor.submit([os.path.join(self.directory.name, "call.caller.wav")])
+            self.assertEqual((compressor.metrics.failed, compressor.running), (1, 0))
+            self.assertIsInstance(compressor.executor, ProcessPoolExecutor)  # replaced.
+        finally:
+            compressor.close(wait=True)
+
+    def test_compress_method(self):
+        with self.assertRaises(ValueError):
+            RecordingCompressor(method="mp3")
+
+    def test_compress_revoke(self):
+        class Router(object):
+            def get_stream_stats(self, call_id):
+                return
+
+            def get_dtmf_events(self, call_id):
+                return
+
+            def get_recording_paths(self, call_id):
+                return ["call.caller.wav", "call.agent.wav"]
+
+            def send_stop_signal(self, call_id):
+                pass
+
+        class Compressor(object):
+            submitted = []
+
+            def submit(self, paths):
+                self.submitted.extend(paths)
+
+        loop = asyncio.new_event_loop()
+        try:
+            gc = AsynchronousGarbageCollector({"gc": {"call_lifetime": 60}}, loop=loop)
+            (gc.rtp, gc.compressor) = (Router(), Compressor())
+            gc.register("call")
+            gc.expire("call")
+            self.assertEqual(gc.compressor.submitted, ["call.caller.wav", "call.agent.wav"])
+        finally:
+            loop.close()
@@ -0,0 +1,84 @@
+# MIT License
+#
+# Copyright (c) 2018 Herbert Shin
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# https://github.com/initbar/sipd
+
+import unittest
+
+from sipd.rtp.dtmf import TELEPHONE_EVENT_PAYLOAD
+from sipd.rtp.dtmf import DtmfExtractor
+from sipd.rtp.packet import parse_rtp_packet
+from tests.test_rtp_packet import create_rtp_packet
+
+
+def create_event_packet(sequence, timestamp, event, duration, end=False):
+    payload = TELEPHONE_EVENT_PAYLOAD.pack(event, (0x80 if end else 0) | 10, duration)
+    return parse_rtp_packet(create_rtp_packet(sequence, timestamp, payload=payload, payload_type=96))
+
+
+def create_audio_packet(sequence, timestamp):
+    return parse_rtp_packet(create_rtp_packet(sequence, timestamp))
+
+
+class TestDtmf(unittest.TestCase):
+
+    def test_dtmf_event(self):
+        dtmf = DtmfExtractor()
+        dtmf.receive(create_audio_packet(1, 1000))
+        for (i, duration) in enumerate([160, 320, 480]):
+            dtmf.receive(create_event_packet(2 + i, 9000, 5, duration))
+        for i in range(3):  # redundant end packets.
+            dtmf.receive(create_event_packet(5 + i, 9000, 5, 640, end=True))
+        dtmf.receive(create_audio_packet(8, 9800))
+        self.assertEqual(dtmf.events, [(1.0, "5", 0.08)])
+
+    def test_dtmf_sequence(self):
+        dtmf = DtmfExtractor()
+        dtmf.receive(create_audio_packet(1, 0))
+        for (i, event) in enumerate([1, 10, 11]):
+            timestamp = 8000 * (i + 1)
+            dtmf.receive(create_event_packet(10 * i, timestamp, event, 160))
+            dtmf.receive(create_event_packet(10 * i + 1, timestamp, event, 800, end=True))
+            dtmf.receive(create_event_packet(10 * i + 2, timestamp, event, 800, end=True))
+        self.assertEqual(dtmf.digits, "1*#")
+        self.assertEqual([event[0] for event in dtmf.events], [1.0, 2.0, 3.0])
+
+    def test_dtmf_lost_end(self):
+        dtmf = DtmfExtractor()
+        dtmf.receive(create_event_packet(1, 0, 7, 160))
+        dtmf.receive(create_event_packet(2, 0, 7, 320))
+        dtmf.receive(create_event_packet(3, 1600, 8, 160))  # next event starts.
+        self.assertEqual(dtmf.events, [(0.0, "7", 0.04)])
+        self.assertEqual(dtmf.close(), [(0.0, "7", 0.04), (0.2, "8", 0.02)])
+
+    def test_dtmf_ignored(self):
+        dtmf = DtmfExtractor()
+        dtmf.receive(create_audio_packet(1, 0))
+        dtmf.receive(create_event_packet(2, 160, 16, 800, end=True))  # flash.
+        dtmf.receive(parse_rtp_packet(create_rtp_packet(3, 320, payload=b"\x01", payload_type=96)))
+        self.assertEqual(dtmf.close(), [])
+
+    def test_dtmf_timestamp_wraparound(self):
+        dtmf = DtmfExtractor()
+        dtmf.receive(create_audio_packet(1, 0xffffff00))
+        dtmf.receive(create_event_packet(2, 0x00000100, 3, 800, end=True))
+        self.assertEqual(dtmf.events, [(0.064, "3", 0.1)])
@@ -0,0 +1,137 @@
+# MIT License
+#
+# Copyright (c) 2018 Herbert Shin
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# https://github.com/initbar/sipd
+
+import asyncio
+import json
+import time
+import unittest
+
+from sipd.rtp.server import AsynchronousRTPRouter
+
+
+class RTPHandlerProtocol(asyncio.DatagramProtocol):
+    """ RTP handler that replies after a fixed delay. """
+
+    def __init__(self, delay, port):
+        self.delay = delay
+        self.port = port
+        self.started = []
+        self.stopped = []
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        request = json.loads(data)
+        if request["Action"] == "stop":
+            self.stopped.append(request["Call-ID"])
+            return
+        self.started.append(request["Call-ID"])
+        reply = {"Call-ID": request["Call-ID"], "TxPort": self.port, "RxPort": self.port + 1}
+        asyncio.get_running_loop().call_later(self.delay, self.transport.sendto, json.dumps(reply).encode(), addr)
+
+
+class Message(object):
+    call_id = "call"
+
+    def __init__(self):
+        self.sdp = []
+
+    def get(self, key, default=None):
+        return default
+
+
+class TestHedgedStartSignal(unittest.TestCase):
+    def run_router(self, scenario, delays, hedge):
+        async def main():
+            loop = asyncio.get_running_loop()
+            handlers, transports = [], []
+            for (i, delay) in enumerate(delays):
+                transport, handler = await loop.create_datagram_endpoint(
+                    lambda: RTPHandlerProtocol(delay, 20000 + 10 * i), local_addr=("127.0.0.1", 0)
+                )
+                transports.append(transport)
+                handlers.append(handler)
+            router = AsynchronousRTPRouter({
+                "sip": {"server": {"address": "127.0.0.1"}},
+                "rtp": {
+                    "handlers": [
+                        {"enabled": True, "host": "127.0.0.1", "port": t.get_extra_info("sockname")[1]}
+                        for t in transports
+                    ],
+                    "hedge": hedge,
+                    "timeout": 1.0,
+                },
+            })
+            try:
+                return await scenario(router, handlers)
+            finally:
+                router.close()
+                for transport in transports:
+                    transport.close()
+
+        return asyncio.run(main())
+
+    def test_hedge_slow_handler(self):
+        async def scenario(router, handlers):
+            start = time.monotonic()
+            message = await router.send_start_signal(Message())
+            elapsed = time.monotonic() - start
+            await asyncio.sleep(0.05)
+            return message, elapsed
+
+        hedge = {"enabled": True, "min_samples": 0, "min_delay": 0.01}
+        (message, elapsed) = self.run_router(scenario, [0.5, 0.0], hedge)
+        self.assertIn("m=audio 20010 RTP/AVP 0 8 18 96", message.sdp)
+        self.assertLess(elapsed, 0.25)
+
+    def test_hedge_stops_loser(self):
+        async def scenario(router, handlers):
+            await router.send_start_signal(Message())
+            await asyncio.sleep(0.05)
+            self.assertEqual(router.hedges, 1)
+            self.assertEqual(router.hedge_wins, 1)
+            self.assertEqual(handlers[0].stopped, ["call"])
+            self.assertEqual(handlers[1].stopped, [])
+            self.assertEqual([h.outstanding for h in router.balancer.handlers], [0, 0])
+
+        self.run_router(scenario, [0.5, 0.0], {"enabled": True, "min_samples": 0, "min_delay": 0.01})
+
+    def test_hedge_not_needed(self):
+        async def scenario(router, handlers):
+            message = await router.send_start_signal(Message())
+            self.assertIn("m=audio 20000 RTP/AVP 0 8 18 96", message.sdp)
+            self.assertEqual(router.hedges, 0)
+            self.assertEqual(handlers[1].started, [])
+
+        self.run_router(scenario, [0.0, 0.0], {"enabled": True})
+
+    def test_hedge_disabled(self):
+        async def scenario(router, handlers):
+            start = time.monotonic()
+            await router.send_start_signal(Message())
+            self.assertGreaterEqual(time.monotonic() - start, 0.2)
+            self.assertEqual(router.hedges, 0)
+
+        self.run_router(scenario, [0.2, 0.0], {"enabled": False})
@@ -0,0 +1,144 @@
+# MIT License
+#
+# Copyright (c) 2018 Herbert Shin
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# https://github.com/initbar/sipd
+
+import os
+import tempfile
+import unittest
+import wave
+
+from sipd.rtp.mixer import MixerChannel
+from sipd.rtp.mixer import StereoMixer
+from sipd.rtp.mixer import interleave
+from sipd.rtp.packet import parse_rtp_packet
+from tests.test_rtp_packet import create_rtp_packet
+
+
+def pcm(value, frames):
+    return value.to_bytes(2, "little", signed=True) * frames
+
+
+class TestMixer(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "call.stereo.wav")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def read_frames(self):
+        with wave.open(self.path, "rb") as f:
+            self.assertEqual(f.getnchannels(), 2)
+            data = f.readframes(f.getnframes())
+        return [
+            (int.from_bytes(data[i:i + 2], "little", signed=True),
+             int.from_bytes(data[i + 2:i + 4], "little", signed=True))
+            for i in range(0, len(data), 4)
+        ]
+
+    def test_mixer_interleave(self):
+        self.assertEqual(interleave(pcm(1, 2), pcm(-1, 2)), (pcm(1, 1) + pcm(-1, 1)) * 2)
+
+    def test_mixer_align_and_fill(self):
+        mixer = StereoMixer(self.path, window=100)
+        mixer.write(0, 0, pcm(1, 4))
+        mixer.write(1, 2, pcm(2, 4))  # starts later.
+        mixer.write(0, 6, pcm(3, 2))  # frames 4 and 5 are lost.
+        mixer.close()
+        self.assertEqual(self.read_frames(), [
+            (1, 0), (1, 0), (1, 2), (1, 2), (0, 2), (0, 2), (3, 0), (3, 0),
+        ])
+
+    def test_mixer_late(self):
+        mixer = StereoMixer(self.path, window=100)
+        mixer.write(0, 0, pcm(1, 4))
+        mixer.write(1, 0, pcm(2, 4))
+        self.assertEqual(mixer.frames, 4)
+        mixer.write(1, 2, pcm(3, 4))  # half of it was already written.
+        self.assertEqual(mixer.late, 2)
+        mixer.close()
+        self.assertEqual(self.read_frames()[4:], [(0, 3), (0, 3)])
+
+    def test_mixer_bounded(self):
+        mixer = StereoMixer(self.path, window=10)
+        for position in range(0, 1000, 5):  # the other channel is silent.
+            mixer.write(0, position, pcm(1, 5))
+            self.assertLessEqual(len(mixer.buffers[0]), 10 * 2)
+        mixer.write(0, 100000, pcm(1, 5))  # timestamp jump.
+        self.assertLessEqual(len(mixer.buffers[0]), 10 * 2)
+        mixer.close()
+        frames = self.read_frames()
+        self.assertEqual(len(frames), 100005)
+        self.assertEqual(frames[999], (1, 0))
+        self.assertEqual(frames[1000], (0, 0))
+
+    def test_mixer_channels(self):
+        now = [0.0]
+        mixer = StereoMixer(self.path, window=8000)
+        caller = MixerChannel(mixer, 0, clock=lambda: now[0])
+        agent = MixerChannel(mixer, 1, clock=lambda: now[0])
+        caller.write(parse_rtp_packet(create_rtp_packet(1, timestamp=1000, payload=b"\xff" * 160)))
+        now[0] = 0.01  # agent audio starts 80 samples later.
+        agent.write(parse_rtp_packet(create_rtp_packet(7, timestamp=50000, payload=b"\x80" * 160, ssrc=2)))
+        caller.write(parse_rtp_packet(create_rtp_packet(3, timestamp=1320, payload=b"\x80" * 160)))
+        caller.write(parse_rtp_packet(create_rtp_packet(4, timestamp=1480, payload=b"\x00" * 20, payload_type=18)))
+        self.assertEqual(caller.skipped, 1)
+        caller.close()
+        self.assertIsNotNone(mixer.file)
+        agent.close()
+        self.assertIsNone(mixer.file)
+        frames = self.read_frames()
+        self.assertEqual(len(frames), 480)
+        self.assertEqual(frames[79], (0, 0))
+        self.assertEqual(frames[80], (0, 32124))
+        self.assertEqual(frames[240], (0, 0))  # lost caller packet.
+        self.assertEqual(frames[320], (32124, 0))
+
+    def test_mixer_max_gap(self):
+        mixer = StereoMixer(self.path, window=10, max_gap=100)
+        mixer.write(0, 0, pcm(1, 5))
+        mixer.write(0, 10 ** 9, pcm(2, 5))  # near 2^31 bytes of silence.
+        self.assertEqual(mixer.shortened, 10 ** 9 - 105)
+        mixer.close()
+        frames = self.read_frames()
+        self.assertEqual(len(frames), 110)
+        self.assertEqual(frames[105], (2, 0))
+
+    def test_mixer_channel_timestamp_jump(self):
+        now = [0.0]
+        mixer = StereoMixer(self.path)
+        caller = MixerChannel(mixer, 0, clock=lambda: now[0])
+        caller.write(parse_rtp_packet(create_rtp_packet(1, timestamp=1000, payload=b"\xff" * 160)))
+        now[0] = 0.04
+        # an hour ahead on the same SSRC: placed by arrival time instead.
+        caller.write(parse_rtp_packet(create_rtp_packet(2, timestamp=1000 + 3600 * 8000, payload=b"\x80" * 160)))
+        caller.write(parse_rtp_packet(create_rtp_packet(3, timestamp=1160 + 3600 * 8000, payload=b"\x80" * 160)))
+        self.assertEqual(caller.end, 320 + 320)
+        # a reset back to zero on the same SSRC keeps the leg going.
+        caller.write(parse_rtp_packet(create_rtp_packet(4, timestamp=0, payload=b"\xff" * 160)))
+        self.assertEqual(caller.end, 320 + 320 + 160)
+        caller.close()
+        mixer.close()
+        frames = self.read_frames()
+        self.assertEqual(len(frames), 800)
+        self.assertEqual(frames[320], (32124, 0))
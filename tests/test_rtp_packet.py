@@ -0,0 +1,113 @@
+# MIT License
+#
+# Copyright (c) 2018 Herbert Shin
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# https://github.com/initbar/sipd
+
+import unittest
+
+from sipd.rtp.packet import RTP_HEADER
+from sipd.rtp.packet import JitterBuffer
+from sipd.rtp.packet import parse_rtp_packet
+
+
+def create_rtp_packet(sequence, timestamp=0, payload=b"\xff" * 160, payload_type=0, ssrc=1):
+    return RTP_HEADER.pack(0x80, payload_type, sequence & 0xffff, timestamp, ssrc) + payload
+
+
+class TestRtpPacket(unittest.TestCase):
+
+    #
+    # RTP header
+    #
+
+    def test_packet_parse(self):
+        packet = parse_rtp_packet(create_rtp_packet(7, timestamp=160, payload=b"abc", payload_type=8))
+        self.assertEqual((packet.payload_type, packet.sequence, packet.timestamp), (8, 7, 160))
+        self.assertEqual(packet.marker, 0)
+        self.assertEqual(packet.payload, b"abc")
+
+    def test_packet_parse_marker(self):
+        packet = parse_rtp_packet(create_rtp_packet(1, payload_type=0x80 | 96))
+        self.assertEqual((packet.marker, packet.payload_type), (1, 96))
+
+    def test_packet_parse_csrc_extension_padding(self):
+        data = RTP_HEADER.pack(0x80 | 0x20 | 0x10 | 2, 0, 1, 0, 1)
+        data += b"\x00" * 8  # two CSRC identifiers.
+        data += b"\xbe\xde\x00\x01" + b"\x00" * 4  # one word of extension.
+        data += b"abc" + b"\x00\x00\x03"  # three octets of padding.
+        self.assertEqual(parse_rtp_packet(data).payload, b"abc")
+
+    def test_packet_parse_invalid(self):
+        self.assertIsNone(parse_rtp_packet(b""))
+        self.assertIsNone(parse_rtp_packet(b"\x00" * 12))  # version 0.
+        self.assertIsNone(parse_rtp_packet(RTP_HEADER.pack(0x8f, 0, 1, 0, 1)))  # truncated CSRC.
+
+    #
+    # jitter buffer
+    #
+
+    def release(self, jitter, sequences, ssrc=1):
+        ready = []
+        for sequence in sequences:
+            ready.extend(jitter.push(parse_rtp_packet(create_rtp_packet(sequence, ssrc=ssrc))))
+        return [packet.sequence for packet in ready]
+
+    def test_jitter_reorder(self):
+        jitter = JitterBuffer(depth=4)
+        self.assertEqual(self.release(jitter, [1, 3, 2, 5, 4]), [1, 2, 3, 4, 5])
+
+    def test_jitter_duplicate_and_late(self):
+        jitter = JitterBuffer(depth=4)
+        self.assertEqual(self.release(jitter, [1, 2, 2, 1, 3]), [1, 2, 3])
+        self.assertEqual((jitter.duplicates, jitter.late), (0, 2))
+        self.release(jitter, [5, 5])
+        self.assertEqual(jitter.duplicates, 1)
+
+    def test_jitter_loss(self):
+        jitter = JitterBuffer(depth=2)
+        self.assertEqual(self.release(jitter, [1, 3, 4, 5, 6]), [1, 3, 4, 5, 6])
+        self.assertEqual(jitter.lost, 1)
+
+    def test_jitter_wraparound(self):
+        jitter = JitterBuffer(depth=4)
+        self.assertEqual(self.release(jitter, [0xfffe, 0, 0xffff, 1]), [0xfffe, 0xffff, 0, 1])
+
+    def test_jitter_flush(self):
+        jitter = JitterBuffer(depth=8)
+        self.assertEqual(self.release(jitter, [1, 4, 3]), [1])
+        self.assertEqual([packet.sequence for packet in jitter.flush()], [3, 4])
+        self.assertEqual((len(jitter), jitter.lost), (0, 1))
+
+    def test_jitter_new_ssrc(self):
+        jitter = JitterBuffer(depth=4)
+        self.assertEqual(len(self.release(jitter, range(1000, 1100))), 100)
+        # the stream restarts at a lower sequence number.
+        self.assertEqual(self.release(jitter, range(10, 510), ssrc=2), list(range(10, 510)))
+        self.assertEqual((jitter.late, jitter.resyncs), (0, 1))
+
+    def test_jitter_sequence_reset(self):
+        jitter = JitterBuffer(depth=4)
+        self.release(jitter, range(1000, 1100))
+        # a single stray packet is dropped; two sequential ones resync.
+        self.assertEqual(self.release(jitter, [40000, 1100]), [1100])
+        self.assertEqual(self.release(jitter, range(10, 510)), list(range(11, 510)))
+        self.assertEqual((jitter.late, jitter.resyncs), (2, 1))
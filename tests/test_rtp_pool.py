@@ -0,0 +1,144 @@
+# MIT License
+#
+# Copyright (c) 2018 Herbert Shin
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# https://github.com/initbar/sipd
+
+import asyncio
+import json
+import unittest
+
+from sipd.rtp.pool import PortLeasePool
+from sipd.rtp.server import AsynchronousRTPRouter
+
+
+class RTPHandlerProtocol(asyncio.DatagramProtocol):
+    """ RTP handler that hands out consecutive port pairs. """
+
+    def __init__(self):
+        self.started = []
+        self.stopped = []
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        request = json.loads(data)
+        if request["Action"] == "stop":
+            self.stopped.append(request["Call-ID"])
+            return
+        self.started.append(request["Call-ID"])
+        port = 20000 + 2 * len(self.started)
+        reply = {"Call-ID": request["Call-ID"], "TxPort": port, "RxPort": port + 1}
+        self.transport.sendto(json.dumps(reply).encode(), addr)
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestPortLeasePool(unittest.TestCase):
+    def run_pool(self, scenario, **kw):
+        async def main():
+            loop = asyncio.get_running_loop()
+            transport, handler = await loop.create_datagram_endpoint(RTPHandlerProtocol, local_addr=("127.0.0.1", 0))
+            port = transport.get_extra_info("sockname")[1]
+            router = AsynchronousRTPRouter({
+                "sip": {"server": {"address": "127.0.0.1"}},
+                "rtp": {"handlers": [{"enabled": True, "host": "127.0.0.1", "port": port}]},
+            })
+            pool = router.pool = PortLeasePool(router, **kw)
+            try:
+                await scenario(pool, handler)
+            finally:
+                pool.stop()
+                router.close()
+                transport.close()
+
+        asyncio.run(main())
+
+    def test_pool_refill(self):
+        async def scenario(pool, handler):
+            self.assertEqual(await pool.refill(), 4)
+            self.assertEqual(len(pool), 4)
+            self.assertEqual(len(handler.started), 4)
+            self.assertEqual(await pool.refill(), 0)  # already full.
+
+        self.run_pool(scenario, size=4)
+
+    def test_pool_take_and_stop(self):
+        async def scenario(pool, handler):
+            await pool.refill()
+            lease = pool.take("call")
+            self.assertEqual(lease.lease_id, handler.started[0])
+            self.assertEqual(pool.hits, 1)
+            # the handler is asked to stop the ports by their lease ID.
+            pool.router.send_stop_signal("call")
+            await asyncio.sleep(0.05)
+            self.assertEqual(handler.stopped, [lease.lease_id])
+            self.assertEqual(pool.unbind("call"), "call")
+
+        self.run_pool(scenario, size=2)
+
+    def test_pool_lease_ports(self):
+        class Message(object):
+            call_id = "call"
+
+            def __init__(self):
+                self.sdp = []
+
+        async def scenario(pool, handler):
+            self.assertIsNone(pool.router.lease_ports(Message()))
+            self.assertEqual(pool.misses, 1)
+            await pool.refill()
+            message = pool.router.lease_ports(Message())
+            self.assertIn("m=audio 20002 RTP/AVP 0 8 18 96", message.sdp)
+
+        self.run_pool(scenario, size=1)
+
+    def test_pool_expire(self):
+        clock = Clock()
+
+        async def scenario(pool, handler):
+            await pool.refill()
+            clock.now = 11.0
+            self.assertIsNone(pool.take("call"))
+            self.assertEqual(pool.expired, 2)
+            await asyncio.sleep(0.05)
+            self.assertEqual(sorted(handler.stopped), sorted(handler.started))
+
+        self.run_pool(scenario, size=2, lifetime=10.0, clock=clock)
+
+    def test_pool_background_refill(self):
+        async def scenario(pool, handler):
+            pool.start(interval=0.01)
+            await asyncio.sleep(0.05)
+            self.assertEqual(len(pool), 4)
+            for _ in range(3):
+                pool.take("call")
+            await asyncio.sleep(0.05)  # below the low-water mark.
+            self.assertEqual(len(pool), 4)
+
+        self.run_pool(scenario, size=4, low_water=2)
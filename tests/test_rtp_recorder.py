@@ -0,0 +1,209 @@
+# MIT License
+#
+# Copyright (c) 2018 Herbert Shin
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# https://github.com/initbar/sipd
+
+import asyncio
+import os
+import socket
+import tempfile
+import unittest
+import wave
+
+from sipd.rtp.recorder import PortAllocator
+from sipd.rtp.recorder import RecordingLeg
+from sipd.rtp.recorder import RTPRecorder
+from sipd.rtp.recorder import WavFileSink
+from sipd.rtp.server import AsynchronousRTPRouter
+from sipd.sip.garbage import AsynchronousGarbageCollector
+from tests.test_rtp_packet import create_rtp_packet
+
+
+class DiskFullSink(object):
+
+    path = "full.wav"
+
+    def __init__(self):
+        self.writes = 0
+        self.closed = False
+
+    def write(self, packet):
+        self.writes += 1
+        raise OSError(28, "No space left on device")
+
+    def close(self):
+        self.closed = True
+
+
+class TestRTPRecorder(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings = {
+            "sip": {"server": {"address": "127.0.0.1"}},
+            "rtp": {
+                "recorder": {
+                    "directory": self.directory.name,
+                    "format": "raw",
+                    "host": "127.0.0.1",
+                    "ports": [41000, 41100],
+                },
+            },
+        }
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_recorder_port_allocator(self):
+        allocator = PortAllocator(20001, 20010)
+        self.assertEqual(allocator.allocate(), (20002, 20004))
+        self.assertEqual(allocator.allocate(), (20006, 20008))
+        self.assertIsNone(allocator.allocate())
+        allocator.release((20002, 20004))
+        allocator.release((20002, 20004))  # twice.
+        self.assertEqual(len(allocator), 1)
+        self.assertEqual(allocator.allocate(), (20002, 20004))
+
+    def test_recorder_records_legs(self):
+        async def main():
+            recorder = RTPRecorder(self.settings)
+            reply = await recorder.start("call@192.168.1.3")
+            self.assertEqual(await recorder.start("call@192.168.1.3"), reply)  # idempotent.
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as client:
+                for sequence in (1, 3, 2):  # out of order.
+                    payload = bytes([sequence]) * 160
+                    client.sendto(create_rtp_packet(sequence, payload=payload), ("127.0.0.1", reply["TxPort"]))
+                client.sendto(create_rtp_packet(1, payload=b"\x07" * 160), ("127.0.0.1", reply["RxPort"]))
+                client.sendto(create_rtp_packet(2, payload_type=96, payload=b"\x01\x0a\x00\xa0"), ("127.0.0.1", reply["RxPort"]))
+                client.sendto(b"not rtp", ("127.0.0.1", reply["RxPort"]))
+                await asyncio.sleep(0.05)
+            stats = recorder.get_stream_stats("call@192.168.1.3")
+            self.assertEqual((stats["caller"].packets, stats["caller"].reordered), (3, 1))
+            dtmf = recorder.get_dtmf_events("call@192.168.1.3")
+            recording = recorder.stop("call@192.168.1.3")
+            self.assertEqual(dtmf, {"caller": [], "agent": [(0.0, "1", 0.02)]})  # never ended.
+            self.assertIsNone(recorder.get_stream_stats("call@192.168.1.3"))
+            self.assertEqual([leg.packets for leg in recording.legs], [3, 2])
+            self.assertEqual(recording.legs[1].invalid, 1)
+            self.assertEqual(len(recorder), 0)
+            self.assertIsNone(recorder.stop("call@192.168.1.3"))
+            return reply
+
+        reply = asyncio.run(main())
+        self.assertEqual((reply["TxPort"], reply["RxPort"]), (41000, 41002))
+        with open(os.path.join(self.directory.name, "call@192.168.1.3.caller.raw"), "rb") as f:
+            self.assertEqual(f.read(), b"\x01" * 160 + b"\x02" * 160 + b"\x03" * 160)
+        with open(os.path.join(self.directory.name, "call@192.168.1.3.agent.raw"), "rb") as f:
+            self.assertEqual(f.read(), b"\x07" * 160)  # telephone-event is not audio.
+
+    def test_recorder_records_wav(self):
+        async def main():
+            recorder = RTPRecorder(self.settings, sink=WavFileSink)
+            reply = await recorder.start("call")
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as client:
+                for sequence in (1, 2):
+                    client.sendto(create_rtp_packet(sequence, payload=b"\xff" * 160), ("127.0.0.1", reply["TxPort"]))
+                await asyncio.sleep(0.05)
+            recorder.stop("call")
+
+        asyncio.run(main())
+        with wave.open(os.path.join(self.directory.name, "call.caller.wav"), "rb") as f:
+            self.assertEqual(f.readframes(f.getnframes()), b"\x00" * 640)
+        with wave.open(os.path.join(self.directory.name, "call.agent.wav"), "rb") as f:
+            self.assertEqual(f.getnframes(), 0)
+
+    def test_recorder_records_stereo(self):
+        self.settings["rtp"]["recorder"]["format"] = "stereo"
+
+        async def main():
+            recorder = RTPRecorder(self.settings)
+            reply = await recorder.start("call")
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as client:
+                client.sendto(create_rtp_packet(1, payload=b"\x80" * 160), ("127.0.0.1", reply["TxPort"]))
+                client.sendto(create_rtp_packet(1, payload=b"\x00" * 160), ("127.0.0.1", reply["RxPort"]))
+                await asyncio.sleep(0.05)
+            recorder.stop("call")
+
+        asyncio.run(main())
+        with wave.open(os.path.join(self.directory.name, "call.stereo.wav"), "rb") as f:
+            self.assertEqual(f.getnchannels(), 2)
+            self.assertGreaterEqual(f.getnframes(), 160)
+
+    def test_recorder_stereo_vad(self):
+        self.settings["rtp"]["recorder"]["format"] = "stereo"
+        self.settings["rtp"]["vad"] = {"enabled": True, "mode": "drop", "min_silence": 0.01}
+
+        async def main():
+            recorder = RTPRecorder(self.settings)
+            reply = await recorder.start("call")
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as client:
+                client.sendto(create_rtp_packet(1, payload=b"\xff" * 160), ("127.0.0.1", reply["TxPort"]))
+                await asyncio.sleep(0.05)
+            recorder.stop("call")
+
+        asyncio.run(main())
+        with wave.open(os.path.join(self.directory.name, "call.stereo.wav"), "rb") as f:
+            self.assertEqual(f.getnframes(), 0)  # the silent mix is dropped.
+        self.assertTrue(os.path.exists(os.path.join(self.directory.name, "call.stereo.vad")))
+
+    def test_recorder_finalized_on_expiry(self):
+        self.settings["rtp"]["handlers"] = []
+        self.settings["gc"] = {"call_lifetime": 60}
+
+        async def main():
+            router = AsynchronousRTPRouter(self.settings)
+            router.recorder = RTPRecorder(self.settings, sink=WavFileSink)
+            gc = AsynchronousGarbageCollector(self.settings, loop=asyncio.get_running_loop())
+            gc.rtp = router
+            reply = await router.recorder.start("call")
+            gc.register("call")
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as client:
+                client.sendto(create_rtp_packet(1, payload=b"\xff" * 160), ("127.0.0.1", reply["TxPort"]))
+                await asyncio.sleep(0.05)
+            gc.expire("call")  # the call never hung up.
+            self.assertEqual(len(router.recorder), 0)
+
+        asyncio.run(main())
+        with wave.open(os.path.join(self.directory.name, "call.caller.wav"), "rb") as f:
+            self.assertEqual(f.getnframes(), 160)
+
+    def test_recorder_skips_used_ports(self):
+        async def main():
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as taken:
+                taken.bind(("127.0.0.1", 41000))
+                recorder = RTPRecorder(self.settings)
+                reply = await recorder.start("call")
+                recorder.close()
+                return reply
+
+        reply = asyncio.run(main())
+        self.assertEqual(reply["TxPort"], 41004)
+
+    def test_recorder_sink_failure(self):
+        sink = DiskFullSink()
+        leg = RecordingLeg("call", "caller", sink, depth=4)
+        for sequence in range(3):
+            leg.receive(create_rtp_packet(sequence))
+        leg.close()
+        self.assertTrue(leg.failed)
+        self.assertEqual(sink.writes, 1)  # the leg stopped writing.
+        self.assertEqual(leg.stats.counters()["packets"], 3)
+        self.assertTrue(sink.closed)
@@ -0,0 +1,193 @@
+# MIT License
+#
+# Copyright (c) 2018 Herbert Shin
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# https://github.com/initbar/sipd
+
+import json
+import socket
+import threading
+import unittest
+
+from sipd.lib.sip.options import SIP_OPTIONS_SAMPLE
+from sipd.rtp.router import RTPBalancer
+from sipd.rtp.router import RTPHandler
+from sipd.rtp.server import SynchronousRTPRouter
+from sipd.sip.message import SipMessage
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRTPBalancer(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+
+    def create_balancer(self, strategy, weights=(1, 1, 1), **kw):
+        handlers = [RTPHandler(("10.0.0.%s" % i, 5061), weight=w) for (i, w) in enumerate(weights)]
+        return RTPBalancer(handlers, strategy=strategy, clock=self.clock, **kw)
+
+    def test_balancer_unknown_strategy(self):
+        with self.assertRaises(ValueError):
+            self.create_balancer("random")
+
+    def test_balancer_empty(self):
+        balancer = RTPBalancer([], clock=self.clock)
+        self.assertIsNone(balancer.select("call"))
+
+    def test_balancer_weighted_round_robin(self):
+        balancer = self.create_balancer("round-robin", weights=(1, 2, 5))
+        picks = [balancer.select().weight for _ in range(80)]
+        self.assertEqual([picks.count(w) for w in (1, 2, 5)], [10, 20, 50])
+        # smooth: the heaviest handler is never picked more than twice in a row.
+        self.assertNotIn([5, 5, 5], [picks[i:i + 3] for i in range(len(picks) - 2)])
+
+    def test_balancer_least_outstanding(self):
+        balancer = self.create_balancer("least-outstanding")
+        first = balancer.select()
+        balancer.begin(first)
+        second = balancer.select()
+        self.assertIsNot(first, second)
+        balancer.begin(second)
+        third = balancer.select()
+        self.assertNotIn(third, (first, second))
+
+    def test_balancer_least_outstanding_latency(self):
+        balancer = self.create_balancer("least-outstanding")
+        for (handler, latency) in zip(balancer.handlers, (0.3, 0.1, 0.2)):
+            started = balancer.begin(handler)
+            self.clock.now += latency
+            balancer.success(handler, started)
+        self.assertIs(balancer.select(), balancer.handlers[1])
+
+    def test_balancer_consistent_hash(self):
+        balancer = self.create_balancer("consistent-hash")
+        owner = balancer.select("call")
+        self.assertIs(balancer.select("call"), owner)
+        # failover to the next handler on the ring, then back.
+        for _ in range(balancer.failure_threshold):
+            balancer.failure(owner, timeout=True)
+        failover = balancer.select("call")
+        self.assertIsNotNone(failover)
+        self.assertIsNot(failover, owner)
+        self.assertNotIn(balancer.select("call", exclude=[failover]), (None, owner, failover))
+        self.clock.now += balancer.cooldown
+        balancer.success(owner, balancer.begin(balancer.select("call")))
+        self.assertIs(balancer.select("call"), owner)
+
+    def test_balancer_circuit_breaker(self):
+        balancer = self.create_balancer("round-robin", weights=(1,), failure_threshold=2, cooldown=5.0)
+        handler = balancer.handlers[0]
+        for _ in range(2):
+            balancer.begin(handler)
+            balancer.failure(handler, timeout=True)
+        self.assertEqual(handler.state, "open")
+        self.assertIsNone(balancer.select())
+
+        # a single probe after the cooldown.
+        self.clock.now += 5.0
+        probe = balancer.select()
+        self.assertIs(probe, handler)
+        started = balancer.begin(probe)
+        self.assertEqual(handler.state, "half-open")
+        self.assertIsNone(balancer.select())
+
+        # a failed probe re-opens the circuit.
+        balancer.failure(handler, timeout=False)
+        self.assertEqual(handler.state, "open")
+        self.clock.now += 5.0
+        started = balancer.begin(balancer.select())
+        balancer.success(handler, started)
+        self.assertEqual(handler.state, "closed")
+        self.assertIs(balancer.select(), handler)
+
+    def test_balancer_spread_single_probe(self):
+        balancer = self.create_balancer("round-robin", weights=(1, 1), failure_threshold=1)
+        (probe, healthy) = balancer.handlers
+        balancer.begin(probe)
+        balancer.failure(probe, timeout=True)
+        self.clock.now += balancer.cooldown
+        handlers = balancer.spread(6)
+        self.assertEqual(handlers.count(probe), 1)
+        self.assertEqual(handlers.count(healthy), 5)
+
+    def test_balancer_send_error_ends_probe(self):
+        # broadcast without SO_BROADCAST: sendto fails with EACCES.
+        handler = {"enabled": True, "host": "255.255.255.255", "port": 5061}
+        router = SynchronousRTPRouter({"rtp": {"handlers": [handler], "failure_threshold": 1}})
+        self.assertIsNone(router.handle(SipMessage.from_buffer(SIP_OPTIONS_SAMPLE.encode())))
+        (handler,) = router.balancer.handlers
+        self.assertEqual(handler.outstanding, 0)
+        self.assertEqual(handler.state, "open")
+
+    def request_ports(self, reply):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as handler_socket:
+            handler_socket.bind(("127.0.0.1", 0))
+            handler_socket.settimeout(2.0)
+
+            def serve():
+                (_, addr) = handler_socket.recvfrom(0xffff)
+                handler_socket.sendto(reply, addr)
+
+            thread = threading.Thread(target=serve)
+            thread.start()
+            handler = {"enabled": True, "host": "127.0.0.1", "port": handler_socket.getsockname()[1]}
+            router = SynchronousRTPRouter({"rtp": {"handlers": [handler]}, "sip": {"server": {"address": "127.0.0.1"}}})
+            message = router.handle(SipMessage.from_buffer(SIP_OPTIONS_SAMPLE.encode()))
+            thread.join()
+            return message
+
+    def test_balancer_invalid_reply(self):
+        with self.assertLogs(level="ERROR"):
+            self.assertIsNone(self.request_ports(b"not json"))
+        self.assertIsNone(self.request_ports(b"[20000, 20002]"))
+
+    def test_balancer_long_reply(self):
+        reply = {"TxPort": 20000, "RxPort": 20002, "X-Padding": "x" * 512}
+        message = self.request_ports(json.dumps(reply).encode())
+        self.assertIn("m=audio 20000 RTP/AVP 0 8 18 96", message.sdp)
+
+    def test_balancer_counters(self):
+        balancer = self.create_balancer("round-robin", weights=(1,))
+        handler = balancer.handlers[0]
+        balancer.success(handler, balancer.begin(handler))
+        balancer.begin(handler)
+        balancer.failure(handler, timeout=True)
+        balancer.begin(handler)
+        balancer.cancel(handler)
+        counters = balancer.counters()["10.0.0.0:5061"]
+        self.assertEqual(counters["requests"], 3)
+        self.assertEqual(counters["replies"], 1)
+        self.assertEqual(counters["timeouts"], 1)
+        self.assertEqual(counters["outstanding"], 0)
+
+    def test_balancer_latency_percentile(self):
+        handler = RTPHandler(("10.0.0.1", 5061), window=101)
+        self.assertEqual(handler.percentile(95), 0.0)
+        handler.latencies.extend(i / 100.0 for i in range(101))
+        self.assertAlmostEqual(handler.percentile(50), 0.5)
+        self.assertAlmostEqual(handler.percentile(95), 0.95)
+        self.assertAlmostEqual(handler.percentile(100), 1.0)
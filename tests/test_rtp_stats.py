@@ -0,0 +1,127 @@
+# MIT License
+#
+# Copyright (c) 2018 Herbert Shin
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# https://github.com/initbar/sipd
+
+import asyncio
+import unittest
+
+from sipd.rtp.packet import parse_rtp_packet
+from sipd.rtp.stats import StreamStats
+from sipd.sip.garbage import AsynchronousGarbageCollector
+from tests.test_rtp_packet import create_rtp_packet
+
+
+def receive(stats, sequences, interval=0.02):
+    for (i, sequence) in enumerate(sequences):
+        packet = parse_rtp_packet(create_rtp_packet(sequence, timestamp=(sequence * 160) & 0xffffffff))
+        stats.update(packet, i * interval)
+
+
+class FakeRouter(object):
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.stopped = []
+
+    def get_stream_stats(self, call_id):
+        return self.stats
+
+    def get_dtmf_events(self, call_id):
+        return
+
+    def get_recording_paths(self, call_id):
+        return
+
+    def send_stop_signal(self, call_id):
+        self.stopped.append(call_id)
+
+
+class TestStreamStats(unittest.TestCase):
+
+    def test_stats_in_order(self):
+        stats = StreamStats()
+        receive(stats, range(100, 150))
+        self.assertEqual((stats.packets, stats.expected, stats.lost), (50, 50, 0))
+        self.assertEqual((stats.duplicates, stats.reordered), (0, 0))
+        self.assertEqual(stats.octets, 50 * 160)
+        self.assertAlmostEqual(stats.jitter, 0.0)
+
+    def test_stats_loss(self):
+        stats = StreamStats()
+        receive(stats, [1, 2, 5, 6])
+        self.assertEqual((stats.expected, stats.lost), (6, 2))
+
+    def test_stats_duplicates_and_reorder(self):
+        stats = StreamStats()
+        receive(stats, [1, 3, 2, 3, 2, 4])
+        self.assertEqual((stats.packets, stats.duplicates, stats.reordered, stats.lost), (4, 2, 1, 0))
+
+    def test_stats_wraparound(self):
+        stats = StreamStats()
+        receive(stats, [0xfffe, 0xffff, 0, 1])
+        self.assertEqual((stats.expected, stats.lost, stats.cycles), (4, 0, 1 << 16))
+
+    def test_stats_jitter(self):
+        stats = StreamStats()
+        # every packet arrives 10ms off its 20ms schedule.
+        for (i, arrival) in enumerate([0.0, 0.03, 0.04, 0.07, 0.08]):
+            stats.update(parse_rtp_packet(create_rtp_packet(i, timestamp=i * 160)), arrival)
+        self.assertGreater(stats.jitter_ms, 0)
+        self.assertLess(stats.jitter_ms, 10)
+        self.assertEqual(stats.counters()["jitter"], round(stats.jitter_ms, 3))
+
+    def test_stats_restart(self):
+        stats = StreamStats()
+        receive(stats, range(100, 300))
+        # the sender restarts: new SSRC, sequence numbers and timestamps.
+        for i in range(200):
+            packet = create_rtp_packet(30000 + i, timestamp=5000000 + i * 160, ssrc=2)
+            stats.update(parse_rtp_packet(packet), 4.0 + i * 0.02)
+        self.assertEqual((stats.packets, stats.expected, stats.lost), (400, 400, 0))
+        self.assertEqual(stats.resyncs, 1)
+        self.assertLess(stats.jitter_ms, 1)
+
+    def test_stats_sequence_reset(self):
+        stats = StreamStats()
+        receive(stats, [1000, 1001, 1002])
+        receive(stats, [20000])  # a stray packet is dropped.
+        self.assertEqual((stats.packets, stats.expected, stats.resyncs), (3, 3, 0))
+        receive(stats, [5, 6, 7])  # the same SSRC restarts its sequence numbers.
+        self.assertEqual((stats.packets, stats.expected, stats.lost), (5, 5, 0))
+        self.assertEqual(stats.resyncs, 1)
+
+    def test_stats_call_metadata(self):
+        loop = asyncio.new_event_loop()
+        try:
+            gc = AsynchronousGarbageCollector({"gc": {"call_lifetime": 60}}, loop=loop)
+            stats = {"caller": StreamStats()}
+            gc.rtp = FakeRouter(stats)
+            gc.register("call")
+            self.assertIs(gc.calls.get("call").stats, stats)
+            receive(stats["caller"], [1, 3])
+            with self.assertLogs(level="INFO") as logs:
+                gc.revoke("call")
+            self.assertEqual(gc.rtp.stopped, ["call"])
+            self.assertTrue(any("'lost': 1" in line for line in logs.output))
+        finally:
+            loop.close()
@@ -0,0 +1,127 @@
+# MIT License
+#
+# Copyright (c) 2018 Herbert Shin
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# https://github.com/initbar/sipd
+
+import os
+import tempfile
+import unittest
+import wave
+
+from sipd.rtp import vad
+from sipd.rtp.codec import WavWriter
+from sipd.rtp.mixer import StereoMixer
+from sipd.rtp.mixer import interleave
+from sipd.rtp.vad import EnergyDetector
+
+SPEECH = (8000).to_bytes(2, "little", signed=True) * 160  # 20ms at -12dBFS.
+SILENCE = (10).to_bytes(2, "little", signed=True) * 160  # 20ms at -70dBFS.
+
+
+class TestVad(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.index = os.path.join(self.directory.name, "call.caller.vad")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def read_index(self):
+        with open(self.index) as f:
+            return [tuple(map(float, line.split())) for line in f]
+
+    def test_vad_classify(self):
+        detector = EnergyDetector(self.index)
+        self.assertEqual(detector.classify(SPEECH + SILENCE + SPEECH[:100]), [False, True, False])
+
+    def test_vad_classify_without_numpy(self):
+        numpy, vad.numpy = vad.numpy, None
+        try:
+            detector = EnergyDetector(self.index)
+            self.assertEqual(detector.classify(SPEECH + SILENCE + SPEECH[:100]), [False, True, False])
+        finally:
+            vad.numpy = numpy
+
+    def test_vad_classify_rms(self):
+        # a click: the peak is above the threshold, the RMS level is not.
+        click = (1000).to_bytes(2, "little", signed=True) + b"\x00" * 318
+        numpy, vad.numpy = vad.numpy, None
+        try:
+            self.assertEqual(EnergyDetector(self.index).classify(click), [True])
+        finally:
+            vad.numpy = numpy
+        if vad.numpy is not None:
+            self.assertEqual(EnergyDetector(self.index).classify(click), [True])
+
+    def test_vad_mark(self):
+        detector = EnergyDetector(self.index, min_silence=0.1, mode="mark")
+        pcm = SPEECH + SILENCE * 10 + SPEECH + SILENCE * 2 + SPEECH
+        self.assertEqual(detector.process(pcm), pcm)
+        self.assertEqual(detector.close(), b"")
+        self.assertEqual(self.read_index(), [(0.02, 0.22)])  # the short pause is not indexed.
+
+    def test_vad_drop(self):
+        detector = EnergyDetector(self.index, min_silence=0.1, mode="drop")
+        kept = b""
+        # the long run spans batches.
+        for pcm in [SPEECH + SILENCE * 3, SILENCE * 7 + SPEECH + SILENCE * 2, SPEECH + SILENCE * 20]:
+            kept += detector.process(pcm)
+        kept += detector.close()
+        self.assertEqual(kept, SPEECH + SPEECH + SILENCE * 2 + SPEECH)
+        self.assertEqual(self.read_index(), [(0.02, 0.22), (0.3, 0.7)])
+        self.assertEqual(detector.dropped, 30 * 160)
+
+    def test_vad_mode(self):
+        with self.assertRaises(ValueError):
+            EnergyDetector(self.index, mode="unknown")
+
+    def test_vad_wav_writer(self):
+        path = os.path.join(self.directory.name, "call.caller.wav")
+        writer = WavWriter(path, batch=1600, detector=EnergyDetector(self.index, mode="drop"))
+        writer.write(b"\x00" * 160, 0)  # loud mu-law.
+        for _ in range(100):
+            writer.write(b"\xff" * 160, 0)  # mu-law silence.
+        writer.write(b"\x00" * 160, 0)
+        writer.close()
+        with wave.open(path, "rb") as f:
+            self.assertEqual(f.getnframes(), 320)
+        self.assertEqual(writer.frames, 320)  # dropped silence is not counted.
+        self.assertEqual(writer.duration, 0.04)
+        self.assertEqual(self.read_index(), [(0.02, 2.02)])
+
+    def test_vad_stereo(self):
+        detector = EnergyDetector(self.index, min_silence=0.1, mode="drop", channels=2)
+        # a frame is silent only if both channels are.
+        pcm = interleave(SPEECH + SILENCE * 10 + SILENCE, SILENCE + SILENCE * 10 + SPEECH)
+        self.assertEqual(detector.process(pcm) + detector.close(), interleave(SPEECH + SILENCE, SILENCE + SPEECH))
+        self.assertEqual(self.read_index(), [(0.02, 0.22)])
+
+    def test_vad_stereo_mixer(self):
+        path = os.path.join(self.directory.name, "call.stereo.wav")
+        mixer = StereoMixer(path, detector=EnergyDetector(self.index, mode="drop", channels=2))
+        mixer.write(0, 0, SPEECH)
+        mixer.write(1, 160 * 100, SPEECH)  # 2s of silence on both channels.
+        mixer.close()
+        with wave.open(path, "rb") as f:
+            self.assertEqual(f.getnframes(), 320)
+        self.assertEqual(mixer.frames, 160 * 101)
+        self.assertEqual(self.read_index(), [(0.02, 2.0)])
@@ -0,0 +1,107 @@
+# MIT License
+#
+# Copyright (c) 2018 Herbert Shin
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# https://github.com/initbar/sipd
+
+import errno
+import os
+import tempfile
+import unittest
+import wave
+
+from unittest import mock
+
+from sipd.rtp.wavfile import MappedWavFile
+from sipd.rtp.wavfile import generate_wav_header
+
+
+class TestWavFile(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "call.wav")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def read(self):
+        with wave.open(self.path, "rb") as f:
+            return (f.getnchannels(), f.getnframes(), f.readframes(f.getnframes()))
+
+    def test_wavfile_header(self):
+        header = generate_wav_header(320, channels=2)
+        self.assertEqual(len(header), 44)
+        self.assertEqual(header[:4] + header[8:16], b"RIFFWAVEfmt ")
+        self.assertEqual(int.from_bytes(header[4:8], "little"), 36 + 320)
+        self.assertEqual(int.from_bytes(header[40:44], "little"), 320)
+
+    def test_wavfile_write(self):
+        wav = MappedWavFile(self.path, extent=4096)
+        data = bytes(range(256)) * 40  # 10240 bytes: three extents.
+        for i in range(0, len(data), 320):
+            wav.write(data[i:i + 320])
+        self.assertEqual(wav.allocated, 3 * 4096)
+        self.assertEqual(wav.frames, 5120)
+        wav.close()
+        wav.close()  # twice.
+        self.assertTrue(wav.closed)
+        self.assertEqual(os.path.getsize(self.path), 44 + len(data))
+        self.assertEqual(self.read(), (1, 5120, data))
+
+    def test_wavfile_preallocated(self):
+        wav = MappedWavFile(self.path, extent=4096)
+        wav.write(b"\x01\x00" * 100)
+        self.assertEqual(os.path.getsize(self.path), 4096)
+        wav.close()
+        self.assertEqual(os.path.getsize(self.path), 244)
+
+    def test_wavfile_checkpoint(self):
+        wav = MappedWavFile(self.path, extent=4096)
+        wav.write(b"\x01\x00" * 3000)  # crosses into the second extent.
+        # the process dies here: the header covers the data up to the last
+        # allocated extent.
+        with open(self.path, "rb") as f:
+            header = f.read(44)
+        self.assertEqual(int.from_bytes(header[40:44], "little"), 4096 - 44)
+        wav.close()
+        self.assertEqual(self.read()[:2], (1, 3000))
+
+    def test_wavfile_empty(self):
+        MappedWavFile(self.path).close()
+        self.assertEqual(self.read(), (1, 0, b""))
+
+    def test_wavfile_disk_full(self):
+        wav = MappedWavFile(self.path, extent=4096)
+        error = OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+        with mock.patch("os.posix_fallocate", side_effect=error):
+            with self.assertRaises(OSError):
+                wav.write(b"\x01\x00" * 3000)
+        self.assertEqual(os.path.getsize(self.path), 44)  # no sparse extent.
+        wav.close()
+        self.assertEqual(self.read()[:2], (1, 0))
+
+    def test_wavfile_not_supported(self):
+        wav = MappedWavFile(self.path, extent=4096)
+        error = OSError(errno.EOPNOTSUPP, os.strerror(errno.EOPNOTSUPP))
+        with mock.patch("os.posix_fallocate", side_effect=error):
+            wav.write(b"\x01\x00" * 3000)
+        wav.close()
+        self.assertEqual(self.read()[:2], (1, 3000))
@@ -0,0 +1,160 @@
+# MIT License
+#
+# Copyright (c) 2018 Herbert Shin
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# https://github.com/initbar/sipd
+
+import asyncio
+import json
+import socket
+import unittest
+
+from sipd.lib.sip.options import SIP_OPTIONS_SAMPLE
+from sipd.sip.server import AsynchronousUDPServer
+
+SIP_INVITE_SAMPLE = (
+    SIP_OPTIONS_SAMPLE.replace("OPTIONS", "INVITE")
+    .replace("z9hG4bK0x2473c35084b6b1", "z9hG4bK0x2473c35084b6b2")
+    .replace("-15064@", "-15065@")
+)
+
+
+class RTPHandlerProtocol(asyncio.DatagramProtocol):
+    """ RTP handler that replies with RX/TX ports after a delay. """
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.requests = []
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.requests.append(json.loads(data))
+        reply = json.dumps({"TxPort": 20000, "RxPort": 20002}).encode()
+        asyncio.get_running_loop().call_later(self.delay, self.transport.sendto, reply, addr)
+
+
+class SipClientProtocol(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.responses = asyncio.Queue()
+
+    def datagram_received(self, data, addr):
+        self.responses.put_nowait(data.split(b"\r\n", 1)[0].decode())
+
+
+class TestAsynchronousServer(unittest.TestCase):
+    def run_server(self, scenario, delay=0.0, handlers=True, max_calls=100):
+        async def main():
+            loop = asyncio.get_running_loop()
+            rtp_transport, rtp = await loop.create_datagram_endpoint(
+                lambda: RTPHandlerProtocol(delay), local_addr=("127.0.0.1", 0)
+            )
+            settings = {
+                "server": {"host": "127.0.0.1", "port": 0},
+                "sip": {"server": {"address": "127.0.0.1"}, "worker": {"headers": {}}},
+                "gc": {"call_lifetime": 60, "max_calls": max_calls},
+                "rtp": {
+                    "handlers": [
+                        {"enabled": handlers, "host": "127.0.0.1", "port": rtp_transport.get_extra_info("sockname")[1]},
+                    ],
+                    "timeout": 1.0,
+                },
+            }
+            server = AsynchronousUDPServer(settings=settings)
+            await server.start()
+            endpoint = server.transport.get_extra_info("sockname")
+            client_transport, client = await loop.create_datagram_endpoint(
+                SipClientProtocol, remote_addr=endpoint
+            )
+            try:
+                return await asyncio.wait_for(scenario(server, client_transport, client, rtp), 5)
+            finally:
+                client_transport.close()
+                rtp_transport.close()
+                server.stop()
+
+        return asyncio.run(main())
+
+    def test_server_invite(self):
+        async def scenario(server, transport, client, rtp):
+            transport.sendto(SIP_INVITE_SAMPLE.encode())
+            responses = [await client.responses.get() for _ in range(3)]
+            self.assertIn(SIP_INVITE_SAMPLE.split("Call-ID: ")[1].split("\n")[0], server.worker.gc.calls)
+            self.assertEqual(rtp.requests[0]["Action"], "start")
+            return responses
+
+        responses = self.run_server(scenario)
+        self.assertEqual(responses, ["SIP/2.0 100 Trying", "SIP/2.0 180 Ringing", "SIP/2.0 200 OK"])
+
+    def test_server_does_not_block_on_rtp_handler(self):
+        async def scenario(server, transport, client, rtp):
+            transport.sendto(SIP_INVITE_SAMPLE.encode())
+            self.assertEqual(await client.responses.get(), "SIP/2.0 100 Trying")
+            self.assertEqual(await client.responses.get(), "SIP/2.0 180 Ringing")
+            # OPTIONS is answered while the INVITE still waits on its ports.
+            transport.sendto(SIP_OPTIONS_SAMPLE.encode())
+            self.assertEqual(await client.responses.get(), "SIP/2.0 200 OK")
+            self.assertEqual(len(server.worker.tasks), 1)
+            self.assertEqual(await client.responses.get(), "SIP/2.0 200 OK")
+            await asyncio.sleep(0)
+            self.assertEqual(len(server.worker.tasks), 0)
+
+        self.run_server(scenario, delay=0.2)
+
+    def test_server_rtp_handler_disabled(self):
+        async def scenario(server, transport, client, rtp):
+            transport.sendto(SIP_INVITE_SAMPLE.encode())
+            return [await client.responses.get() for _ in range(3)]
+
+        responses = self.run_server(scenario, handlers=False)
+        self.assertEqual(responses[-1], "SIP/2.0 200 OK")
+
+    def test_server_refused_after_negotiation(self):
+        async def scenario(server, transport, client, rtp):
+            # both INVITEs are admitted while the registry is still empty.
+            transport.sendto(SIP_INVITE_SAMPLE.encode())
+            transport.sendto(SIP_INVITE_SAMPLE.replace("-15065@", "-15066@").replace("b2", "b3").encode())
+            responses = [await client.responses.get() for _ in range(6)]
+            await asyncio.sleep(0.05)  # stop signal.
+            self.assertEqual(len(server.worker.gc.calls), 1)
+            self.assertEqual([request["Action"] for request in rtp.requests], ["start", "start", "stop"])
+            return responses
+
+        responses = self.run_server(scenario, delay=0.1, max_calls=1)
+        self.assertEqual(sorted(responses[-2:]), ["SIP/2.0 200 OK", "SIP/2.0 486 Busy Here"])
+
+    def test_server_keeps_router_on_error(self):
+        async def scenario(server, transport, client, rtp):
+            router = server.worker.rtp
+
+            def handle(message, action="start"):
+                raise AttributeError("handler")
+
+            router.handle = handle
+            transport.sendto(SIP_INVITE_SAMPLE.encode())
+            responses = [await client.responses.get() for _ in range(3)]
+            self.assertIs(server.worker.rtp, router)
+            self.assertIs(server.worker.gc.rtp, router)
+            return responses
+
+        responses = self.run_server(scenario)
+        self.assertEqual(responses[-1], "SIP/2.0 200 OK")
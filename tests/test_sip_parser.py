@@ -0,0 +1,138 @@
+# MIT License
+#
+# Copyright (c) 2018 Herbert Shin
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# https://github.com/initbar/sipd
+
+
+import unittest
+
+from sipd.lib.sip.ok import SIP_OK
+from sipd.lib.sip.ok import SIP_OK_NO_SDP
+from sipd.lib.sip.ok import SIP_OK_SAMPLE
+from sipd.lib.sip.options import SIP_OPTIONS
+from sipd.lib.sip.options import SIP_OPTIONS_SAMPLE
+from sipd.lib.sip.ringing import SIP_RINGING
+from sipd.lib.sip.ringing import SIP_RINGING_SAMPLE
+from sipd.lib.sip.trying import SIP_TRYING
+from sipd.sip.parser import compile_sip_template
+from sipd.sip.parser import convert_to_sip_message
+from sipd.sip.parser import parse_sip_buffer
+from sipd.sip.parser import parse_sip_message
+from sipd.sip.parser import peek_call_id
+from sipd.sip.parser import render_sip_template
+
+
+class TestSipParser(unittest.TestCase):
+
+    #
+    # SIP buffer unpack
+    #
+
+    def assertSameDatagram(self, message):
+        for line_break in ("\n", "\r\n"):
+            sample = message.replace("\n", line_break)
+            answer = parse_sip_message(sample)
+            attempt = parse_sip_buffer(memoryview(sample.encode()))
+            self.assertEqual(attempt, answer)
+            if answer:
+                self.assertEqual(list(attempt["sip"]), list(answer["sip"]))
+
+    def test_parser_parse_sip_buffer_empty(self):
+        for datatype in [b"", bytearray(), memoryview(b"")]:
+            self.assertEqual(parse_sip_buffer(datatype), {})
+
+    def test_parser_parse_sip_buffer_invalid_method(self):
+        self.assertIsNone(parse_sip_buffer(b"HELLO sip:127.0.0.1 SIP/2.0\r\n"))
+
+    def test_parser_parse_sip_buffer_single_header(self):
+        self.assertSameDatagram(SIP_OPTIONS_SAMPLE)
+
+    def test_parser_parse_sip_buffer_multiple_headers(self):
+        self.assertSameDatagram(SIP_OPTIONS_SAMPLE + "Supported: X\n")
+
+    def test_parser_parse_sip_buffer_multiple_values(self):
+        self.assertSameDatagram(SIP_OPTIONS_SAMPLE + "Via: SIP/2.0/TCP 192.168.1.4:7090\n")
+
+    def test_parser_parse_sip_buffer_unknown_status(self):
+        self.assertSameDatagram(SIP_RINGING_SAMPLE)
+
+    def test_parser_parse_sip_buffer_sdp(self):
+        self.assertSameDatagram(SIP_OK_SAMPLE)
+
+    def test_parser_parse_sip_buffer_leading_line_breaks(self):
+        self.assertSameDatagram("\n\n" + SIP_OPTIONS_SAMPLE)
+
+    def test_parser_parse_sip_buffer_not_utf8(self):
+        buffer = SIP_OPTIONS_SAMPLE.encode() + b"X-\xff\xfe: \xc3\n"
+        datagram = parse_sip_buffer(buffer)
+        self.assertEqual(datagram["sip"]["X-\ufffd\ufffd"], "\ufffd")
+
+    def test_parser_parse_sip_buffer_lazy_decoding(self):
+        buffer = bytearray(SIP_OPTIONS_SAMPLE.encode())
+        datagram = parse_sip_buffer(memoryview(buffer))
+        (start, end), = datagram["sip"].spans("Call-ID")
+        self.assertEqual(buffer[start:end], b"9E565000-FB73-F13E-6076-D8822FB9A4E4-15064@192.168.1.3")
+        # values are not decoded until they are read.
+        buffer[start:start + 8] = b"00000000"
+        self.assertEqual(datagram["sip"]["Call-ID"], "00000000-FB73-F13E-6076-D8822FB9A4E4-15064@192.168.1.3")
+
+    #
+    # SIP template render
+    #
+
+    def test_parser_compile_sip_template_static_chunks(self):
+        segments = compile_sip_template(SIP_OK_NO_SDP, sip_version="2.0")
+        self.assertEqual(segments[0], b"SIP/2.0 200 OK\r\n")
+        self.assertEqual(segments[-1], b"Content-Length: 0\r\n\r\n")
+
+    def test_parser_render_sip_template_same_as_convert(self):
+        datagram = parse_sip_message(SIP_OPTIONS_SAMPLE)
+        datagram = {"sip": dict(datagram["sip"]), "sdp": ["v=0", "s=phone-call"]}
+        for template in [SIP_OK, SIP_OK_NO_SDP, SIP_RINGING, SIP_TRYING]:
+            # keep the status line placeholder as `convert_to_sip_message` does.
+            segments = compile_sip_template(template, sip_version="%(sip_version)s")
+            self.assertEqual(
+                render_sip_template(segments, datagram),
+                convert_to_sip_message(template, datagram).encode(),
+            )
+
+    def test_parser_render_sip_template_status_line_params(self):
+        datagram = parse_sip_message(SIP_OPTIONS_SAMPLE)
+        segments = compile_sip_template(SIP_OPTIONS, sip_version="2.0")
+        response = render_sip_template(segments, datagram, remote_ip="127.0.0.1", remote_port=5060)
+        self.assertTrue(response.startswith(b"OPTIONS sip:127.0.0.1:5060 SIP/2.0\r\n"))
+        self.assertTrue(response.endswith(b"Content-Length: 0\r\n\r\n"))
+
+    #
+    # Call-ID peek
+    #
+
+    def test_parser_peek_call_id(self):
+        buffer = memoryview(SIP_OPTIONS_SAMPLE.replace("\n", "\r\n").encode())
+        self.assertEqual(peek_call_id(buffer), b"9E565000-FB73-F13E-6076-D8822FB9A4E4-15064@192.168.1.3")
+
+    def test_parser_peek_call_id_compact_form(self):
+        self.assertEqual(peek_call_id(b"BYE sip:a SIP/2.0\r\ni: abc@host\r\n"), b"abc@host")
+        self.assertEqual(peek_call_id(b"BYE sip:a SIP/2.0\r\nCALL-ID:abc@host\r\n"), b"abc@host")
+
+    def test_parser_peek_call_id_missing(self):
+        self.assertIsNone(peek_call_id(b"BYE sip:a SIP/2.0\r\nVia: i: x\r\n"))
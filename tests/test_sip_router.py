@@ -0,0 +1,87 @@
+# MIT License
+#
+# Copyright (c) 2018 Herbert Shin
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# https://github.com/initbar/sipd
+
+
+import socket
+import unittest
+
+from sipd.net.mmsg import BatchReceiver
+from sipd.sip.router import create_shard_routers
+
+NAMES = ["worker-0", "worker-1"]
+
+
+def create_message(call_id):
+    return ("BYE sip:a SIP/2.0\r\nCall-ID: %s\r\nCSeq: 2 BYE\r\n\r\n" % call_id).encode()
+
+
+class TestShardRouter(unittest.TestCase):
+    def setUp(self):
+        self.routers = create_shard_routers(NAMES)
+        self.sockets = []
+        for _ in NAMES:
+            udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            udp_socket.bind(("127.0.0.1", 0))
+            self.sockets.append(udp_socket)
+        self.receivers = [BatchReceiver(udp_socket, batch=4) for udp_socket in self.sockets]
+        self.client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.client.bind(("127.0.0.1", 0))
+
+    def tearDown(self):
+        self.client.close()
+        for udp_socket in self.sockets:
+            udp_socket.close()
+        for router in self.routers:
+            router.inbox.close()
+            for peer in router.peers.values():
+                peer.close()
+
+    def get_call_id(self, owner):
+        ring = self.routers[0].ring
+        return next("call-%s" % i for i in range(1000) if ring.get("call-%s" % i) == owner)
+
+    def test_router_owned(self):
+        message = create_message(self.get_call_id("worker-0"))
+        self.client.sendto(message, self.sockets[0].getsockname())
+        datagrams = self.routers[0].recv(self.receivers[0])
+        self.assertEqual([bytes(message) for (message, _) in datagrams], [message])
+        self.assertEqual(self.routers[0].forwarded, 0)
+
+    def test_router_forwarded(self):
+        message = create_message(self.get_call_id("worker-1"))
+        self.client.sendto(message, self.sockets[0].getsockname())  # received by the wrong shard.
+        self.assertEqual(self.routers[0].recv(self.receivers[0]), [])
+        self.assertEqual(self.routers[0].forwarded, 1)
+        ((forwarded, endpoint),) = self.routers[1].recv(self.receivers[1])
+        self.assertEqual(bytes(forwarded), message)
+        self.assertEqual(endpoint, self.client.getsockname())  # responses go to the sender.
+        self.assertEqual(self.routers[1].received, 1)
+
+    def test_router_without_call_id(self):
+        self.client.sendto(b"OPTIONS sip:a SIP/2.0\r\n\r\n", self.sockets[1].getsockname())
+        self.assertEqual(len(self.routers[1].recv(self.receivers[1])), 1)
+
+    def test_router_same_ring(self):
+        call_id = self.get_call_id("worker-1")
+        self.assertEqual({router.ring.get(call_id) for router in self.routers}, {"worker-1"})
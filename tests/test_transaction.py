@@ -0,0 +1,154 @@
+# MIT License
+#
+# Copyright (c) 2018 Herbert Shin
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# https://github.com/initbar/sipd
+
+import asyncio
+import unittest
+
+from sipd.lib.sip.options import SIP_OPTIONS_SAMPLE
+from sipd.sip.garbage import AsynchronousGarbageCollector
+from sipd.sip.message import SipMessage
+from sipd.sip.transaction import TIMER_H
+from sipd.sip.transaction import TIMER_I
+from sipd.sip.transaction import TIMER_J
+from sipd.sip.transaction import TransactionTable
+
+INVITE_SAMPLE = SIP_OPTIONS_SAMPLE.replace("OPTIONS", "INVITE")
+ACK_SAMPLE = SIP_OPTIONS_SAMPLE.replace("OPTIONS", "ACK")
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeRouter(object):
+
+    def flush_stop_signals(self):
+        pass
+
+
+def create_message(sample):
+    return SipMessage.from_buffer(sample.encode())
+
+
+class TestTransaction(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.table = TransactionTable(clock=self.clock)
+
+    #
+    # matching
+    #
+
+    def test_transaction_new_request(self):
+        self.assertIsNone(self.table.match(create_message(INVITE_SAMPLE)))
+        self.assertIsNotNone(self.table.create(create_message(INVITE_SAMPLE)))
+        self.assertEqual(len(self.table), 1)
+
+    def test_transaction_retransmission(self):
+        transaction = self.table.create(create_message(INVITE_SAMPLE))
+        self.table.update(transaction, b"SIP/2.0 100 Trying\r\n")
+        self.table.update(transaction, b"SIP/2.0 200 OK\r\n")
+        self.table.update(transaction, b"SIP/2.0 180 Ringing\r\n")
+        match = self.table.match(create_message(INVITE_SAMPLE))
+        self.assertIs(match, transaction)
+        self.assertEqual(match.response, b"SIP/2.0 200 OK\r\n")
+        self.assertEqual(self.table.retransmissions, 1)
+
+    def test_transaction_first_final_response(self):
+        transaction = self.table.create(create_message(SIP_OPTIONS_SAMPLE.replace("OPTIONS", "BYE")))
+        self.table.update(transaction, b"SIP/2.0 200 OK\r\n")
+        self.table.update(transaction, b"SIP/2.0 487 Request Terminated\r\n")
+        self.assertEqual(transaction.response, b"SIP/2.0 200 OK\r\n")
+
+    def test_transaction_different_method(self):
+        self.table.create(create_message(INVITE_SAMPLE))
+        self.assertIsNone(self.table.match(create_message(SIP_OPTIONS_SAMPLE)))
+
+    def test_transaction_ack_without_transaction(self):
+        self.assertIsNone(self.table.create(create_message(ACK_SAMPLE)))
+
+    #
+    # timers
+    #
+
+    def test_transaction_timer_h(self):
+        transaction = self.table.create(create_message(INVITE_SAMPLE))
+        self.table.update(transaction, b"SIP/2.0 200 OK\r\n")
+        self.clock.now = TIMER_H - 0.1
+        self.assertIsNotNone(self.table.match(create_message(INVITE_SAMPLE)))
+        self.clock.now = TIMER_H
+        self.assertIsNone(self.table.match(create_message(INVITE_SAMPLE)))
+        self.assertEqual(transaction.state, "terminated")
+
+    def test_transaction_timer_i(self):
+        transaction = self.table.create(create_message(INVITE_SAMPLE))
+        self.table.update(transaction, b"SIP/2.0 486 Busy Here\r\n")
+        self.clock.now = 1.0
+        self.table.match(create_message(ACK_SAMPLE))
+        self.assertEqual(transaction.state, "confirmed")
+        self.clock.now = 1.0 + TIMER_I
+        self.table.expire()
+        self.assertEqual(len(self.table), 0)
+
+    def test_transaction_timer_j(self):
+        transaction = self.table.create(create_message(SIP_OPTIONS_SAMPLE))
+        self.clock.now = 1.0
+        self.table.update(transaction, b"SIP/2.0 200 OK\r\n")
+        self.clock.now = TIMER_J
+        self.table.expire()
+        self.assertEqual(len(self.table), 1)
+        self.clock.now = 1.0 + TIMER_J
+        self.table.expire()
+        self.assertEqual(len(self.table), 0)
+
+    def test_transaction_idle_expiry(self):
+        loop = asyncio.new_event_loop()
+        try:
+            gc = AsynchronousGarbageCollector({"gc": {"call_lifetime": 60}}, loop=loop)
+            gc.rtp = FakeRouter()
+            gc.watch(self.table)
+            self.table.create(create_message(SIP_OPTIONS_SAMPLE))
+            self.clock.now = TIMER_J
+            gc.consume_tasks()  # no request is matched in the meantime.
+            self.assertEqual(len(self.table), 0)
+        finally:
+            loop.close()
+
+    def test_transaction_metrics_report(self):
+        loop = asyncio.new_event_loop()
+        try:
+            gc = AsynchronousGarbageCollector({"gc": {"call_lifetime": 60, "metrics_interval": 10}}, loop=loop)
+            gc.watch(self.table)
+            self.assertFalse(gc.report_metrics(now=gc.reported + 5))
+            with self.assertLogs(level="INFO") as logs:
+                self.assertTrue(gc.report_metrics(now=gc.reported + 10))
+            self.assertTrue(any("transactions: TimerMetrics" in line for line in logs.output))
+        finally:
+            loop.close()